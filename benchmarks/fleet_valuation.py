@@ -0,0 +1,83 @@
+"""
+Бенчмарк оценки всех портфелей.
+
+    python benchmarks/fleet_valuation.py [--portfolios 200000] [--wallets 3] [--currencies 8]
+
+Сравнивает построчный обход portfolios.json (как show_portfolio по каждому
+пользователю, но без файлового I/O) с WalletColumns.value_all в плотном и
+разреженном режимах. Время построения колонок выводится отдельно: в отчётах
+оно амортизируется на несколько баз и прогонов.
+"""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+import random
+import sys
+from time import perf_counter
+from typing import Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from valutatrade_hub.core.columnar import WalletColumns  # noqa: E402
+
+CODES = ("USD", "EUR", "BTC", "ETH", "RUB", "GBP", "SOL", "JPY", "CNY", "CHF")
+
+
+def _rows(portfolios: int, wallets: int, codes: tuple[str, ...]) -> list[dict[str, Any]]:
+    rnd = random.Random(42)
+    return [
+        {
+            "user_id": uid,
+            "wallets": {c: {"balance": rnd.uniform(0.1, 100.0)} for c in rnd.sample(codes, wallets)},
+        }
+        for uid in range(1, portfolios + 1)
+    ]
+
+
+def _per_user(rows: list[dict[str, Any]], pairs: dict[str, dict[str, Any]], base: str) -> float:
+    total = 0.0
+    for row in rows:
+        for code, payload in row["wallets"].items():
+            rate = 1.0 if code == base else float(pairs[f"{code}_{base}"]["rate"])
+            total += payload["balance"] * rate
+    return total
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--portfolios", type=int, default=200_000)
+    parser.add_argument("--wallets", type=int, default=3)
+    parser.add_argument("--currencies", type=int, default=8, choices=range(1, len(CODES) + 1))
+    args = parser.parse_args()
+
+    codes = CODES[: args.currencies]
+    rows = _rows(args.portfolios, min(args.wallets, len(codes)), codes)
+    rates = {c: 1.0 + i for i, c in enumerate(codes)}
+    rates["USD"] = 1.0
+    pairs = {f"{c}_USD": {"rate": r} for c, r in rates.items()}
+
+    started = perf_counter()
+    expected = _per_user(rows, pairs, "USD")
+    loop_ms = (perf_counter() - started) * 1000
+    print(f"Портфелей: {args.portfolios}, кошельков: {args.wallets}, валют: {args.currencies}")
+    print(f"{'построчно':<10} {'':>14} {loop_ms:>10.1f} мс")
+
+    for layout in ("dense", "sparse"):
+        started = perf_counter()
+        store = WalletColumns.from_rows(rows, layout)
+        build_ms = (perf_counter() - started) * 1000
+        started = perf_counter()
+        totals = store.value_all("USD", rates)
+        value_ms = (perf_counter() - started) * 1000
+        drift = abs(sum(totals) - expected) / max(abs(expected), 1e-9)
+        print(
+            f"{layout:<10} построение {build_ms:>7.1f} мс, value_all {value_ms:>7.1f} мс"
+            f" (заполненность {store.density:.2f}, расхождение {drift:.1e})"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+Бенчмарк восстановления состояния из журнала сделок.
+
+    python benchmarks/ledger_replay.py [--events 1000000] [--users 10000] [--tail 10000]
+
+Генерирует журнал во временном каталоге и измеряет:
+1. полный replay с начала журнала (событий/с);
+2. снимок на events - tail событий + replay хвоста из tail событий.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+import random
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from valutatrade_hub.core.ledger import TradeLedger  # noqa: E402
+
+CODES = ("BTC", "ETH", "EUR", "RUB", "GBP", "SOL")
+
+
+def _generate(path: Path, events: int, users: int) -> None:
+    rnd = random.Random(7)
+    balances: dict[tuple[int, str], float] = {}
+    dumps = json.JSONEncoder(separators=(",", ":")).encode
+    with path.open("w", encoding="utf-8") as f:
+        for _ in range(events):
+            key = (rnd.randrange(users), rnd.choice(CODES))
+            before = balances.get(key, 0.0)
+            amount = round(rnd.uniform(0.01, 5.0), 4)
+            sell = before > amount and rnd.random() < 0.4
+            after = before - amount if sell else before + amount
+            balances[key] = after
+            ev = {
+                "ts": "2026-01-01T00:00:00.000000+00:00",
+                "action": "SELL" if sell else "BUY",
+                "user_id": key[0],
+                "currency": key[1],
+                "amount": amount,
+                "base": "USD",
+                "rate": 1.0,
+                "before": before,
+                "after": after,
+            }
+            f.write(dumps(ev) + "\n")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--tail", type=int, default=10_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "ledger.jsonl"
+        started = perf_counter()
+        _generate(path, args.events, args.users)
+        size_mb = path.stat().st_size / 2**20
+        print(f"Журнал: {args.events} событий, {size_mb:.1f} МБ (генерация {perf_counter() - started:.1f} с)")
+
+        ledger = TradeLedger(path, Path(tmp) / "snapshot.json")
+        started = perf_counter()
+        full = ledger.replay(from_snapshot=False)
+        full_s = perf_counter() - started
+        print(
+            f"полный replay: {full_s:.2f} с, {full.replayed / full_s:,.0f} событий/с, "
+            f"нарушений цепочки: {len(full.mismatches)}"
+        )
+
+        # снимок на events - tail: обрезаем журнал, снимаем состояние, возвращаем хвост
+        with path.open("rb") as f:
+            lines = f.readlines()
+        head = max(len(lines) - args.tail, 0)
+        path.write_bytes(b"".join(lines[:head]))
+        ledger._write_snapshot(ledger.replay(from_snapshot=False))
+        with path.open("ab") as f:
+            f.writelines(lines[head:])
+        del lines
+
+        started = perf_counter()
+        state = ledger.replay()
+        tail_ms = (perf_counter() - started) * 1000
+        same = state.balances == full.balances
+        print(
+            f"снимок + хвост ({state.replayed} событий): {tail_ms:.1f} мс, "
+            f"совпадает с полным replay: {'да' if same else 'НЕТ'}"
+        )
+        return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
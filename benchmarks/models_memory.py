@@ -0,0 +1,109 @@
+"""
+Бенчмарк памяти доменных моделей.
+
+    python benchmarks/models_memory.py [--portfolios 100000] [--wallets 4]
+
+Для синтетических строк portfolios.json (tracemalloc, байт на портфель):
+1. сырые dict-строки после json.loads;
+2. Portfolio + User + Wallet на каждый кошелёк (полная гидратация);
+3. LazyPortfolio поверх строк (Wallet не создаются);
+4. LazyPortfolio после чтения одного кошелька;
+5. FrozenPortfolio (user_id и кортеж FrozenWallet) для отчётов.
+"""
+
+from __future__ import annotations
+
+import argparse
+from datetime import datetime
+import gc
+import json
+from pathlib import Path
+import sys
+import tracemalloc
+from typing import Any, Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from valutatrade_hub.core.models import (  # noqa: E402
+    LazyPortfolio,
+    Portfolio,
+    User,
+    Wallet,
+)
+
+CODES = ("USD", "EUR", "BTC", "ETH", "RUB", "GBP", "SOL", "JPY")
+
+
+def _rows_json(portfolios: int, wallets: int) -> str:
+    rows = [
+        {
+            "user_id": uid,
+            "wallets": {
+                code: {"currency_code": code, "balance": float(uid % 997 + i)}
+                for i, code in enumerate(CODES[:wallets])
+            },
+        }
+        for uid in range(1, portfolios + 1)
+    ]
+    return json.dumps(rows)
+
+
+def _measure(build: Callable[..., Any], *args: Any) -> tuple[int, Any]:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        obj = build(*args)
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return after - before, obj
+
+
+def _eager(rows: list[dict[str, Any]]) -> list[Portfolio]:
+    registered = datetime(2025, 1, 1)
+    out = []
+    for row in rows:
+        uid = row["user_id"]
+        user = User(uid, f"user{uid}", "0" * 64, "salt", registered)
+        wallets = {c: Wallet(c, w["balance"]) for c, w in row["wallets"].items()}
+        out.append(Portfolio(user, wallets))
+    return out
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--portfolios", type=int, default=100_000)
+    parser.add_argument("--wallets", type=int, default=4, choices=range(1, len(CODES) + 1))
+    args = parser.parse_args()
+
+    payload = _rows_json(args.portfolios, args.wallets)
+    raw_bytes, rows = _measure(lambda: json.loads(payload))
+
+    results: list[tuple[str, int]] = [("сырые строки (json.loads)", raw_bytes)]
+
+    size, eager = _measure(lambda: _eager(rows))
+    results.append(("Portfolio + User + Wallet", size))
+    del eager
+
+    size, lazy = _measure(lambda: [LazyPortfolio.from_row(r) for r in rows])
+    results.append(("LazyPortfolio (без гидратации)", size))
+
+    size, _ = _measure(lambda portfolios: [p.get_wallet("USD") for p in portfolios], lazy)
+    results.append(("  + чтение одного кошелька", size))
+    del lazy
+
+    size, frozen = _measure(lambda: [LazyPortfolio.from_row(r).freeze() for r in rows])
+    results.append(("FrozenPortfolio", size))
+    del frozen
+
+    print(f"Портфелей: {args.portfolios}, кошельков в портфеле: {args.wallets}")
+    print(f"{'вариант':<34} {'всего, МБ':>10} {'байт/портфель':>14}")
+    for label, total in results:
+        print(f"{label:<34} {total / 2**20:>10.1f} {total / args.portfolios:>14.0f}")
+    print("(строки кроме первой — сверх уже загруженных сырых строк)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
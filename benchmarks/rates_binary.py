@@ -0,0 +1,74 @@
+"""
+Бенчмарк загрузки снимка курсов: rates.json против rates.bin.
+
+    python benchmarks/rates_binary.py [--pairs 30,300,3000] [--runs 200]
+
+Для каждого размера снимка измеряет размер файлов и время полной загрузки:
+1. чтение и json.loads отформатированного rates.json (как пишет RatesStorage);
+2. rates_binary.load — одно чтение файла;
+3. rates_binary.load(use_mmap=True).
+"""
+
+from __future__ import annotations
+
+import argparse
+from datetime import datetime, timezone
+import json
+from pathlib import Path
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from valutatrade_hub.infra.rates_binary import bin_path_for, dump, load  # noqa: E402
+
+
+def _snapshot(pairs: int) -> dict:
+    ts = datetime.now(timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")
+    data = {
+        f"C{i:04d}_USD": {"rate": 1.0 + i / 7, "updated_at": ts, "source": "ExchangeRate-API"}
+        for i in range(pairs)
+    }
+    data["BTC_USD"] = {"rate": 60000.0, "updated_at": ts, "source": "CoinGecko"}
+    return {"pairs": data, "last_refresh": ts, "version": 1}
+
+
+def _time(fn, runs: int) -> float:
+    started = perf_counter()
+    for _ in range(runs):
+        fn()
+    return (perf_counter() - started) / runs * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pairs", default="30,300,3000")
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        rates_path = Path(tmp) / "rates.json"
+        bin_path = bin_path_for(rates_path)
+        for pairs in (int(p) for p in args.pairs.split(",")):
+            snapshot = _snapshot(pairs)
+            rates_path.write_text(json.dumps(snapshot, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+            dump(bin_path, snapshot, rates_path)
+
+            json_us = _time(lambda: json.loads(rates_path.read_text(encoding="utf-8")), args.runs)
+            read_us = _time(lambda: load(bin_path, rates_path), args.runs)
+            mmap_us = _time(lambda: load(bin_path, rates_path, use_mmap=True), args.runs)
+
+            same = load(bin_path, rates_path) == snapshot
+            print(
+                f"пар {pairs:>5}: rates.json {rates_path.stat().st_size / 1024:7.1f} КиБ {json_us:8.1f} мкс | "
+                f"rates.bin {bin_path.stat().st_size / 1024:6.1f} КиБ read {read_us:7.1f} мкс "
+                f"(x{json_us / read_us:.1f}), mmap {mmap_us:7.1f} мкс; совпадает: {'да' if same else 'НЕТ'}"
+            )
+            if not same:
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
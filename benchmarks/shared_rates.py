@@ -0,0 +1,70 @@
+"""
+Бенчмарк поиска курса: разбор rates.json против снимка в разделяемой памяти.
+
+    python benchmarks/shared_rates.py [--pairs 30,300,3000] [--lookups 20000]
+
+Для каждого размера снимка измеряет время одного поиска пары:
+1. чтение и разбор rates.json (как get_rate без снимка);
+2. SharedRates.lookup по mmap-файлу (бинарный поиск, без разбора).
+"""
+
+from __future__ import annotations
+
+import argparse
+from datetime import datetime, timezone
+import json
+from pathlib import Path
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from valutatrade_hub.infra.shared_rates import SharedRates, publish, shm_path_for  # noqa: E402
+
+
+def _snapshot(pairs: int) -> dict:
+    ts = datetime.now(timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")
+    data = {f"C{i:04d}_USD": {"rate": 1.0 + i, "updated_at": ts, "source": "Bench"} for i in range(pairs)}
+    data["BTC_USD"] = {"rate": 60000.0, "updated_at": ts, "source": "Bench"}
+    return {"pairs": data, "last_refresh": ts}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pairs", default="30,300,3000")
+    parser.add_argument("--lookups", type=int, default=20_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        rates_path = Path(tmp) / "rates.json"
+        for pairs in (int(p) for p in args.pairs.split(",")):
+            snapshot = _snapshot(pairs)
+            rates_path.write_text(json.dumps(snapshot, indent=2), encoding="utf-8")
+            publish(shm_path_for(rates_path), snapshot, rates_path)
+            reader = SharedRates(shm_path_for(rates_path), rates_path)
+
+            json_runs = max(args.lookups // max(pairs // 10, 1), 50)
+            started = perf_counter()
+            for _ in range(json_runs):
+                json.loads(rates_path.read_text(encoding="utf-8"))["pairs"]["BTC_USD"]
+            json_us = (perf_counter() - started) / json_runs * 1e6
+
+            started = perf_counter()
+            for _ in range(args.lookups):
+                reader.lookup("BTC_USD")
+            shm_us = (perf_counter() - started) / args.lookups * 1e6
+
+            ok, entry = reader.lookup("BTC_USD")
+            same = ok and entry is not None and entry["rate"] == snapshot["pairs"]["BTC_USD"]["rate"]
+            print(
+                f"пар {pairs:>5}: rates.json {json_us:9.1f} мкс, rates.shm {shm_us:6.1f} мкс "
+                f"(x{json_us / shm_us:.0f}), совпадает: {'да' if same else 'НЕТ'}"
+            )
+            if not same:
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Бенчмарк запуска CLI.
+
+    python benchmarks/startup.py [--runs 7] [--import-budget-ms 60] [--script-budget-ms 100]
+
+1. -X importtime для valutatrade_hub.cli.interface (медиана, мс);
+2. время `project --stdin` с короткими командами сверх пустого интерпретатора;
+3. тяжёлые модули (requests, prettytable, use cases) не должны грузиться при старте.
+
+Код выхода 1, если бюджет превышен.
+"""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+from statistics import median
+import subprocess
+import sys
+from time import perf_counter
+
+ROOT = Path(__file__).resolve().parents[1]
+TARGET = "valutatrade_hub.cli.interface"
+LAZY_MODULES = (
+    "requests",
+    "prettytable",
+    "logging.handlers",
+    "valutatrade_hub.core.usecases",
+    "valutatrade_hub.parser_service.api_clients",
+    "valutatrade_hub.profiling",
+)
+SCRIPT = "help\nshow-trace\n"
+
+
+def _import_time_ms() -> float:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {TARGET}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = [p.strip() for p in line.split("|")]
+        if len(parts) == 3 and parts[2] == TARGET:
+            return int(parts[1]) / 1000
+    raise RuntimeError(f"{TARGET} не найден в выводе -X importtime")
+
+
+def _wall_ms(args: list[str], stdin: str = "") -> float:
+    started = perf_counter()
+    subprocess.run(args, cwd=ROOT, input=stdin, capture_output=True, text=True, check=False)
+    return (perf_counter() - started) * 1000
+
+
+def _eager_modules() -> list[str]:
+    code = (
+        f"import sys, {TARGET}\n"
+        f"print('\\n'.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return proc.stdout.split()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--import-budget-ms", type=float, default=60.0)
+    parser.add_argument("--script-budget-ms", type=float, default=100.0)
+    args = parser.parse_args()
+
+    # прогрев: компиляция .pyc не должна попадать в замеры
+    _import_time_ms()
+
+    imports = median(_import_time_ms() for _ in range(args.runs))
+    bare = median(_wall_ms([sys.executable, "-c", "pass"]) for _ in range(args.runs))
+    script = median(
+        _wall_ms([sys.executable, "main.py", "--stdin"], SCRIPT) for _ in range(args.runs)
+    )
+    overhead = script - bare
+    eager = _eager_modules()
+
+    print(f"import {TARGET}: {imports:.1f} мс (бюджет {args.import_budget_ms:.0f})")
+    print(
+        f"project --stdin ({SCRIPT.count(chr(10))} команды): {script:.1f} мс, "
+        f"сверх интерпретатора {overhead:.1f} мс (бюджет {args.script_budget_ms:.0f})"
+    )
+    if eager:
+        print("Загружены при старте (должны быть ленивыми): " + ", ".join(eager))
+
+    ok = imports <= args.import_budget_ms and overhead <= args.script_budget_ms and not eager
+    print("OK" if ok else "БЮДЖЕТ ПРЕВЫШЕН")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
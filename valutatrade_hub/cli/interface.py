@@ -1,26 +1,32 @@
 from __future__ import annotations
 
+import argparse
+from datetime import datetime, timedelta
+import json
+from pathlib import Path
 import shlex
-from typing import Any
+import sys
+from time import perf_counter
+from typing import Any, Iterable
 
-from prettytable import PrettyTable
-
-from valutatrade_hub.core.usecases import (
+from valutatrade_hub.core.exceptions import (
+    ApiRequestError,
     AuthError,
-    buy,
-    get_rate,
-    login,
-    register,
-    sell,
-    show_portfolio,
+    CurrencyNotFoundError,
+    InsufficientFundsError,
+)
+from valutatrade_hub.infra.metrics import LAST_REFRESH, REGISTRY, serve_metrics
+from valutatrade_hub.infra.settings import SettingsLoader
+from valutatrade_hub.infra.tracing import (
+    disable_tracing,
+    enable_tracing,
+    render_waterfall,
+    tracing_enabled,
 )
-from valutatrade_hub.core.exceptions import ApiRequestError, CurrencyNotFoundError, InsufficientFundsError
+from valutatrade_hub.logging_config import install_lazy_logging
 
-from valutatrade_hub.logging_config import setup_logging
-from valutatrade_hub.parser_service.api_clients import CoinGeckoClient, ExchangeRateApiClient
-from valutatrade_hub.parser_service.config import ParserConfig
-from valutatrade_hub.parser_service.storage import RatesStorage
-from valutatrade_hub.parser_service.updater import RatesUpdater
+# Use cases, prettytable, requests (через parser_service) и профайлер
+# импортируются внутри команд: запуск CLI и короткие скрипты их не ждут.
 
 class CLIError(Exception):
     pass
@@ -54,6 +60,8 @@ def _require_login(current_user: dict[str, Any] | None) -> dict[str, Any]:
 
 
 def _cmd_register(argv: list[str]) -> str:
+    from valutatrade_hub.core.usecases import register
+
     kv = _parse_kv_args(argv)
     username = kv.get("username")
     password = kv.get("password")
@@ -65,6 +73,8 @@ def _cmd_register(argv: list[str]) -> str:
 
 
 def _cmd_login(argv: list[str]) -> dict[str, Any]:
+    from valutatrade_hub.core.usecases import login
+
     kv = _parse_kv_args(argv)
     username = kv.get("username")
     password = kv.get("password")
@@ -77,6 +87,8 @@ def _cmd_login(argv: list[str]) -> dict[str, Any]:
 
 
 def _cmd_get_rate(argv: list[str]) -> str:
+    from valutatrade_hub.core.usecases import get_rate
+
     kv = _parse_kv_args(argv)
     frm = kv.get("from")
     to = kv.get("to")
@@ -95,6 +107,10 @@ def _cmd_get_rate(argv: list[str]) -> str:
 
 
 def _cmd_show_portfolio(argv: list[str], current_user: dict[str, Any] | None) -> str:
+    from prettytable import PrettyTable
+
+    from valutatrade_hub.core.usecases import show_portfolio
+
     user = _require_login(current_user)
     kv = _parse_kv_args(argv) if argv else {}
     base = kv.get("base", "USD")
@@ -125,6 +141,8 @@ def _cmd_show_portfolio(argv: list[str], current_user: dict[str, Any] | None) ->
 
 
 def _cmd_buy(argv: list[str], current_user: dict[str, Any] | None) -> str:
+    from valutatrade_hub.core.usecases import buy
+
     user = _require_login(current_user)
     kv = _parse_kv_args(argv)
     currency = kv.get("currency")
@@ -157,6 +175,8 @@ def _cmd_buy(argv: list[str], current_user: dict[str, Any] | None) -> str:
 
 
 def _cmd_sell(argv: list[str], current_user: dict[str, Any] | None) -> str:
+    from valutatrade_hub.core.usecases import sell
+
     user = _require_login(current_user)
     kv = _parse_kv_args(argv)
     currency = kv.get("currency")
@@ -188,6 +208,350 @@ def _cmd_sell(argv: list[str], current_user: dict[str, Any] | None) -> str:
     return "\n".join(lines)
 
 
+def _parse_cli_datetime(value: str, end_of_day: bool = False) -> datetime:
+    """YYYY-MM-DD или ISO-время; без часового пояса — локальное время."""
+    try:
+        dt = datetime.fromisoformat(value.strip())
+    except ValueError as e:
+        raise CLIError(f"Некорректная дата: {value} (ожидается YYYY-MM-DD или ISO)") from e
+    if end_of_day and len(value.strip()) == 10:
+        dt += timedelta(days=1) - timedelta(microseconds=1)
+    return dt.astimezone() if dt.tzinfo is None else dt
+
+
+def _cmd_history(argv: list[str], current_user: dict[str, Any] | None) -> str:
+    from prettytable import PrettyTable
+
+    from valutatrade_hub.core.usecases import trade_history
+
+    user = _require_login(current_user)
+    kv = _parse_kv_args(argv) if argv else {}
+    try:
+        limit = int(kv.get("limit") or 50)
+        before = int(kv["before"]) if kv.get("before") else None
+    except ValueError as e:
+        raise CLIError("--limit и --before должны быть целыми числами") from e
+
+    data = trade_history(
+        user_id=user["user_id"],
+        limit=limit,
+        before=before,
+        currency=kv.get("currency"),
+        date_from=_parse_cli_datetime(kv["from"]) if kv.get("from") else None,
+        date_to=_parse_cli_datetime(kv["to"], end_of_day=True) if kv.get("to") else None,
+    )
+    if not data["items"]:
+        return "Сделок не найдено."
+
+    table = PrettyTable()
+    table.field_names = ["Время", "Операция", "Валюта", "Количество", "Курс", "Было", "Стало"]
+    for ev in data["items"]:
+        ts = datetime.fromisoformat(ev["ts"]).astimezone().strftime("%Y-%m-%d %H:%M:%S")
+        rate = "—" if ev.get("rate") is None else f"{ev['rate']:.4f} {ev['base']}"
+        table.add_row(
+            [
+                ts,
+                ev["action"],
+                ev["currency"],
+                f"{ev['amount']:.4f}",
+                rate,
+                f"{ev['before']:.4f}",
+                f"{ev['after']:.4f}",
+            ]
+        )
+    out = table.get_string()
+    if data["next_cursor"] is not None:
+        out += f"\nСледующая страница: history --before {data['next_cursor']}"
+    return out
+
+
+_STEP_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def _parse_step(value: str) -> int:
+    value = value.strip().lower()
+    unit = _STEP_UNITS.get(value[-1:]) if value else None
+    try:
+        count = int(value[:-1]) if unit else int(value)
+    except ValueError as e:
+        raise CLIError("--step: число с единицей s/m/h/d, например 15m или 1h") from e
+    seconds = count * (unit or 1)
+    if seconds <= 0:
+        raise CLIError("--step должен быть положительным")
+    return seconds
+
+
+def _cmd_portfolio_history(argv: list[str], current_user: dict[str, Any] | None) -> str:
+    from valutatrade_hub.core.usecases import portfolio_history
+
+    user = _require_login(current_user)
+    kv = _parse_kv_args(argv) if argv else {}
+    data = portfolio_history(
+        user_id=user["user_id"],
+        base=kv.get("base", "USD"),
+        date_from=_parse_cli_datetime(kv["from"]) if kv.get("from") else None,
+        date_to=_parse_cli_datetime(kv["to"], end_of_day=True) if kv.get("to") else None,
+        step_seconds=_parse_step(kv.get("step", "1h")),
+    )
+    base = data["base"]
+    points = data["points"]
+
+    if kv.get("csv"):
+        path = Path(kv["csv"])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w", encoding="utf-8") as f:
+            f.write(f"time,value_{base.lower()}\n")
+            for ts, value in points:
+                f.write(f"{ts.isoformat(timespec='seconds')},{'' if value is None else f'{value:.8f}'}\n")
+
+    def fmt(value: float | None) -> str:
+        return "—" if value is None else f"{value:,.2f} {base}"
+
+    lines = [f"Стоимость портфеля в {base}: {len(points)} точек"]
+    shown = points if len(points) <= 48 else points[:12] + [None] + points[-12:]
+    for point in shown:
+        if point is None:
+            lines.append(f"  … ещё {len(points) - 24} точек …")
+            continue
+        lines.append(f"  {point[0].strftime('%Y-%m-%d %H:%M')}  {fmt(point[1])}")
+    s = data["summary"]
+    lines.append(f"Мин: {fmt(s['min'])}  Макс: {fmt(s['max'])}  Последняя: {fmt(s['last'])}")
+    if kv.get("csv"):
+        lines.append(f"Полный ряд: {kv['csv']}")
+    return "\n".join(lines)
+
+
+_DIRECTION_LABELS = {"up": "поднимется до", "down": "опустится до", "any": "пересечёт"}
+
+
+def _cmd_alert_add(argv: list[str], current_user: dict[str, Any] | None) -> str:
+    from valutatrade_hub.core.usecases import add_alert
+
+    user = _require_login(current_user)
+    kv = _parse_kv_args(argv) if argv else {}
+    if not kv.get("pair") or not kv.get("threshold"):
+        raise CLIError("Использование: alert-add --pair BTC_USD --threshold <float> [--direction up|down|any]")
+    alert = add_alert(user["user_id"], kv["pair"], kv["threshold"], kv.get("direction", "any"))
+    return (
+        f"Оповещение #{alert['alert_id']} создано: {alert['pair']} "
+        f"{_DIRECTION_LABELS[alert['direction']]} {alert['threshold']:.8g}"
+    )
+
+
+def _cmd_alerts(argv: list[str], current_user: dict[str, Any] | None) -> str:
+    from prettytable import PrettyTable
+
+    from valutatrade_hub.core.usecases import list_alerts
+
+    user = _require_login(current_user)
+    alerts = list_alerts(user["user_id"])
+    if not alerts:
+        return "Активных оповещений нет."
+    table = PrettyTable()
+    table.field_names = ["ID", "Пара", "Условие", "Порог", "Создано"]
+    for a in alerts:
+        table.add_row([a["alert_id"], a["pair"], a["direction"], f"{a['threshold']:.8g}", a["created_at"]])
+    return table.get_string()
+
+
+def _cmd_alert_remove(argv: list[str], current_user: dict[str, Any] | None) -> str:
+    from valutatrade_hub.core.usecases import remove_alert
+
+    user = _require_login(current_user)
+    kv = _parse_kv_args(argv) if argv else {}
+    try:
+        alert_id = int(kv.get("id", ""))
+    except ValueError as e:
+        raise CLIError("Использование: alert-remove --id <int>") from e
+    remove_alert(user["user_id"], alert_id)
+    return f"Оповещение #{alert_id} удалено."
+
+
+def _cmd_alert_outbox(argv: list[str], current_user: dict[str, Any] | None) -> str:
+    from valutatrade_hub.core.usecases import triggered_alerts
+
+    user = _require_login(current_user)
+    kv = _parse_kv_args(argv) if argv else {}
+    try:
+        limit = int(kv.get("limit") or 20)
+    except ValueError as e:
+        raise CLIError("--limit должен быть целым числом") from e
+    items = triggered_alerts(user["user_id"], limit=limit)
+    if not items:
+        return "Сработавших оповещений нет."
+    return "\n".join(
+        f"#{r['alert_id']} {r['triggered_at']}: {r['pair']} {r['old_rate']:.8g} → {r['new_rate']:.8g} "
+        f"(порог {r['threshold']:.8g})"
+        for r in items
+    )
+
+
+def _cmd_order(argv: list[str], current_user: dict[str, Any] | None) -> str:
+    from valutatrade_hub.core.usecases import place_order
+
+    user = _require_login(current_user)
+    kv = _parse_kv_args(argv) if argv else {}
+    missing = [k for k in ("side", "type", "currency", "amount", "price") if not kv.get(k)]
+    if missing:
+        raise CLIError(
+            "Использование: order --side buy|sell --type limit|stop --currency <str> "
+            "--amount <float> --price <float> [--base <str>]"
+        )
+    try:
+        amount = float(kv["amount"])
+    except ValueError as e:
+        raise CLIError("'amount' должно быть положительным числом") from e
+    order = place_order(
+        user["user_id"], kv["side"], kv["type"], kv["currency"], amount, kv["price"], kv.get("base", "USD")
+    )
+    return (
+        f"Ордер #{order['order_id']} выставлен: {order['side']} {order['kind']} "
+        f"{order['amount']:.4f} {order['currency']} по {order['price']:.8g} {order['base']}"
+    )
+
+
+def _cmd_orders(argv: list[str], current_user: dict[str, Any] | None) -> str:
+    from prettytable import PrettyTable
+
+    from valutatrade_hub.core.usecases import list_orders
+
+    user = _require_login(current_user)
+    orders = list_orders(user["user_id"])
+    if not orders:
+        return "Активных ордеров нет."
+    table = PrettyTable()
+    table.field_names = ["ID", "Операция", "Тип", "Количество", "Цена", "Создан"]
+    for o in orders:
+        table.add_row(
+            [
+                o["order_id"],
+                o["side"],
+                o["kind"],
+                f"{o['amount']:.4f} {o['currency']}",
+                f"{o['price']:.8g} {o['base']}",
+                o["created_at"],
+            ]
+        )
+    return table.get_string()
+
+
+def _cmd_order_cancel(argv: list[str], current_user: dict[str, Any] | None) -> str:
+    from valutatrade_hub.core.usecases import cancel_order
+
+    user = _require_login(current_user)
+    kv = _parse_kv_args(argv) if argv else {}
+    try:
+        order_id = int(kv.get("id", ""))
+    except ValueError as e:
+        raise CLIError("Использование: order-cancel --id <int>") from e
+    cancel_order(user["user_id"], order_id)
+    return f"Ордер #{order_id} отменён."
+
+
+def _cmd_order_fills(argv: list[str], current_user: dict[str, Any] | None) -> str:
+    from valutatrade_hub.core.usecases import order_fills
+
+    user = _require_login(current_user)
+    kv = _parse_kv_args(argv) if argv else {}
+    try:
+        limit = int(kv.get("limit") or 20)
+    except ValueError as e:
+        raise CLIError("--limit должен быть целым числом") from e
+    items = order_fills(user["user_id"], limit=limit)
+    if not items:
+        return "Исполненных ордеров нет."
+    lines = []
+    for r in items:
+        head = (
+            f"#{r['order_id']} {r['executed_at']}: {r['side']} {r['kind']} "
+            f"{r['amount']:.4f} {r['currency']} по {r['rate']:.8g} {r['base']}"
+        )
+        if r["status"] == "filled":
+            lines.append(head)
+        elif r["status"] == "interrupted":
+            lines.append(f"{head} — прерван: {r['reason']}")
+        else:
+            lines.append(f"{head} — отклонён: {r['reason']}")
+    return "\n".join(lines)
+
+
+def _bulk_progress(report: Any) -> None:
+    # прогресс — в stderr, чтобы не смешивать с результатом команды (--output json)
+    print(
+        f"  пачка {report.batches}: строк {report.rows}, готово {report.imported}, "
+        f"пропущено {report.skipped} ({report.rows_per_second:.0f} строк/с)",
+        file=sys.stderr,
+        flush=True,
+    )
+
+
+def _bulk_args(argv: list[str], usage: str) -> tuple[Path, str | None, int | None, dict[str, str]]:
+    kv = _parse_kv_args(argv) if argv else {}
+    if not kv.get("file"):
+        raise CLIError(f"Использование: {usage}")
+    try:
+        batch = int(kv["batch"]) if kv.get("batch") else None
+    except ValueError as e:
+        raise CLIError("--batch должен быть целым числом") from e
+    if batch is not None and batch < 1:
+        raise CLIError("--batch должен быть положительным")
+    return Path(kv["file"]), kv.get("format"), batch, kv
+
+
+def _bulk_summary(title: str, report: Any) -> str:
+    lines = [
+        f"{title}: {report.imported}; строк {report.rows} за {report.elapsed:.2f} с "
+        f"({report.rows_per_second:.0f} строк/с), пачек: {report.batches}"
+    ]
+    if report.skipped:
+        lines.append(f"Пропущено строк: {report.skipped}")
+        lines.extend(f"  {e}" for e in report.errors)
+        if report.skipped > len(report.errors):
+            lines.append(f"  … и ещё {report.skipped - len(report.errors)}")
+    return "\n".join(lines)
+
+
+def _cmd_import_users(argv: list[str]) -> str:
+    from valutatrade_hub.core.bulk import import_users
+
+    path, fmt, batch, _ = _bulk_args(
+        argv, "import-users --file <path> [--format csv|jsonl] [--batch <int>]"
+    )
+    if not path.exists():
+        raise CLIError(f"Файл не найден: {path}")
+    report = import_users(path, fmt, batch_size=batch or 5000, progress=_bulk_progress)
+    return _bulk_summary("Импортировано пользователей", report)
+
+
+def _cmd_import_portfolios(argv: list[str]) -> str:
+    from valutatrade_hub.core.bulk import import_portfolios
+
+    path, fmt, batch, kv = _bulk_args(
+        argv,
+        "import-portfolios --file <path> [--format csv|jsonl] [--batch <int>] "
+        "[--match user_id|username]",
+    )
+    if not path.exists():
+        raise CLIError(f"Файл не найден: {path}")
+    report = import_portfolios(
+        path,
+        fmt,
+        batch_size=batch or 50000,
+        match=kv.get("match") or "user_id",
+        progress=_bulk_progress,
+    )
+    return _bulk_summary("Импортировано кошельков", report)
+
+
+def _cmd_export(argv: list[str], what: str) -> str:
+    from valutatrade_hub.core.bulk import export_portfolios, export_users
+
+    path, fmt, batch, _ = _bulk_args(argv, f"export-{what} --file <path> [--format csv|jsonl]")
+    export = export_users if what == "users" else export_portfolios
+    report = export(path, fmt, batch_size=batch or 10000, progress=_bulk_progress)
+    return _bulk_summary(f"Выгружено в {path}", report)
+
+
 def _help() -> str:
     return (
         "Доступные команды:\n"
@@ -199,10 +563,42 @@ def _help() -> str:
         "  get-rate --from <str> --to <str>\n"
         "  help\n"
         "  exit\n"
-        "  update-rates [--source coingecko|exchangerate]"
-        "  show-rates [--currency <str>] [--top <int>] [--base <str>]"
+        "  update-rates [--source coingecko|exchangerate]\n"
+        "  show-rates [--currency <str>] [--top <int>] [--base <str>]\n"
+        "  metrics [--dump <path>]\n"
+        "  serve-metrics [--port <int>] [--host <str>]\n"
+        "  profile [--mode cprofile|sampling] [--top <int>] [--out <dir>] <команда ...>\n"
+        "  trace --state on|off\n"
+        "  show-trace [--id <trace_id>]\n"
+        "  history [--limit <int>] [--before <cursor>] [--currency <str>] [--from <date>] [--to <date>]\n"
+        "  portfolio-history [--base <str>] [--from <date>] [--to <date>] [--step 1h] [--csv <path>]\n"
+        "  ledger-check [--snapshot] [--reindex]\n"
+        "  alert-add --pair <FROM_TO> --threshold <float> [--direction up|down|any]\n"
+        "  alerts\n"
+        "  alert-remove --id <int>\n"
+        "  alert-outbox [--limit <int>]\n"
+        "  order --side buy|sell --type limit|stop --currency <str> --amount <float> --price <float> [--base <str>]\n"
+        "  orders\n"
+        "  order-cancel --id <int>\n"
+        "  order-fills [--limit <int>]\n"
+        "  import-users --file <path> [--format csv|jsonl] [--batch <int>]\n"
+        "  import-portfolios --file <path> [--format csv|jsonl] [--batch <int>] [--match user_id|username]\n"
+        "  export-users --file <path> [--format csv|jsonl]\n"
+        "  export-portfolios --file <path> [--format csv|jsonl]"
     )
 def _cmd_update_rates(argv: list[str]) -> str:
+    from valutatrade_hub.core.alerts import get_alert_engine
+    from valutatrade_hub.core.orders import get_order_book
+    from valutatrade_hub.parser_service.api_clients import (
+        CoinGeckoClient,
+        ExchangeRateApiClient,
+    )
+    from valutatrade_hub.parser_service.config import ParserConfig
+    from valutatrade_hub.parser_service.ratelimit import bucket_for
+    from valutatrade_hub.parser_service.resilience import make_resilient
+    from valutatrade_hub.parser_service.storage import RatesStorage
+    from valutatrade_hub.parser_service.updater import RatesUpdater
+
     kv = _parse_kv_args(argv) if argv else {}
     source = (kv.get("source") or "").strip().lower()  # coingecko / exchangerate / empty
 
@@ -215,7 +611,20 @@ def _cmd_update_rates(argv: list[str]) -> str:
     if source in {"", "exchangerate"}:
         clients.append(ExchangeRateApiClient(cfg.EXCHANGERATE_API_KEY, base_currency=cfg.BASE_CURRENCY, timeout=cfg.REQUEST_TIMEOUT))
 
-    updater = RatesUpdater(storage=storage, clients=clients)
+    for client in clients:
+        client.set_rate_limiter(bucket_for(client.name, cfg))
+    clients = make_resilient(
+        clients,
+        cfg.breaker_state_path,
+        failure_threshold=cfg.BREAKER_FAILURES,
+        reset_timeout=cfg.BREAKER_RESET_SECONDS,
+        hedge=cfg.HEDGE_REQUESTS,
+    )
+    updater = RatesUpdater(
+        storage=storage,
+        clients=clients,
+        listeners=[get_order_book().on_rates, get_alert_engine().on_rates],
+    )
     result = updater.run_update()
 
     if result["errors"]:
@@ -228,6 +637,11 @@ def _cmd_update_rates(argv: list[str]) -> str:
     return f"Обновление успешно. Всего курсов обновлено: {result['updated']}. Последнее обновление: {result['last_refresh']}"
 
 def _cmd_show_rates(argv: list[str]) -> str:
+    from prettytable import PrettyTable
+
+    from valutatrade_hub.parser_service.config import ParserConfig
+    from valutatrade_hub.parser_service.storage import RatesStorage
+
     kv = _parse_kv_args(argv) if argv else {}
     currency = (kv.get("currency") or "").strip().upper()
     base = (kv.get("base") or "USD").strip().upper()
@@ -284,8 +698,268 @@ def _cmd_show_rates(argv: list[str]) -> str:
     return header + "\n" + str(table)
 
 
-def main() -> None:
-    setup_logging()
+def _seed_refresh_metric() -> None:
+    from datetime import datetime
+
+    from valutatrade_hub.parser_service.config import ParserConfig
+    from valutatrade_hub.parser_service.storage import RatesStorage
+
+    # возраст снимка должен быть виден даже до первого update-rates в этом процессе
+    if LAST_REFRESH.get() is not None:
+        return
+    cfg = ParserConfig()
+    snap = RatesStorage(cfg.rates_path, cfg.history_path).read_rates_snapshot()
+    last_refresh = snap.get("last_refresh")
+    if not isinstance(last_refresh, str):
+        return
+    try:
+        ts = datetime.fromisoformat(last_refresh.replace("Z", "+00:00"))
+    except ValueError:
+        return
+    LAST_REFRESH.set(ts.timestamp())
+
+
+def _cmd_metrics(argv: list[str]) -> str:
+    kv = _parse_kv_args(argv) if argv else {}
+    _seed_refresh_metric()
+    dump = kv.get("dump")
+    if dump is None:
+        return REGISTRY.render().rstrip("\n")
+    path = Path(dump) if dump else SettingsLoader().get("metrics_textfile")
+    REGISTRY.write_textfile(path)
+    return f"Метрики записаны в {path}"
+
+
+def _cmd_serve_metrics(argv: list[str]) -> str:
+    kv = _parse_kv_args(argv) if argv else {}
+    host = kv.get("host", "127.0.0.1")
+    port_raw = kv.get("port", str(SettingsLoader().get("metrics_port")))
+    try:
+        port = int(port_raw)
+    except ValueError as e:
+        raise CLIError("--port должен быть числом") from e
+
+    _seed_refresh_metric()
+    try:
+        serve_metrics(port, host=host)
+    except OSError as e:
+        raise CLIError(f"Не удалось открыть {host}:{port}: {e}") from e
+    return f"Метрики доступны на http://{host}:{port}/metrics"
+
+
+def _cmd_trace(argv: list[str]) -> str:
+    kv = _parse_kv_args(argv) if argv else {}
+    state = (kv.get("state") or "").strip().lower()
+    if state == "on":
+        enable_tracing()
+    elif state == "off":
+        disable_tracing()
+    elif state:
+        raise CLIError("--state должен быть on или off")
+    path = SettingsLoader().get("traces_file")
+    return f"Трассировка: {'включена' if tracing_enabled() else 'выключена'} ({path})"
+
+
+def _cmd_show_trace(argv: list[str]) -> str:
+    kv = _parse_kv_args(argv) if argv else {}
+    return render_waterfall(SettingsLoader().get("traces_file"), kv.get("id"))
+
+
+def _cmd_ledger_check(argv: list[str]) -> str:
+    from valutatrade_hub.core.ledger import get_ledger
+
+    ledger = get_ledger()
+    if "--reindex" in argv:
+        return f"Индекс истории перестроен: {ledger.rebuild_index()} событий"
+    if "--snapshot" in argv:
+        state = ledger.snapshot()
+        return f"Снимок журнала записан: {state.events} событий, смещение {state.offset} байт"
+
+    state = ledger.replay()
+    diffs = ledger.reconcile()
+    lines = [
+        f"Журнал сделок: {state.events} событий, после последнего снимка: {state.replayed}",
+        f"Нарушена цепочка before/after: {len(state.mismatches)}",
+    ]
+    if state.corrupt:
+        lines.append(f"Пропущено повреждённых строк журнала: {state.corrupt}")
+    if not diffs:
+        lines.append("Балансы совпадают с portfolios.json")
+        return "\n".join(lines)
+    lines.append(f"Расхождения с portfolios.json: {len(diffs)}")
+    for d in diffs[:20]:
+        lines.append(
+            f"  user_id={d['user_id']} {d['currency']}: журнал {d['ledger']:.8f}, "
+            f"portfolios.json {d['portfolio']:.8f}"
+        )
+    return "\n".join(lines)
+
+
+def _dispatch(
+    cmd: str, argv: list[str], current_user: dict[str, Any] | None
+) -> tuple[str, dict[str, Any] | None]:
+    """Выполняет одну команду; возвращает (вывод, current_user после команды)."""
+    if cmd == "help":
+        return _help(), current_user
+
+    if cmd == "register":
+        return _cmd_register(argv), current_user
+
+    if cmd == "login":
+        current_user = _cmd_login(argv)
+        return f"Вы вошли как '{current_user['username']}'", current_user
+
+    if cmd == "show-portfolio":
+        return _cmd_show_portfolio(argv, current_user), current_user
+
+    if cmd == "buy":
+        return _cmd_buy(argv, current_user), current_user
+
+    if cmd == "sell":
+        return _cmd_sell(argv, current_user), current_user
+
+    if cmd == "get-rate":
+        return _cmd_get_rate(argv), current_user
+
+    if cmd == "update-rates":
+        return _cmd_update_rates(argv), current_user
+
+    if cmd == "show-rates":
+        return _cmd_show_rates(argv), current_user
+
+    if cmd == "metrics":
+        return _cmd_metrics(argv), current_user
+
+    if cmd == "serve-metrics":
+        return _cmd_serve_metrics(argv), current_user
+
+    if cmd == "profile":
+        return _cmd_profile(argv, current_user)
+
+    if cmd == "trace":
+        return _cmd_trace(argv), current_user
+
+    if cmd == "show-trace":
+        return _cmd_show_trace(argv), current_user
+
+    if cmd == "history":
+        return _cmd_history(argv, current_user), current_user
+
+    if cmd == "portfolio-history":
+        return _cmd_portfolio_history(argv, current_user), current_user
+
+    if cmd == "alert-add":
+        return _cmd_alert_add(argv, current_user), current_user
+
+    if cmd == "alerts":
+        return _cmd_alerts(argv, current_user), current_user
+
+    if cmd == "alert-remove":
+        return _cmd_alert_remove(argv, current_user), current_user
+
+    if cmd == "alert-outbox":
+        return _cmd_alert_outbox(argv, current_user), current_user
+
+    if cmd == "order":
+        return _cmd_order(argv, current_user), current_user
+
+    if cmd == "orders":
+        return _cmd_orders(argv, current_user), current_user
+
+    if cmd == "order-cancel":
+        return _cmd_order_cancel(argv, current_user), current_user
+
+    if cmd == "order-fills":
+        return _cmd_order_fills(argv, current_user), current_user
+
+    if cmd == "ledger-check":
+        return _cmd_ledger_check(argv), current_user
+
+    if cmd == "import-users":
+        return _cmd_import_users(argv), current_user
+
+    if cmd == "import-portfolios":
+        return _cmd_import_portfolios(argv), current_user
+
+    if cmd == "export-users":
+        return _cmd_export(argv, "users"), current_user
+
+    if cmd == "export-portfolios":
+        return _cmd_export(argv, "portfolios"), current_user
+
+    raise CLIError(f"Неизвестная команда: {cmd}. Введите 'help'.")
+
+
+# Ошибки, которые показываются пользователю без завершения сессии
+_USER_ERRORS = (
+    InsufficientFundsError,
+    CurrencyNotFoundError,
+    ApiRequestError,
+    AuthError,
+    CLIError,
+    ValueError,
+)
+
+
+def _known_codes(limit: int = 12) -> str:
+    from valutatrade_hub.core.currencies import get_registry
+
+    codes = get_registry().codes
+    shown = ", ".join(codes[:limit])
+    return shown if len(codes) <= limit else f"{shown} … (всего {len(codes)})"
+
+
+def _format_error(e: Exception) -> str:
+    if isinstance(e, InsufficientFundsError):
+        # печатаем как есть (по заданию)
+        return str(e)
+    if isinstance(e, CurrencyNotFoundError):
+        # подсказка help get-rate или список кодов (по заданию)
+        return (
+            f"{e}\n"
+            "Подсказка: используйте get-rate или проверьте код валюты.\n"
+            f"Поддерживаемые коды: {_known_codes()}"
+        )
+    if isinstance(e, ApiRequestError):
+        return f"{e}\nПодсказка: повторите позже или проверьте сеть/доступ к источнику курсов."
+    # ValueError используем для пользовательских ошибок типа "нет кошелька"
+    return str(e)
+
+
+def _cmd_profile(
+    argv: list[str], current_user: dict[str, Any] | None
+) -> tuple[str, dict[str, Any] | None]:
+    from valutatrade_hub.profiling import profile_call
+
+    # profile [--mode cprofile|sampling] [--top N] [--out <dir>] <команда ...>
+    opts: list[str] = []
+    while argv and argv[0].startswith("--") and len(argv) >= 2:
+        opts.extend(argv[:2])
+        argv = argv[2:]
+    if not argv:
+        raise CLIError("Укажите команду: profile [--mode cprofile|sampling] [--top N] <команда ...>")
+    kv = _parse_kv_args(opts)
+    try:
+        top = int(kv.get("top", "15"))
+    except ValueError as e:
+        raise CLIError("--top должен быть числом") from e
+    out_dir = Path(kv["out"]) if "out" in kv else SettingsLoader().get("profiles_dir")
+
+    cmd, rest = argv[0], argv[1:]
+    holder: dict[str, Any] = {}
+
+    def run() -> None:
+        try:
+            holder["result"] = _dispatch(cmd, rest, current_user)
+        except _USER_ERRORS as e:
+            holder["result"] = (_format_error(e), current_user)
+
+    report = profile_call(run, mode=kv.get("mode", "cprofile"), out_dir=out_dir, name=cmd, top=top)
+    output, current_user = holder["result"]
+    return f"{output}\n\n{report}", current_user
+
+
+def _run_session(profile_mode: str | None = None) -> None:
     print("ValutaTrade Hub. Type 'help' for commands.")
     current_user: dict[str, Any] | None = None
 
@@ -302,66 +976,133 @@ def main() -> None:
                 print("Выход.")
                 return
 
-            if cmd == "help":
-                print(_help())
-                continue
+            if profile_mode and cmd != "profile":
+                cmd, argv = "profile", ["--mode", profile_mode, cmd, *argv]
 
-            if cmd == "register":
-                print(_cmd_register(argv))
-                continue
+            output, current_user = _dispatch(cmd, argv, current_user)
+            print(output)
 
-            if cmd == "login":
-                current_user = _cmd_login(argv)
-                print(f"Вы вошли как '{current_user['username']}'")
-                continue
+        except _USER_ERRORS as e:
+            print(_format_error(e))
 
-            if cmd == "show-portfolio":
-                print(_cmd_show_portfolio(argv, current_user))
-                continue
-
-            if cmd == "buy":
-                print(_cmd_buy(argv, current_user))
-                continue
-
-            if cmd == "sell":
-                print(_cmd_sell(argv, current_user))
-                continue
-
-            if cmd == "get-rate":
-                print(_cmd_get_rate(argv))
-                continue
-
-            if cmd == "update-rates":
-                print(_cmd_update_rates(argv))
-                continue
-
-            if cmd == "show-rates":
-                print(_cmd_show_rates(argv))
-                continue
+        except KeyboardInterrupt:
+            print("\nВыход.")
 
-            print(f"Неизвестная команда: {cmd}. Введите 'help'.")
+        except Exception as e:
+            print(f"Внутренняя ошибка: {type(e).__name__}: {e}")
+            return
 
-        except InsufficientFundsError as e:
-            # печатаем как есть (по заданию)
-            print(str(e))
 
-        except CurrencyNotFoundError as e:
-            # подсказка help get-rate или список кодов (по заданию)
-            print(str(e))
-            print("Подсказка: используйте get-rate или проверьте код валюты.")
-            print("Поддерживаемые коды: USD, EUR, RUB, BTC, ETH")
+def _mask_argv(argv: list[str]) -> list[str]:
+    # пароль не должен попадать в машиночитаемый вывод
+    out = list(argv)
+    for i, token in enumerate(out[:-1]):
+        if token == "--password":
+            out[i + 1] = "****"
+    return out
 
-        except ApiRequestError as e:
-            print(str(e))
-            print("Подсказка: повторите позже или проверьте сеть/доступ к источнику курсов.")
 
-        except (AuthError, CLIError, ValueError) as e:
-            # ValueError используем для пользовательских ошибок типа "нет кошелька"
-            print(str(e))
+def _run_script(
+    lines: Iterable[str],
+    on_error: str = "stop",
+    output: str = "jsonl",
+    profile_mode: str | None = None,
+) -> int:
+    """
+    Неинтерактивный режим: команды построчно из файла/stdin в одном процессе.
+    Пустые строки и '#'-комментарии пропускаются. Возвращает код выхода
+    (0 — все команды успешны, 1 — были ошибки).
+    """
+    current_user: dict[str, Any] | None = None
+    failed = 0
 
-        except KeyboardInterrupt:
-            print("\nВыход.")
+    for lineno, raw in enumerate(lines, start=1):
+        raw = raw.strip()
+        if not raw or raw.startswith("#"):
+            continue
 
+        record: dict[str, Any] = {"line": lineno}
+        started = perf_counter()
+        try:
+            parts = shlex.split(raw)
+            cmd, argv = parts[0], parts[1:]
+            record["command"] = shlex.join([cmd, *_mask_argv(argv)])
+            if cmd in {"exit", "quit"}:
+                break
+            if profile_mode and cmd != "profile":
+                cmd, argv = "profile", ["--mode", profile_mode, cmd, *argv]
+            text, current_user = _dispatch(cmd, argv, current_user)
+            record["ok"] = True
+            record["output"] = text
+        except _USER_ERRORS as e:
+            record["ok"] = False
+            record["error"] = {"type": type(e).__name__, "message": _format_error(e)}
         except Exception as e:
-            print(f"Внутренняя ошибка: {type(e).__name__}: {e}")
-            return
+            record["ok"] = False
+            record["error"] = {"type": type(e).__name__, "message": f"Внутренняя ошибка: {e}"}
+        record["elapsed_ms"] = round((perf_counter() - started) * 1000, 3)
+
+        if output == "jsonl":
+            print(json.dumps(record, ensure_ascii=False))
+        elif record["ok"]:
+            print(record["output"])
+        else:
+            msg = record.get("error", {}).get("message") or record.get("output", "")
+            print(f"[строка {lineno}] {msg}", file=sys.stderr)
+
+        if not record["ok"]:
+            failed += 1
+            if on_error == "stop":
+                break
+
+    sys.stdout.flush()
+    return 1 if failed else 0
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="project", description="ValutaTrade Hub")
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="cprofile",
+        choices=("cprofile", "sampling"),
+        help="профилировать каждую команду сессии (.pstats + .collapsed в logs/profiles)",
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="писать трассы операций в logs/traces.jsonl (см. show-trace)",
+    )
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--script", type=Path, help="выполнить команды из файла (по строке)")
+    source.add_argument("--stdin", action="store_true", help="выполнить команды из stdin")
+    parser.add_argument(
+        "--on-error",
+        choices=("stop", "continue"),
+        default="stop",
+        help="пакетный режим: остановиться на первой ошибке или продолжить",
+    )
+    parser.add_argument(
+        "--output",
+        choices=("jsonl", "text"),
+        default="jsonl",
+        help="пакетный режим: JSON-строка на команду или обычный текст",
+    )
+    args = parser.parse_args(argv)
+
+    install_lazy_logging()
+    if args.trace:
+        enable_tracing()
+
+    if args.script is not None or args.stdin:
+        if args.script is not None:
+            try:
+                with args.script.open(encoding="utf-8") as f:
+                    code = _run_script(f, args.on_error, args.output, args.profile)
+            except OSError as e:
+                parser.error(f"не удалось прочитать {args.script}: {e}")
+        else:
+            code = _run_script(sys.stdin, args.on_error, args.output, args.profile)
+        sys.exit(code)
+
+    _run_session(profile_mode=args.profile)
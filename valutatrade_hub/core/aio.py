@@ -0,0 +1,137 @@
+"""
+Асинхронные варианты use cases для встраивания в asyncio-сервисы.
+
+Файловый I/O и HTTP выполняются в ограниченном пуле потоков, поэтому event
+loop не блокируется, а число одновременно занятых потоков не превышает
+max_workers. Ожидающие запросы стоят в очереди семафора внутри loop (дёшево),
+а не в очереди пула. Изменения портфеля одного пользователя сериализуются.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+from datetime import datetime, timezone
+import functools
+from typing import TYPE_CHECKING, Any, Callable, TypeVar
+import weakref
+
+from valutatrade_hub.core import usecases
+from valutatrade_hub.core.models import User
+from valutatrade_hub.infra.settings import SettingsLoader
+from valutatrade_hub.infra.tracing import span
+
+if TYPE_CHECKING:
+    from valutatrade_hub.parser_service.updater import RatesUpdater
+
+T = TypeVar("T")
+
+
+class AsyncHub:
+    def __init__(self, max_workers: int | None = None) -> None:
+        if max_workers is None:
+            max_workers = int(SettingsLoader().get("aio_max_workers", 8))
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="aio")
+        self._slots = asyncio.Semaphore(max_workers)
+        self._user_locks: dict[int, asyncio.Lock] = {}
+
+    async def run(self, func: Callable[..., T], /, *args: Any, **kwargs: Any) -> T:
+        # contextvars (в т.ч. текущий span трассировки) переносятся в поток пула
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, func, *args, **kwargs)
+        async with self._slots:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    def user_lock(self, user_id: int) -> asyncio.Lock:
+        lock = self._user_locks.get(user_id)
+        if lock is None:
+            lock = self._user_locks[user_id] = asyncio.Lock()
+        return lock
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    async def register(self, username: str, password: str) -> str:
+        return await self.run(usecases.register, username=username, password=password)
+
+    async def login(self, username: str, password: str) -> User:
+        return await self.run(usecases.login, username=username, password=password)
+
+    async def buy(
+        self, user_id: int, currency_code: str, amount: float, base: str = "USD"
+    ) -> dict[str, Any]:
+        async with self.user_lock(int(user_id)):
+            return await self.run(
+                usecases.buy, user_id=user_id, currency_code=currency_code, amount=amount, base=base
+            )
+
+    async def sell(
+        self, user_id: int, currency_code: str, amount: float, base: str = "USD"
+    ) -> dict[str, Any]:
+        async with self.user_lock(int(user_id)):
+            return await self.run(
+                usecases.sell, user_id=user_id, currency_code=currency_code, amount=amount, base=base
+            )
+
+    async def show_portfolio(self, user_id: int, base: str = "USD") -> dict[str, Any]:
+        return await self.run(usecases.show_portfolio, user_id=user_id, base=base)
+
+    async def get_rate(self, from_code: str, to_code: str) -> dict[str, Any]:
+        return await self.run(usecases.get_rate, from_code, to_code)
+
+
+class AsyncRatesUpdater:
+    """Источники опрашиваются параллельно, запись снимка — одна, после всех."""
+
+    def __init__(self, updater: "RatesUpdater", hub: AsyncHub | None = None) -> None:
+        self._updater = updater
+        self._hub = hub
+
+    async def run_update(self) -> dict[str, Any]:
+        hub = self._hub or _default_hub()
+        with span("update_rates", clients=len(self._updater.clients), mode="async"):
+            started = datetime.now(timezone.utc)
+            fetched = await asyncio.gather(
+                *(hub.run(self._updater.fetch_one, c) for c in self._updater.clients)
+            )
+            return await hub.run(self._updater.commit, list(fetched), started)
+
+
+# asyncio.Lock/Semaphore привязываются к loop при первом использовании,
+# поэтому хаб по умолчанию свой для каждого event loop
+_hubs: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncHub]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _default_hub() -> AsyncHub:
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = AsyncHub()
+    return hub
+
+
+async def register(username: str, password: str) -> str:
+    return await _default_hub().register(username, password)
+
+
+async def login(username: str, password: str) -> User:
+    return await _default_hub().login(username, password)
+
+
+async def buy(user_id: int, currency_code: str, amount: float, base: str = "USD") -> dict[str, Any]:
+    return await _default_hub().buy(user_id, currency_code, amount, base)
+
+
+async def sell(user_id: int, currency_code: str, amount: float, base: str = "USD") -> dict[str, Any]:
+    return await _default_hub().sell(user_id, currency_code, amount, base)
+
+
+async def show_portfolio(user_id: int, base: str = "USD") -> dict[str, Any]:
+    return await _default_hub().show_portfolio(user_id, base)
+
+
+async def get_rate(from_code: str, to_code: str) -> dict[str, Any]:
+    return await _default_hub().get_rate(from_code, to_code)
@@ -0,0 +1,401 @@
+"""
+Ценовые оповещения: «сообщить, когда BTC_USD пересечёт X».
+
+Для каждой пары и направления пороги хранятся отсортированным массивом.
+При обновлении курса old→new срабатывают только пороги между old и new:
+два bisect и вырезание среза, без перебора всех подписок. Сработавшие
+оповещения дописываются в outbox (alerts_outbox.jsonl) и удаляются из
+списка (одноразовые).
+
+Пары, которых нет в снимке курсов (обратные USD_BTC, кросс EUR_RUB),
+считаются как в ордерах — через SnapshotRateProvider: новый курс по
+текущему снимку, старый — по тому же снимку с прежними значениями
+изменившихся пар.
+
+Хранение: alerts.json — сжатый снимок {"last_id", "alerts"}, изменения
+после него — журнал alerts_journal.jsonl (add/remove/fired по строке на
+операцию). Запись — дописывание в журнал под flock; когда журнал
+становится длиннее снимка, он сворачивается в новый alerts.json.
+Другие процессы дочитывают только новый хвост журнала.
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+import json
+import logging
+import math
+import os
+from pathlib import Path
+import threading
+from typing import Any, Iterable, Iterator
+
+from valutatrade_hub.core.exceptions import ApiRequestError
+from valutatrade_hub.core.rates import SnapshotRateProvider
+from valutatrade_hub.core.utils import load_json, now_iso
+from valutatrade_hub.infra.database import DatabaseManager
+from valutatrade_hub.infra.settings import SettingsLoader
+from valutatrade_hub.infra.tracing import span
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore[assignment]
+
+logger = logging.getLogger("valutatrade")
+
+DIRECTIONS = ("up", "down", "any")
+
+_COMPACT_MIN = 10_000  # записей журнала, раньше которых снимок не переписываем
+_MERGE_BY_INSERT = 16  # до стольких новых порогов вставляем по одному, больше — слиянием
+
+
+@dataclass(frozen=True, slots=True)
+class Alert:
+    alert_id: int
+    user_id: int
+    pair: str
+    threshold: float
+    direction: str  # up: снизу вверх, down: сверху вниз, any: в любую сторону
+    created_at: str
+
+
+class _Thresholds:
+    """Пороги по возрастанию; ids[i] — оповещение для thresholds[i]."""
+
+    __slots__ = ("thresholds", "ids", "pending")
+
+    def __init__(self, items: Iterable[tuple[float, int]] = ()) -> None:
+        ordered = sorted(items)
+        self.thresholds: list[float] = [t for t, _ in ordered]
+        self.ids: list[int] = [i for _, i in ordered]
+        # новые пороги вливаются перед проверкой: вставка по одному — O(N) на каждую
+        self.pending: list[tuple[float, int]] = []
+
+    def add(self, threshold: float, alert_id: int) -> None:
+        self.pending.append((threshold, alert_id))
+
+    def _settle(self) -> None:
+        if not self.pending:
+            return
+        if len(self.pending) <= _MERGE_BY_INSERT:
+            for threshold, alert_id in self.pending:
+                i = bisect_right(self.thresholds, threshold)
+                self.thresholds.insert(i, threshold)
+                self.ids.insert(i, alert_id)
+        else:
+            merged = _Thresholds([*zip(self.thresholds, self.ids), *self.pending])
+            self.thresholds, self.ids = merged.thresholds, merged.ids
+        self.pending = []
+
+    def take(self, low: float, high: float, right: bool) -> list[int]:
+        """Вырезать и вернуть id с порогом в (low, high] (right) или [low, high)."""
+        self._settle()
+        find = bisect_right if right else bisect_left
+        lo, hi = find(self.thresholds, low), find(self.thresholds, high)
+        if lo >= hi:
+            return []
+        ids = self.ids[lo:hi]
+        del self.thresholds[lo:hi]
+        del self.ids[lo:hi]
+        return ids
+
+
+class _PairIndex:
+    """Пороги одной пары, отдельно по направлению оповещения."""
+
+    __slots__ = ("by_direction",)
+
+    def __init__(self, alerts: Iterable[Alert] = ()) -> None:
+        items: dict[str, list[tuple[float, int]]] = {d: [] for d in DIRECTIONS}
+        for a in alerts:
+            items[a.direction].append((a.threshold, a.alert_id))
+        self.by_direction = {d: _Thresholds(items[d]) for d in DIRECTIONS}
+
+    def add(self, alert: Alert) -> None:
+        self.by_direction[alert.direction].add(alert.threshold, alert.alert_id)
+
+    def crossed(self, old: float, new: float) -> tuple[list[int], str]:
+        """
+        Вырезать оповещения, сработавшие при движении old→new: их id и
+        направление движения. Все пороги в срезе срабатывают, поэтому
+        удаляются одним del на направление.
+        """
+        if new > old:
+            # old < X <= new
+            return self._take(("up", "any"), old, new, True), "up"
+        if new < old:
+            # new <= X < old
+            return self._take(("down", "any"), new, old, False), "down"
+        return [], ""
+
+    def _take(self, directions: tuple[str, ...], low: float, high: float, right: bool) -> list[int]:
+        ids: list[int] = []
+        for d in directions:
+            ids += self.by_direction[d].take(low, high, right)
+        return ids
+
+
+class AlertEngine:
+    def __init__(self, path: Path, outbox_path: Path, journal_path: Path | None = None) -> None:
+        self.path = path
+        self.outbox_path = outbox_path
+        self.journal_path = journal_path or path.with_name(path.stem + "_journal.jsonl")
+        self._lock = threading.Lock()
+        self._stat: tuple[int, int, int] | None = None  # alerts.json, из которого загружено состояние
+        self._journal_pos = 0  # сколько байт журнала уже применено
+        self._journal_ops = 0  # записей в журнале после снимка
+        self._alerts: dict[int, Alert] = {}
+        self._last_id = 0  # id не переиспользуются: по ним ссылаются записи outbox
+        self._index: dict[str, _PairIndex] = {}
+        self._stale = 0  # удалённые оповещения, чьи пороги ещё лежат в индексе
+
+    # --- хранение ---
+    def _file_key(self) -> tuple[int, int, int] | None:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    @contextmanager
+    def _locked(self, exclusive: bool = False) -> Iterator[None]:
+        # подписки меняют и другие процессы (CLI), а движок живёт в планировщике
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        lock_path = self.path.with_name(self.path.name + ".lock")
+        with self._lock, open(lock_path, "a+b") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                self._refresh()
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _refresh(self) -> None:
+        key = self._file_key()
+        if key != self._stat or self._journal_size() < self._journal_pos:
+            self._load_snapshot(key)
+        self._read_journal()
+
+    def _journal_size(self) -> int:
+        try:
+            return os.stat(self.journal_path).st_size
+        except OSError:
+            return 0
+
+    def _load_snapshot(self, key: tuple[int, int, int] | None) -> None:
+        data = load_json(self.path, default={})
+        # до появления last_id файл был просто списком оповещений
+        rows = data.get("alerts") if isinstance(data, dict) else data
+        alerts: dict[int, Alert] = {}
+        for row in rows if isinstance(rows, list) else []:
+            try:
+                alert = Alert(**row)
+            except TypeError:
+                continue
+            if math.isfinite(alert.threshold):  # nan нарушил бы порядок порогов
+                alerts[alert.alert_id] = alert
+        self._alerts = alerts
+        self._last_id = max(int(data.get("last_id", 0)) if isinstance(data, dict) else 0, *alerts, 0)
+        self._rebuild_index()
+        self._stat, self._journal_pos, self._journal_ops = key, 0, 0
+
+    def _rebuild_index(self) -> None:
+        # массовая загрузка: одна сортировка на пару вместо вставки по одному
+        by_pair: dict[str, list[Alert]] = {}
+        for a in self._alerts.values():
+            by_pair.setdefault(a.pair, []).append(a)
+        self._index = {pair: _PairIndex(items) for pair, items in by_pair.items()}
+        self._stale = 0
+
+    def _read_journal(self) -> None:
+        try:
+            with open(self.journal_path, "rb") as f:
+                f.seek(self._journal_pos)
+                tail = f.read()
+        except OSError:
+            return
+        end = tail.rfind(b"\n") + 1  # недописанную строку дочитаем в следующий раз
+        for line in tail[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                self._apply(json.loads(line))
+            except (ValueError, TypeError, KeyError):
+                logger.warning("ALERTS пропущена повреждённая запись журнала: %r", line[:200])
+            self._journal_ops += 1
+        self._journal_pos += end
+
+    def _apply(self, op: dict[str, Any]) -> None:
+        kind = op["op"]
+        if kind == "add":
+            alert = Alert(**op["alert"])
+            self._last_id = max(self._last_id, alert.alert_id)
+            if not math.isfinite(alert.threshold):
+                return
+            self._alerts[alert.alert_id] = alert
+            self._index.setdefault(alert.pair, _PairIndex()).add(alert)
+        elif kind in ("remove", "fired"):
+            for alert_id in op["ids"]:
+                if self._alerts.pop(int(alert_id), None) is not None:
+                    self._stale += 1
+            if self._stale > max(len(self._alerts), _MERGE_BY_INSERT):
+                self._rebuild_index()
+
+    def _append(self, ops: list[dict[str, Any]]) -> None:
+        """Дописать операции (уже применённые в памяти) в журнал; вызывать под _locked(True)."""
+        data = "".join(json.dumps(op, ensure_ascii=False) + "\n" for op in ops).encode("utf-8")
+        with open(self.journal_path, "ab") as f:
+            if f.tell() > self._journal_pos:
+                f.truncate(self._journal_pos)  # хвост оборванной записи (сбой посреди write)
+            f.write(data)
+        self._journal_pos += len(data)
+        self._journal_ops += len(ops)
+        if self._journal_ops >= max(_COMPACT_MIN, len(self._alerts)):
+            self._compact()
+
+    def _compact(self) -> None:
+        # сначала новый снимок, потом пустой журнал: если упасть между ними,
+        # журнал применится к снимку повторно, а его операции идемпотентны
+        rows = [asdict(a) for a in sorted(self._alerts.values(), key=lambda a: a.alert_id)]
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(
+            json.dumps({"last_id": self._last_id, "alerts": rows}, ensure_ascii=False, indent=2) + "\n",
+            encoding="utf-8",
+        )
+        os.replace(tmp, self.path)
+        with open(self.journal_path, "wb"):
+            pass
+        self._stat, self._journal_pos, self._journal_ops = self._file_key(), 0, 0
+
+    # --- управление подписками ---
+    def add(self, user_id: int, pair: str, threshold: float, direction: str = "any") -> Alert:
+        if direction not in DIRECTIONS:
+            raise ValueError(f"direction должен быть одним из: {', '.join(DIRECTIONS)}")
+        # nan/inf нарушили бы порядок порогов, и bisect находил бы не те оповещения
+        if not math.isfinite(threshold) or threshold <= 0:
+            raise ValueError("Порог должен быть положительным числом")
+        with self._locked(exclusive=True):
+            alert = Alert(
+                alert_id=self._last_id + 1,
+                user_id=int(user_id),
+                pair=pair,
+                threshold=float(threshold),
+                direction=direction,
+                created_at=now_iso(),
+            )
+            self._apply({"op": "add", "alert": asdict(alert)})
+            self._append([{"op": "add", "alert": asdict(alert)}])
+            return alert
+
+    def remove(self, user_id: int, alert_id: int) -> bool:
+        with self._locked(exclusive=True):
+            alert = self._alerts.get(int(alert_id))
+            if alert is None or alert.user_id != int(user_id):
+                return False
+            op = {"op": "remove", "ids": [alert.alert_id]}
+            self._apply(op)
+            self._append([op])
+            return True
+
+    def list_for(self, user_id: int) -> list[Alert]:
+        with self._locked():
+            return sorted(
+                (a for a in self._alerts.values() if a.user_id == int(user_id)),
+                key=lambda a: a.alert_id,
+            )
+
+    # --- срабатывание ---
+    @staticmethod
+    def _derived_moves(
+        pairs: Iterable[str], changes: dict[str, tuple[float, float]]
+    ) -> dict[str, tuple[float, float]]:
+        """Старый и новый курс обратных и кросс-пар, которых нет среди changes."""
+        snapshot = DatabaseManager().read_rates()
+        current = snapshot.get("pairs") if isinstance(snapshot, dict) else None
+        current = current if isinstance(current, dict) else {}
+        before = dict(current)
+        for pair, (old, _new) in changes.items():
+            item = current.get(pair)
+            before[pair] = {**(item if isinstance(item, dict) else {}), "rate": old}
+        old_rates = SnapshotRateProvider({"pairs": before}, strict=False)
+        new_rates = SnapshotRateProvider(snapshot)
+        moves: dict[str, tuple[float, float]] = {}
+        for pair in pairs:
+            frm, to = pair.split("_", 1)
+            try:
+                moves[pair] = (old_rates.rate(frm, to), new_rates.rate(frm, to))
+            except ApiRequestError:
+                continue  # нет пути через USD или курс устарел
+        return moves
+
+    def on_rates(self, changes: dict[str, tuple[float, float]]) -> list[dict[str, Any]]:
+        """
+        Слушатель RatesUpdater: changes — {pair: (старый курс, новый)}.
+        Возвращает записи, добавленные в outbox.
+        """
+        with self._locked(exclusive=True), span("alerts.evaluate", pairs=len(changes)):
+            now = now_iso()
+            records: list[dict[str, Any]] = []
+            moves = dict(changes)
+            touched = {code for pair in changes for code in pair.split("_", 1)}
+            derived = [p for p in self._index if p not in moves and touched.intersection(p.split("_", 1))]
+            if derived:
+                moves.update(self._derived_moves(derived, changes))
+            for pair, (old, new) in moves.items():
+                idx = self._index.get(pair)
+                if idx is None:
+                    continue
+                ids, move = idx.crossed(old, new)
+                for alert_id in ids:
+                    # пороги удалённых оповещений убираются из индекса лениво
+                    alert = self._alerts.pop(alert_id, None)
+                    if alert is None:
+                        self._stale = max(self._stale - 1, 0)
+                        continue
+                    records.append(
+                        {**asdict(alert), "old_rate": old, "new_rate": new, "moved": move, "triggered_at": now}
+                    )
+            if not records:
+                return []
+
+            self.outbox_path.parent.mkdir(parents=True, exist_ok=True)
+            with self.outbox_path.open("a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+            self._append([{"op": "fired", "ids": [r["alert_id"] for r in records]}])
+        logger.info("ALERTS сработало оповещений: %s", len(records))
+        return records
+
+    def outbox_for(self, user_id: int, limit: int = 20) -> list[dict[str, Any]]:
+        if not self.outbox_path.exists():
+            return []
+        out: list[dict[str, Any]] = []
+        with self.outbox_path.open(encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    rec = json.loads(line)
+                    if rec.get("user_id") == int(user_id):
+                        out.append(rec)
+        return out[-limit:][::-1]
+
+
+_engine: AlertEngine | None = None
+_engine_lock = threading.Lock()
+
+
+def get_alert_engine() -> AlertEngine:
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                settings = SettingsLoader()
+                _engine = AlertEngine(
+                    settings.get("alerts_file"),
+                    settings.get("alerts_outbox_file"),
+                    settings.get("alerts_journal_file"),
+                )
+    return _engine
@@ -0,0 +1,363 @@
+"""
+Пакетный импорт и экспорт пользователей и портфелей (CSV / JSONL).
+
+Входной файл читается потоково пачками по batch_size строк; каждая пачка
+проверяется и фиксируется одной записью: пользователи и их пустые портфели
+дописываются в конец users.json / portfolios.json (без перечитывания
+файлов), балансы — одной потоковой перезаписью portfolios.json и одним
+пакетом в журнал сделок (action IMPORT), поэтому ledger-check сходится.
+Id пользователей выдаются подряд от максимального существующего.
+Некорректные строки пропускаются и попадают в отчёт с номером строки.
+
+Форматы:
+  пользователи  username, password | hashed_password + salt, [registration_date]
+  портфели      user_id | username, currency, balance (одна строка на кошелёк);
+                в JSONL также {"user_id" | "username", "wallets": {code: balance}}
+"""
+
+from __future__ import annotations
+
+import csv
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import islice
+import json
+import math
+import os
+from pathlib import Path
+import secrets
+from time import perf_counter
+from typing import Any, Callable, Iterable, Iterator
+
+from valutatrade_hub.core.currencies import get_registry
+from valutatrade_hub.core.exceptions import CurrencyNotFoundError
+from valutatrade_hub.core.ledger import Trade, get_ledger
+from valutatrade_hub.core.models import User
+from valutatrade_hub.core.utils import ensure_data_files
+from valutatrade_hub.infra.database import DatabaseManager
+from valutatrade_hub.infra.metrics import BULK_ROWS
+from valutatrade_hub.infra.tracing import span
+
+FORMATS = ("csv", "jsonl")
+
+USER_FIELDS = ("user_id", "username", "hashed_password", "salt", "registration_date")
+PORTFOLIO_FIELDS = ("user_id", "username", "currency", "balance")
+
+# сколько сообщений об ошибочных строках хранить в отчёте
+_MAX_ERRORS = 20
+
+
+@dataclass(slots=True)
+class BulkReport:
+    rows: int = 0  # прочитано (или выгружено) строк
+    imported: int = 0
+    skipped: int = 0
+    batches: int = 0
+    errors: list[str] = field(default_factory=list)
+    started: float = field(default_factory=perf_counter)
+
+    @property
+    def elapsed(self) -> float:
+        return perf_counter() - self.started
+
+    @property
+    def rows_per_second(self) -> float:
+        elapsed = self.elapsed
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+    def reject(self, line: int, reason: object) -> None:
+        self.skipped += 1
+        if len(self.errors) < _MAX_ERRORS:
+            self.errors.append(f"строка {line}: {reason}")
+
+
+Progress = Callable[[BulkReport], None]
+
+
+def detect_format(path: Path, fmt: str | None = None) -> str:
+    """Формат явно или по расширению файла (.csv / .jsonl)."""
+    fmt = (fmt or path.suffix.lstrip(".")).lower()
+    if fmt == "ndjson":
+        fmt = "jsonl"
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат '{fmt}': ожидается csv или jsonl")
+    return fmt
+
+
+# --- чтение входного файла ---
+def _read_rows(path: Path, fmt: str) -> Iterator[tuple[int, dict[str, Any] | str]]:
+    """(номер строки, запись) — или (номер строки, текст ошибки) для нечитаемой строки."""
+    with open(path, encoding="utf-8-sig", newline="") as f:  # -sig: CSV из Excel с BOM
+        if fmt == "csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, {k.strip(): v for k, v in row.items() if k}
+            return
+        for n, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError as e:
+                yield n, f"некорректный JSON ({e.msg})"
+                continue
+            yield n, obj if isinstance(obj, dict) else "ожидается JSON-объект"
+
+
+def _batches(rows: Iterator[Any], size: int) -> Iterator[list[Any]]:
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def _text(row: dict[str, Any], key: str) -> str:
+    value = row.get(key)
+    return value.strip() if isinstance(value, str) else ("" if value is None else str(value))
+
+
+def _balance(value: Any) -> float:
+    if isinstance(value, dict):
+        value = value.get("balance")
+    try:
+        bal = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"некорректный баланс {value!r}") from None
+    if not math.isfinite(bal) or bal < 0:
+        raise ValueError(f"некорректный баланс {value!r}")
+    return bal
+
+
+# --- импорт пользователей ---
+def _new_user(row: dict[str, Any], user_id: int) -> dict[str, Any]:
+    raw_date = _text(row, "registration_date")
+    registration_date = datetime.fromisoformat(raw_date) if raw_date else datetime.now()
+    hashed, salt = _text(row, "hashed_password"), _text(row, "salt")
+    password = row.get("password")
+    if password not in (None, ""):
+        user = User(user_id, _text(row, "username"), "", secrets.token_hex(8), registration_date)
+        user.change_password(str(password))
+    elif hashed and salt:
+        # перенос из другой системы: хеш и соль как есть
+        user = User(user_id, _text(row, "username"), hashed, salt, registration_date)
+    else:
+        raise ValueError("нужен password или hashed_password + salt")
+    return {
+        "user_id": user.user_id,
+        "username": user.username,
+        "hashed_password": user.hashed_password,
+        "salt": user.salt,
+        "registration_date": user.registration_date.isoformat(),
+    }
+
+
+def import_users(
+    path: Path,
+    fmt: str | None = None,
+    batch_size: int = 5000,
+    progress: Progress | None = None,
+) -> BulkReport:
+    fmt = detect_format(path, fmt)
+    ensure_data_files()
+    db = DatabaseManager()
+    report = BulkReport()
+    # импорт целиком под блокировкой: занятые имена и следующий id не устаревают
+    with db.lock, span("bulk.import_users", file=path.name):
+        taken: set[str] = set()
+        next_id = 1
+        for u in db.iter_users():
+            taken.add(str(u.get("username")))
+            next_id = max(next_id, int(u.get("user_id", 0)) + 1)
+
+        for batch in _batches(_read_rows(path, fmt), max(batch_size, 1)):
+            users: list[dict[str, Any]] = []
+            for line, row in batch:
+                report.rows += 1
+                if isinstance(row, str):
+                    report.reject(line, row)
+                    continue
+                try:
+                    user = _new_user(row, next_id)
+                except ValueError as e:  # в т.ч. ValidationError
+                    report.reject(line, e)
+                    continue
+                if user["username"] in taken:
+                    report.reject(line, f"имя '{user['username']}' уже занято")
+                    continue
+                taken.add(user["username"])
+                users.append(user)
+                next_id += 1
+            if users:
+                db.append_users(users)
+                db.append_portfolios([{"user_id": u["user_id"], "wallets": {}} for u in users])
+            report.imported += len(users)
+            report.batches += 1
+            BULK_ROWS.inc(len(users), op="import_users", result="imported")
+            if progress is not None:
+                progress(report)
+        BULK_ROWS.inc(report.skipped, op="import_users", result="skipped")
+    return report
+
+
+# --- импорт портфелей ---
+def _wallet_rows(row: dict[str, Any]) -> Iterator[tuple[str, Any]]:
+    wallets = row.get("wallets")
+    if isinstance(wallets, dict):
+        yield from wallets.items()
+    else:
+        yield _text(row, "currency"), row.get("balance")
+
+
+def _apply_updates(
+    rows: Iterable[dict[str, Any]], updates: dict[int, dict[str, float]], trades: list[Trade]
+) -> Iterator[dict[str, Any]]:
+    """Строки portfolios.json с применёнными балансами; сделки IMPORT — в trades."""
+
+    def merged(uid: int, wallets: dict[str, Any]) -> dict[str, Any]:
+        wallets = dict(wallets)
+        for code, bal in updates.pop(uid).items():
+            prev = wallets.get(code)
+            before = float(prev.get("balance", 0.0)) if isinstance(prev, dict) else 0.0
+            wallets[code] = {"balance": bal}
+            if bal != before:
+                trades.append(("IMPORT", uid, code, abs(bal - before), before, bal, code, None))
+        return wallets
+
+    for row in rows:
+        uid = int(row.get("user_id", -1)) if isinstance(row, dict) else -1
+        if uid in updates:
+            wallets = row.get("wallets")
+            row = {**row, "wallets": merged(uid, wallets if isinstance(wallets, dict) else {})}
+        yield row
+    # пользователи без строки в portfolios.json
+    for uid in list(updates):
+        yield {"user_id": uid, "wallets": merged(uid, {})}
+
+
+def import_portfolios(
+    path: Path,
+    fmt: str | None = None,
+    batch_size: int = 50000,
+    match: str = "user_id",
+    progress: Progress | None = None,
+) -> BulkReport:
+    """Балансы кошельков (замена, не прибавление); пользователь ищется по match."""
+    if match not in ("user_id", "username"):
+        raise ValueError("match: user_id или username")
+    fmt = detect_format(path, fmt)
+    ensure_data_files()
+    db = DatabaseManager()
+    registry = get_registry()
+    ledger = get_ledger()
+    report = BulkReport()
+    with db.lock, span("bulk.import_portfolios", file=path.name):
+        ids: dict[str, int] = {}
+        for u in db.iter_users():
+            uid = int(u.get("user_id", -1))
+            ids[str(uid) if match == "user_id" else str(u.get("username"))] = uid
+
+        for batch in _batches(_read_rows(path, fmt), max(batch_size, 1)):
+            updates: dict[int, dict[str, float]] = {}
+            for line, row in batch:
+                report.rows += 1
+                if isinstance(row, str):
+                    report.reject(line, row)
+                    continue
+                key = _text(row, match)
+                uid = ids.get(key)
+                if uid is None:
+                    report.reject(line, f"пользователь {match}={key!r} не найден")
+                    continue
+                try:
+                    wallets = {
+                        registry.get(code).code: _balance(bal) for code, bal in _wallet_rows(row)
+                    }
+                except CurrencyNotFoundError as e:
+                    report.reject(line, f"неизвестная валюта '{e.code}'")
+                    continue
+                except ValueError as e:
+                    report.reject(line, e)
+                    continue
+                updates.setdefault(uid, {}).update(wallets)
+                report.imported += len(wallets)
+            if updates:
+                trades: list[Trade] = []
+                db.rewrite_portfolios(_apply_updates(db.iter_portfolios(), updates, trades))
+                ledger.record_many(trades)
+            report.batches += 1
+            if progress is not None:
+                progress(report)
+        BULK_ROWS.inc(report.imported, op="import_portfolios", result="imported")
+        BULK_ROWS.inc(report.skipped, op="import_portfolios", result="skipped")
+    return report
+
+
+# --- экспорт ---
+def _write_rows(
+    path: Path,
+    fmt: str,
+    fields: tuple[str, ...],
+    rows: Iterable[dict[str, Any]],
+    report: BulkReport,
+    progress: Progress | None,
+    every: int,
+) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore") if fmt == "csv" else None
+        if writer is not None:
+            writer.writeheader()
+        for row in rows:
+            if writer is not None:
+                writer.writerow(row)
+            else:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            report.rows += 1
+            report.imported += 1
+            if progress is not None and report.rows % every == 0:
+                report.batches += 1
+                progress(report)
+    os.replace(tmp, path)
+    if progress is not None and report.rows % every:
+        report.batches += 1
+        progress(report)
+
+
+def export_users(
+    path: Path, fmt: str | None = None, batch_size: int = 10000, progress: Progress | None = None
+) -> BulkReport:
+    fmt = detect_format(path, fmt)
+    report = BulkReport()
+    with span("bulk.export_users", file=path.name):
+        rows = ({k: u.get(k) for k in USER_FIELDS} for u in DatabaseManager().iter_users())
+        _write_rows(path, fmt, USER_FIELDS, rows, report, progress, max(batch_size, 1))
+    BULK_ROWS.inc(report.rows, op="export_users", result="exported")
+    return report
+
+
+def export_portfolios(
+    path: Path, fmt: str | None = None, batch_size: int = 10000, progress: Progress | None = None
+) -> BulkReport:
+    """CSV — строка на кошелёк; JSONL — строка на пользователя с wallets {code: balance}."""
+    fmt = detect_format(path, fmt)
+    db = DatabaseManager()
+    report = BulkReport()
+    # username — чтобы импорт в другую систему мог сопоставлять по имени
+    names = {int(u.get("user_id", -1)): u.get("username") for u in db.iter_users()}
+
+    def rows() -> Iterator[dict[str, Any]]:
+        for p in db.iter_portfolios():
+            uid = int(p.get("user_id", -1))
+            wallets = p.get("wallets") if isinstance(p.get("wallets"), dict) else {}
+            balances = {
+                code: float(w.get("balance", 0.0)) for code, w in wallets.items() if isinstance(w, dict)
+            }
+            if fmt == "jsonl":
+                yield {"user_id": uid, "username": names.get(uid), "wallets": balances}
+                continue
+            for code, bal in balances.items():
+                yield {"user_id": uid, "username": names.get(uid), "currency": code, "balance": bal}
+
+    with span("bulk.export_portfolios", file=path.name):
+        _write_rows(path, fmt, PORTFOLIO_FIELDS, rows(), report, progress, max(batch_size, 1))
+    BULK_ROWS.inc(report.rows, op="export_portfolios", result="exported")
+    return report
@@ -0,0 +1,178 @@
+"""
+Колоночное представление всех портфелей для отчётов и оценки риска.
+
+Балансы хранятся по валютам: в плотном режиме — по одному array('d') длиной
+«число пользователей» на валюту, в разреженном — пары (индексы пользователей,
+балансы). Оценка всех портфелей — один проход по каждой колонке с вектором
+курсов, без per-user вызовов get_rate и построения Wallet/Portfolio.
+"""
+
+from __future__ import annotations
+
+from array import array
+import math
+from typing import Any, Iterable, Mapping
+
+from valutatrade_hub.core.currencies import get_registry
+from valutatrade_hub.core.exceptions import ApiRequestError
+from valutatrade_hub.core.rates import RateProvider, SnapshotRateProvider
+from valutatrade_hub.core.utils import StorageError
+from valutatrade_hub.infra.database import DatabaseManager
+
+# RateProvider или {code: курс к base}
+Rates = Mapping[str, float] | RateProvider
+
+# доля заполненных ячеек, ниже которой auto выбирает разреженный режим
+_SPARSE_THRESHOLD = 0.25
+
+
+class WalletColumns:
+    def __init__(self, user_ids: Iterable[int], codes: Iterable[str], layout: str) -> None:
+        if layout not in {"dense", "sparse"}:
+            raise ValueError(f"Неизвестный layout: {layout}")
+        self.layout = layout
+        self.user_ids = array("q", user_ids)
+        self.codes: list[str] = list(codes)
+        self.user_index = {uid: i for i, uid in enumerate(self.user_ids)}
+        self.code_index = {code: j for j, code in enumerate(self.codes)}
+        n = len(self.user_ids)
+        # dense: code -> балансы всех пользователей
+        self._dense: list[array] = (
+            [array("d", bytes(8 * n)) for _ in self.codes] if layout == "dense" else []
+        )
+        # sparse: code -> (индексы пользователей, балансы)
+        self._sparse: list[tuple[array, array]] = (
+            [(array("l"), array("d")) for _ in self.codes] if layout == "sparse" else []
+        )
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Mapping[str, Any]], layout: str = "auto") -> WalletColumns:
+        """Строит хранилище из строк portfolios.json."""
+        user_ids: list[int] = []
+        # code -> (индексы пользователей, балансы)
+        columns: dict[str, tuple[array, array]] = {}
+        entries = 0
+        for row in rows:
+            i = len(user_ids)
+            user_ids.append(int(row.get("user_id", -1)))
+            wallets = row.get("wallets")
+            if not isinstance(wallets, dict):
+                continue
+            for code, payload in wallets.items():
+                bal = payload.get("balance", 0.0) if isinstance(payload, dict) else payload
+                if not isinstance(bal, (int, float)) or not bal:
+                    continue
+                col = columns.get(code)
+                if col is None:
+                    cur = str(code).strip().upper()
+                    col = columns.get(cur) or columns.setdefault(cur, (array("l"), array("d")))
+                    columns[code] = col
+                col[0].append(i)
+                col[1].append(float(bal))
+                entries += 1
+
+        # ключи из файла могут отличаться регистром: оставляем нормализованные
+        columns = {code: col for code, col in columns.items() if code == code.strip().upper()}
+        if layout == "auto":
+            cells = len(user_ids) * len(columns)
+            layout = "sparse" if cells and entries / cells < _SPARSE_THRESHOLD else "dense"
+
+        store = cls(user_ids, columns, layout)
+        for j, (idx, vals) in enumerate(columns.values()):
+            if layout == "dense":
+                col = store._dense[j]
+                for i, v in zip(idx, vals):
+                    col[i] += v
+            else:
+                store._sparse[j] = (idx, vals)
+        return store
+
+    @classmethod
+    def load(cls, layout: str = "auto") -> WalletColumns:
+        # потоковое чтение: в памяти колонки, а не весь portfolios.json
+        try:
+            return cls.from_rows(DatabaseManager().iter_portfolios(), layout)
+        except StorageError as e:
+            raise ApiRequestError("portfolios.json поврежден") from e
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def currency_ids(self) -> array:
+        """Id колонок в справочнике валют (стабильны между загрузками и процессами)."""
+        registry = get_registry()
+        return array("l", (registry.id_of(code) for code in self.codes))
+
+    @property
+    def density(self) -> float:
+        cells = len(self.user_ids) * len(self.codes)
+        if not cells:
+            return 0.0
+        if self.layout == "dense":
+            filled = sum(len(col) - col.count(0.0) for col in self._dense)
+        else:
+            filled = sum(len(idx) for idx, _ in self._sparse)
+        return filled / cells
+
+    def balances(self, user_id: int) -> dict[str, float]:
+        i = self.user_index[int(user_id)]
+        out: dict[str, float] = {}
+        for j, code in enumerate(self.codes):
+            if self.layout == "dense":
+                bal = self._dense[j][i]
+            else:
+                idx, vals = self._sparse[j]
+                bal = sum(v for k, v in zip(idx, vals) if k == i)
+            if bal:
+                out[code] = bal
+        return out
+
+    def rate_vector(self, base: str, rates: Rates | None = None) -> array:
+        """
+        Курс каждой валюты хранилища к base; по умолчанию — из снимка
+        кэша курсов (SnapshotRateProvider).
+        """
+        base_c = base.strip().upper()
+        if rates is None:
+            rates = SnapshotRateProvider()
+        if isinstance(rates, RateProvider):
+            return array("d", rates.rates_to(base_c, self.codes))
+        vec = array("d")
+        for code in self.codes:
+            rate = 1.0 if code == base_c else rates.get(code)
+            if rate is None:
+                raise ApiRequestError(f"Курс {code}→{base_c} недоступен")
+            vec.append(float(rate))
+        return vec
+
+    def value_all(self, base: str = "USD", rates: Rates | None = None) -> array:
+        """Стоимость каждого портфеля в base; порядок совпадает с user_ids."""
+        vec = self.rate_vector(base, rates)
+        n = len(self.user_ids)
+        if self.layout == "dense":
+            totals: list[float] = [0.0] * n
+            for col, rate in zip(self._dense, vec):
+                totals = [t + v * rate for t, v in zip(totals, col)]
+            return array("d", totals)
+
+        totals_list = [0.0] * n
+        for (idx, vals), rate in zip(self._sparse, vec):
+            for i, v in zip(idx, vals):
+                totals_list[i] += v * rate
+        return array("d", totals_list)
+
+    def user_totals(self, base: str = "USD", rates: Rates | None = None) -> dict[int, float]:
+        return dict(zip(self.user_ids, self.value_all(base, rates)))
+
+    def aum_by_currency(self) -> dict[str, float]:
+        """Суммарные балансы по валютам (в единицах самой валюты)."""
+        if self.layout == "dense":
+            sums = [math.fsum(col) for col in self._dense]
+        else:
+            sums = [math.fsum(vals) for _, vals in self._sparse]
+        return dict(zip(self.codes, sums))
+
+    def aum(self, base: str = "USD", rates: Rates | None = None) -> float:
+        """Суммарная стоимость всех портфелей в base."""
+        vec = self.rate_vector(base, rates)
+        return math.fsum(s * r for s, r in zip(self.aum_by_currency().values(), vec))
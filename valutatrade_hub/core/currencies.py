@@ -1,11 +1,25 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+import threading
+from types import MappingProxyType
+from typing import Any, Iterable, Iterator, Mapping
 
 from valutatrade_hub.core.exceptions import CurrencyNotFoundError
+from valutatrade_hub.core.utils import append_json_array, load_json
+from valutatrade_hub.infra.settings import SettingsLoader
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore[assignment]
 
 
 class Currency(ABC):
+    __slots__ = ("name", "code")
+
     def __init__(self, name: str, code: str) -> None:
         if not isinstance(name, str) or not name.strip():
             raise ValueError("name не может быть пустым")
@@ -25,6 +39,8 @@ class Currency(ABC):
 
 
 class FiatCurrency(Currency):
+    __slots__ = ("issuing_country",)
+
     def __init__(self, name: str, code: str, issuing_country: str) -> None:
         super().__init__(name=name, code=code)
         if not isinstance(issuing_country, str) or not issuing_country.strip():
@@ -36,6 +52,8 @@ class FiatCurrency(Currency):
 
 
 class CryptoCurrency(Currency):
+    __slots__ = ("algorithm", "market_cap")
+
     def __init__(self, name: str, code: str, algorithm: str, market_cap: float) -> None:
         super().__init__(name=name, code=code)
         if not isinstance(algorithm, str) or not algorithm.strip():
@@ -50,21 +68,201 @@ class CryptoCurrency(Currency):
         return f"[CRYPTO] {self.code} — {self.name} (Algo: {self.algorithm}, MCAP: {self.market_cap:.2e})"
 
 
-# Реестр валют (минимально нужный набор под ваши usecases)
-_REGISTRY: dict[str, Currency] = {
-    "USD": FiatCurrency("US Dollar", "USD", "United States"),
-    "EUR": FiatCurrency("Euro", "EUR", "Eurozone"),
-    "RUB": FiatCurrency("Russian Ruble", "RUB", "Russia"),
-    "BTC": CryptoCurrency("Bitcoin", "BTC", "SHA-256", 1.12e12),
-    "ETH": CryptoCurrency("Ethereum", "ETH", "Ethash", 4.50e11),
-}
+# Минимальный набор на случай отсутствия data/currencies.json
+_BUILTIN: tuple[Currency, ...] = (
+    FiatCurrency("US Dollar", "USD", "United States"),
+    FiatCurrency("Euro", "EUR", "Eurozone"),
+    FiatCurrency("Russian Ruble", "RUB", "Russia"),
+    CryptoCurrency("Bitcoin", "BTC", "SHA-256", 1.12e12),
+    CryptoCurrency("Ethereum", "ETH", "Ethash", 4.50e11),
+)
+
+
+def _from_record(rec: dict[str, Any]) -> Currency:
+    kind = str(rec.get("type", "fiat")).lower()
+    if kind == "crypto":
+        return CryptoCurrency(
+            rec["name"], rec["code"], rec.get("algorithm") or "unknown", rec.get("market_cap", 0.0)
+        )
+    return FiatCurrency(rec["name"], rec["code"], rec.get("issuing_country") or "unknown")
+
+
+def _to_record(cur: Currency) -> dict[str, Any]:
+    if isinstance(cur, CryptoCurrency):
+        return {
+            "code": cur.code,
+            "name": cur.name,
+            "type": "crypto",
+            "algorithm": cur.algorithm,
+            "market_cap": cur.market_cap,
+        }
+    return {"code": cur.code, "name": cur.name, "type": "fiat", "issuing_country": cur.issuing_country}
+
+
+def _read_records(path: Path) -> list[Currency]:
+    records = load_json(path, default=None)
+    return [_from_record(r) for r in records if isinstance(r, dict)] if isinstance(records, list) else []
+
+
+class CurrencyRegistry:
+    """
+    Справочник валют: код -> Currency и код <-> целочисленный id.
+
+    Индексы неизменяемые (MappingProxyType); extend строит новые и подменяет
+    ссылки целиком, поэтому чтение идёт без блокировок. Id выдаются по
+    порядку добавления и не меняются — на них можно ключевать массивы.
+
+    Справочник из файла (from_file) — это currencies.json (или встроенный
+    набор), за которым следуют коды, добавленные во время работы. Их
+    from_file дописывает под flock в отдельный файл (currencies.local.json,
+    в git не хранится), поэтому id валюты одинаков во всех процессах и
+    между запусками, а справочник в репозитории не меняется.
+    """
+
+    def __init__(self, currencies: Iterable[Currency] = (), local_path: Path | None = None) -> None:
+        self._lock = threading.Lock()
+        self._by_code: Mapping[str, Currency] = MappingProxyType({})
+        self._ids: Mapping[str, int] = MappingProxyType({})
+        self._codes: tuple[str, ...] = ()
+        self.local_path = local_path  # None — новые коды живут только в памяти
+        self._add(currencies)
+
+    @classmethod
+    def from_file(cls, path: Path, local_path: Path | None = None) -> CurrencyRegistry:
+        """local_path по умолчанию — currencies.local.json рядом с path."""
+        seed = _read_records(path) if isinstance(load_json(path, default=None), list) else list(_BUILTIN)
+        local_path = local_path or path.with_name(path.stem + ".local.json")
+        registry = cls(seed, local_path=local_path)
+        registry._add(_read_records(local_path))
+        return registry
+
+    @contextmanager
+    def _file_lock(self, path: Path) -> Iterator[None]:
+        lock_path = path.with_name(path.name + ".lock")
+        with _persist_lock, open(lock_path, "a+b") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _persist(self, path: Path, currencies: list[Currency]) -> int:
+        with self._file_lock(path):
+            # сначала коды, дописанные другими процессами: id совпадут с порядком в файле
+            added = self._add(_read_records(path))
+            new = [cur for cur in currencies if cur.code not in self._by_code]
+            if new:
+                append_json_array(path, [_to_record(cur) for cur in new])
+                added += self._add(new)
+            return added
+
+    def _add(self, currencies: Iterable[Currency]) -> int:
+        with self._lock:
+            by_code = dict(self._by_code)
+            ids = dict(self._ids)
+            codes = list(self._codes)
+            for cur in currencies:
+                if cur.code in by_code:
+                    continue
+                by_code[cur.code] = cur
+                ids[cur.code] = len(codes)
+                codes.append(cur.code)
+            added = len(codes) - len(self._codes)
+            if added:
+                # порядок важен: id публикуется раньше, чем код становится видимым
+                self._codes = tuple(codes)
+                self._ids = MappingProxyType(ids)
+                self._by_code = MappingProxyType(by_code)
+            return added
+
+    def extend(self, codes: Iterable[str], crypto: Iterable[str] = ()) -> int:
+        """
+        Регистрирует неизвестные коды (например, из ответа ExchangeRate-API)
+        с минимальными метаданными. Возвращает число добавленных.
+        """
+        crypto_set = {c.strip().upper() for c in crypto}
+        new: list[Currency] = []
+        for code in codes:
+            key = str(code).strip().upper()
+            if key in self._by_code:
+                continue
+            try:
+                if key in crypto_set:
+                    new.append(CryptoCurrency(key, key, "unknown", 0.0))
+                else:
+                    new.append(FiatCurrency(key, key, "unknown"))
+            except ValueError:
+                continue  # не похоже на код валюты
+        if not new:
+            return 0
+        return self._persist(self.local_path, new) if self.local_path is not None else self._add(new)
+
+    def extend_from_pairs(self, pairs: Iterable[str], crypto: Iterable[str] = ()) -> int:
+        """Коды из ключей снимка курсов вида FROM_TO."""
+        codes: dict[str, None] = {}
+        for pair in pairs:
+            frm, sep, to = str(pair).partition("_")
+            if sep:
+                codes.setdefault(frm)
+                codes.setdefault(to)
+        return self.extend(codes, crypto)
+
+    def get(self, code: str) -> Currency:
+        if not isinstance(code, str):
+            raise CurrencyNotFoundError(str(code))
+        key = code.strip().upper()
+        cur = self._by_code.get(key)
+        if cur is None:
+            raise CurrencyNotFoundError(key)
+        return cur
+
+    def id_of(self, code: str) -> int:
+        return self._ids[self.get(code).code]
+
+    def code_of(self, currency_id: int) -> str:
+        try:
+            return self._codes[currency_id]
+        except IndexError:
+            raise CurrencyNotFoundError(f"#{currency_id}") from None
+
+    @property
+    def codes(self) -> tuple[str, ...]:
+        return self._codes
+
+    def __contains__(self, code: object) -> bool:
+        return isinstance(code, str) and code.strip().upper() in self._by_code
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+
+_registry: CurrencyRegistry | None = None
+_registry_lock = threading.Lock()
+_persist_lock = threading.Lock()
+
+
+def get_registry() -> CurrencyRegistry:
+    """Справочник из data/currencies.json, дополненный парами кэша курсов."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                from valutatrade_hub.infra.database import DatabaseManager
+                from valutatrade_hub.parser_service.config import ParserConfig
+
+                settings = SettingsLoader()
+                registry = CurrencyRegistry.from_file(
+                    settings.get("currencies_file"), settings.get("currencies_local_file")
+                )
+                snapshot = DatabaseManager().read_rates()
+                pairs = snapshot.get("pairs") if isinstance(snapshot, dict) else None
+                if isinstance(pairs, dict):
+                    registry.extend_from_pairs(pairs, ParserConfig.CRYPTO_CURRENCIES)
+                _registry = registry
+    return _registry
 
 
 def get_currency(code: str) -> Currency:
-    if not isinstance(code, str):
-        raise CurrencyNotFoundError(str(code))
-    key = code.strip().upper()
-    cur = _REGISTRY.get(key)
-    if cur is None:
-        raise CurrencyNotFoundError(key)
-    return cur
\ No newline at end of file
+    return get_registry().get(code)
\ No newline at end of file
@@ -25,4 +25,16 @@ class CurrencyNotFoundError(ValutaTradeError):
 class ApiRequestError(ValutaTradeError):
     def __init__(self, reason: str) -> None:
         self.reason = str(reason)
-        super().__init__(f"Ошибка при обращении к внешнему API: {self.reason}")
\ No newline at end of file
+        super().__init__(f"Ошибка при обращении к внешнему API: {self.reason}")
+
+
+class RateLimitExceededError(ApiRequestError):
+    """Квота запросов к источнику исчерпана; запрос не отправлялся."""
+
+    def __init__(self, reason: str, retry_after: float) -> None:
+        self.retry_after = float(retry_after)
+        super().__init__(reason)
+
+
+class AuthError(RuntimeError):
+    """Ошибка login/register."""
\ No newline at end of file
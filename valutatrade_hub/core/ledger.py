@@ -0,0 +1,417 @@
+"""
+Журнал сделок (append-only) с периодическими снимками балансов.
+
+Каждая buy/sell дописывается строкой в ledger.jsonl. Раз в snapshot_every
+событий балансы сохраняются в снимок вместе с байтовым смещением в журнале,
+поэтому восстановление состояния — снимок + хвост журнала после смещения.
+Первый снимок (базовая точка) берётся из portfolios.json на момент создания
+журнала: балансы, появившиеся до него, в журнале не отражены.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from itertools import islice
+import json
+import math
+import os
+from pathlib import Path
+import shutil
+import struct
+import threading
+from typing import Any, Callable
+
+from valutatrade_hub.core.utils import load_json, save_json
+from valutatrade_hub.infra.database import DatabaseManager
+from valutatrade_hub.infra.settings import SettingsLoader
+from valutatrade_hub.infra.tracing import span
+
+# запись индекса: смещение в журнале, время (epoch), код валюты
+_IDX_CODE = 8
+_IDX = struct.Struct(f"<Qd{_IDX_CODE}s")
+
+# строк журнала на один вызов json.loads при восстановлении
+_REPLAY_BATCH = 4096
+
+# action, user_id, currency, amount, before, after, base, rate
+Trade = tuple[str, int, str, float, float, float, str, float | None]
+
+# допуск при сверке before с балансом, восстановленным из журнала
+_EPS = 1e-9
+
+
+@dataclass(slots=True)
+class LedgerState:
+    balances: dict[int, dict[str, float]] = field(default_factory=dict)
+    offset: int = 0  # байтовое смещение конца последнего применённого события
+    events: int = 0  # всего событий от начала журнала
+    replayed: int = 0  # из них прочитано из хвоста при этом восстановлении
+    mismatches: list[dict[str, Any]] = field(default_factory=list)
+    corrupt: int = 0  # пропущено повреждённых строк в хвосте журнала
+
+
+def _portfolio_balances() -> dict[int, dict[str, float]]:
+    out: dict[int, dict[str, float]] = {}
+    for row in DatabaseManager().iter_portfolios():
+        if not isinstance(row, dict):
+            continue
+        wallets = row.get("wallets")
+        if isinstance(wallets, dict):
+            out[int(row.get("user_id", -1))] = {
+                str(code): float(w.get("balance", 0.0))
+                for code, w in wallets.items()
+                if isinstance(w, dict)
+            }
+    return out
+
+
+def _bisect(key: Callable[[int], float], lo: int, hi: int, value: float, right: bool) -> int:
+    while lo < hi:
+        mid = (lo + hi) // 2
+        k = key(mid)
+        if k < value or (right and k == value):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+class TradeLedger:
+    def __init__(
+        self,
+        path: Path,
+        snapshot_path: Path,
+        snapshot_every: int = 1000,
+        index_dir: Path | None = None,
+    ) -> None:
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self.snapshot_every = max(int(snapshot_every), 1)
+        self.index_dir = index_dir or path.with_name(f"{path.stem}_index")
+        self._lock = threading.Lock()
+        self._since_snapshot: int | None = None
+
+    # --- запись ---
+    def record(
+        self,
+        action: str,
+        user_id: int,
+        currency: str,
+        amount: float,
+        before: float,
+        after: float,
+        base: str,
+        rate: float | None,
+    ) -> None:
+        self.record_many([(action, user_id, currency, amount, before, after, base, rate)])
+
+    def record_many(self, trades: list[Trade]) -> None:
+        """Пакет сделок одной записью в журнал (исполнение отложенных ордеров)."""
+        if not trades:
+            return
+        now = datetime.now(timezone.utc)
+        ts = now.isoformat(timespec="microseconds")
+        events = [
+            {
+                "ts": ts,
+                "action": action,
+                "user_id": int(user_id),
+                "currency": currency,
+                "amount": float(amount),
+                "base": base,
+                "rate": rate,
+                "before": float(before),
+                "after": float(after),
+            }
+            for action, user_id, currency, amount, before, after, base, rate in trades
+        ]
+        lines = [
+            (json.dumps(ev, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+            for ev in events
+        ]
+        data = b"".join(lines)
+        with self._lock, span("ledger.append", events=len(events)):
+            self._ensure_baseline(pending=events)
+            self._ensure_index()
+            # один write() в O_APPEND: строки разных процессов не перемешиваются,
+            # а позиция после записи даёт смещение именно наших строк
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+                offset = os.lseek(fd, 0, os.SEEK_CUR) - len(data)
+            finally:
+                os.close(fd)
+            # записи индекса группируются по пользователю: один open на пользователя в пакете
+            per_user: dict[int, bytearray] = {}
+            for ev, line in zip(events, lines):
+                code = ev["currency"].encode("ascii", "replace")[:_IDX_CODE]
+                per_user.setdefault(ev["user_id"], bytearray()).extend(
+                    _IDX.pack(offset, now.timestamp(), code)
+                )
+                offset += len(line)
+            for uid, recs in per_user.items():
+                self._index_append(uid, bytes(recs))
+            self._since_snapshot = (self._since_snapshot or 0) + len(events)
+            if self._since_snapshot >= self.snapshot_every:
+                self._write_snapshot(self.replay())
+
+    def _ensure_baseline(self, pending: list[dict[str, Any]] | None = None) -> None:
+        if self._since_snapshot is not None:
+            return
+        if self.snapshot_path.exists():
+            self._since_snapshot = self.replay().replayed
+            return
+        # базовая точка: текущие балансы portfolios.json до первого события
+        state = LedgerState(
+            balances=_portfolio_balances(),
+            offset=self.path.stat().st_size if self.path.exists() else 0,
+        )
+        # portfolios.json уже содержит результат записываемых сделок:
+        # баланс до пакета — before первой сделки по каждому кошельку
+        for ev in reversed(pending or []):
+            state.balances.setdefault(ev["user_id"], {})[ev["currency"]] = ev["before"]
+        self._write_snapshot(state)
+
+    def snapshot(self) -> LedgerState:
+        """Снимок по текущему концу журнала (вне очереди)."""
+        with self._lock:
+            self._ensure_baseline()
+            state = self.replay()
+            self._write_snapshot(state)
+            return state
+
+    def _write_snapshot(self, state: LedgerState) -> None:
+        payload = {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "offset": state.offset,
+            "events": state.events,
+            "balances": {str(uid): bal for uid, bal in state.balances.items()},
+        }
+        tmp = self.snapshot_path.with_name(self.snapshot_path.name + ".tmp")
+        with span("ledger.snapshot", events=state.events):
+            save_json(tmp, payload)
+            os.replace(tmp, self.snapshot_path)
+        self._since_snapshot = 0
+
+    # --- индекс по пользователям ---
+    # <index_dir>/<user_id>.idx — записи фиксированной длины в порядке сделок:
+    # смещение строки в журнале, время (epoch), код валюты. Позиция записи в
+    # файле служит курсором пагинации.
+    def _index_file(self, user_id: int) -> Path:
+        return self.index_dir / f"{int(user_id)}.idx"
+
+    def _index_append(self, user_id: int, records: bytes) -> None:
+        with self._index_file(user_id).open("ab") as f:
+            f.write(records)
+
+    def _ensure_index(self) -> None:
+        if not self.index_dir.exists():
+            self.rebuild_index()
+
+    def rebuild_index(self) -> int:
+        """Строит индексы заново по всему журналу; возвращает число событий."""
+        tmp = self.index_dir.with_name(self.index_dir.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        per_user: dict[int, bytearray] = {}
+        count = 0
+        if self.path.exists():
+            with span("ledger.reindex"), self.path.open("rb") as f:
+                offset = 0
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    start, offset = offset, offset + len(line)
+                    try:
+                        ev = json.loads(line)
+                        ts = datetime.fromisoformat(ev["ts"]).timestamp()
+                        code = str(ev["currency"]).encode("ascii", "replace")[:_IDX_CODE]
+                        uid = int(ev["user_id"])
+                    except (ValueError, KeyError, TypeError):
+                        continue  # пустая или повреждённая строка — как и в replay
+                    per_user.setdefault(uid, bytearray()).extend(_IDX.pack(start, ts, code))
+                    count += 1
+        for uid, data in per_user.items():
+            (tmp / f"{uid}.idx").write_bytes(data)
+        shutil.rmtree(self.index_dir, ignore_errors=True)
+        os.replace(tmp, self.index_dir)
+        return count
+
+    def history(
+        self,
+        user_id: int,
+        limit: int = 50,
+        before: int | None = None,
+        currency: str | None = None,
+        date_from: datetime | None = None,
+        date_to: datetime | None = None,
+    ) -> tuple[list[dict[str, Any]], int | None]:
+        """
+        Сделки пользователя от новых к старым. before — курсор из предыдущей
+        страницы. Диапазон дат ищется бинарным поиском по индексу, поэтому
+        стоимость страницы не зависит от размера журнала.
+        Возвращает (события, курсор следующей страницы или None).
+        """
+        with self._lock:
+            self._ensure_index()
+        path = self._index_file(user_id)
+        if limit <= 0 or not path.exists():
+            return [], None
+        code = currency.strip().upper().encode("ascii", "replace") if currency else None
+
+        with span("ledger.history", user_id=user_id), path.open("rb") as idx:
+            n = os.fstat(idx.fileno()).st_size // _IDX.size
+
+            def ts_at(i: int) -> float:
+                idx.seek(i * _IDX.size)
+                return _IDX.unpack(idx.read(_IDX.size))[1]
+
+            hi = n if before is None else max(min(int(before), n), 0)
+            lo = 0
+            if date_to is not None:
+                hi = _bisect(ts_at, lo, hi, date_to.timestamp(), right=True)
+            if date_from is not None:
+                lo = _bisect(ts_at, lo, hi, date_from.timestamp(), right=False)
+
+            offsets: list[int] = []
+            i = hi
+            while i > lo and len(offsets) < limit:
+                # читаем индекс блоками с конца страницы
+                start = max(lo, i - max(limit, 64))
+                idx.seek(start * _IDX.size)
+                block = idx.read((i - start) * _IDX.size)
+                for j in range(i - start - 1, -1, -1):
+                    off, _ts, rec_code = _IDX.unpack_from(block, j * _IDX.size)
+                    i = start + j
+                    if code is None or rec_code.rstrip(b"\0") == code:
+                        offsets.append(off)
+                        if len(offsets) == limit:
+                            break
+                else:
+                    i = start
+            next_cursor = i if i > lo and len(offsets) == limit else None
+
+        events: list[dict[str, Any]] = []
+        with self.path.open("rb") as f:
+            for off in offsets:
+                f.seek(off)
+                events.append(json.loads(f.readline()))
+        return events, next_cursor
+
+    def user_events(self, user_id: int, date_to: datetime | None = None) -> list[dict[str, Any]]:
+        """Все сделки пользователя по времени (до date_to включительно) — через индекс."""
+        with self._lock:
+            self._ensure_index()
+        path = self._index_file(user_id)
+        if not path.exists():
+            return []
+        data = path.read_bytes()
+        limit_ts = date_to.timestamp() if date_to is not None else math.inf
+        offsets = [off for off, ts, _code in _IDX.iter_unpack(data) if ts <= limit_ts]
+        events: list[dict[str, Any]] = []
+        with span("ledger.user_events", user_id=user_id, events=len(offsets)), self.path.open("rb") as f:
+            for off in offsets:
+                f.seek(off)
+                events.append(json.loads(f.readline()))
+        return events
+
+    # --- восстановление ---
+    def _load_snapshot(self) -> LedgerState:
+        data = load_json(self.snapshot_path, default=None)
+        if not isinstance(data, dict):
+            return LedgerState()
+        balances = data.get("balances")
+        return LedgerState(
+            balances={
+                int(uid): {str(c): float(v) for c, v in bal.items()}
+                for uid, bal in (balances.items() if isinstance(balances, dict) else ())
+            },
+            offset=int(data.get("offset", 0)),
+            events=int(data.get("events", 0)),
+        )
+
+    def replay(self, from_snapshot: bool = True) -> LedgerState:
+        """Состояние: последний снимок + события журнала после его смещения."""
+        state = self._load_snapshot() if from_snapshot else LedgerState()
+        if not self.path.exists():
+            return state
+        balances = state.balances
+        mismatches = state.mismatches
+        offset = state.offset
+        replayed = 0
+        corrupt = 0
+        with span("ledger.replay", offset=state.offset), self.path.open("rb") as f:
+            f.seek(state.offset)
+            while batch := list(islice(f, _REPLAY_BATCH)):
+                partial = not batch[-1].endswith(b"\n")
+                if partial:
+                    batch.pop()  # недописанная строка: процесс упал во время записи
+                offset += sum(map(len, batch))
+                try:
+                    # один json.loads на пачку строк заметно быстрее построчного разбора
+                    events = json.loads(b"[" + b",".join(batch) + b"]") if batch else []
+                except ValueError:
+                    # пустая или повреждённая строка в пачке (оборванная запись, после
+                    # которой журнал дописывали дальше): разбираем пачку построчно
+                    events = []
+                    for line in batch:
+                        if not line.strip():
+                            continue
+                        try:
+                            events.append(json.loads(line))
+                        except ValueError:
+                            corrupt += 1
+                for ev in events:
+                    try:
+                        user_id, code, before, after = ev["user_id"], ev["currency"], ev["before"], ev["after"]
+                    except (KeyError, TypeError):
+                        corrupt += 1
+                        continue
+                    wallets = balances.get(user_id)
+                    if wallets is None:
+                        wallets = balances[user_id] = {}
+                    prev = wallets.get(code, 0.0)
+                    if abs(prev - before) > _EPS:
+                        mismatches.append({**ev, "expected_before": prev})
+                    wallets[code] = after
+                    replayed += 1
+                if partial:
+                    break
+        state.offset = offset
+        state.replayed = replayed
+        state.corrupt = corrupt
+        state.events += replayed
+        return state
+
+    def reconcile(self) -> list[dict[str, Any]]:
+        """Расхождения между журналом и portfolios.json."""
+        state = self.replay()
+        actual = _portfolio_balances()
+        diffs: list[dict[str, Any]] = []
+        for uid in sorted(state.balances.keys() | actual.keys()):
+            ledger_w = state.balances.get(uid, {})
+            actual_w = actual.get(uid, {})
+            for code in sorted(ledger_w.keys() | actual_w.keys()):
+                a, b = ledger_w.get(code, 0.0), actual_w.get(code, 0.0)
+                if abs(a - b) > _EPS:
+                    diffs.append({"user_id": uid, "currency": code, "ledger": a, "portfolio": b})
+        return diffs
+
+
+_ledger: TradeLedger | None = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger() -> TradeLedger:
+    global _ledger
+    if _ledger is None:
+        with _ledger_lock:
+            if _ledger is None:
+                settings = SettingsLoader()
+                _ledger = TradeLedger(
+                    settings.get("ledger_file"),
+                    settings.get("ledger_snapshot_file"),
+                    settings.get("ledger_snapshot_every", 1000),
+                )
+    return _ledger
@@ -1,9 +1,13 @@
 from __future__ import annotations
 
+from dataclasses import dataclass, field
 from datetime import datetime
 import hashlib
-from typing import Any
+import math
+from operator import mul
+from typing import Any, Iterable, Mapping
 from valutatrade_hub.core.exceptions import InsufficientFundsError
+from valutatrade_hub.core.rates import RateProvider, SnapshotRateProvider
 
 
 class ValidationError(ValueError):
@@ -11,6 +15,8 @@ class ValidationError(ValueError):
 
 
 class User:
+    __slots__ = ("_user_id", "_username", "_hashed_password", "_salt", "_registration_date")
+
     def __init__(
         self,
         user_id: int,
@@ -87,8 +93,29 @@ class User:
             raise ValidationError("пароль должен быть длиннее 4 символов")
         self._hashed_password = self._hash_password(new_password, self._salt)
 
+    def freeze(self) -> FrozenUser:
+        return FrozenUser(
+            self._user_id, self._username, self._hashed_password, self._salt, self._registration_date
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class FrozenUser:
+    """Неизменяемый снимок пользователя для отчётов и выгрузок."""
+
+    user_id: int
+    username: str
+    hashed_password: str = field(repr=False)
+    salt: str = field(repr=False)
+    registration_date: datetime
+
+    def to_user(self) -> User:
+        return User(self.user_id, self.username, self.hashed_password, self.salt, self.registration_date)
+
 
 class Wallet:
+    __slots__ = ("currency_code", "_balance")
+
     def __init__(self, currency_code: str, balance: float = 0.0) -> None:
         if not isinstance(currency_code, str):
             raise ValidationError("currency_code должен быть строкой")
@@ -140,8 +167,24 @@ class Wallet:
     def get_balance_info(self) -> str:
         return f"{self.currency_code}: {self._balance:.4f}"
 
+    def freeze(self) -> FrozenWallet:
+        return FrozenWallet(self.currency_code, self._balance)
+
+
+@dataclass(frozen=True, slots=True)
+class FrozenWallet:
+    """Неизменяемый снимок кошелька для отчётов и выгрузок."""
+
+    currency_code: str
+    balance: float
+
+    def to_wallet(self) -> Wallet:
+        return Wallet(self.currency_code, self.balance)
+
 
 class Portfolio:
+    __slots__ = ("_user", "_user_id", "_wallets")
+
     def __init__(self, user: User, wallets: dict[str, Wallet] | None = None) -> None:
         if not isinstance(user, User):
             raise ValidationError("user должен быть зарегистрирован")
@@ -189,38 +232,125 @@ class Portfolio:
             return None
         return self._wallets.get(code)
 
-    def get_total_value(self, base_currency: str = "USD") -> float:
-        base = str(base_currency).strip().upper()
-        if not base:
+    def _balances(self) -> tuple[list[str], list[float]]:
+        codes = list(self._wallets)
+        return codes, [w.balance for w in self._wallets.values()]
+
+    def get_total_values(
+        self, bases: Iterable[str], rates: RateProvider | None = None
+    ) -> dict[str, float]:
+        """
+        Стоимость портфеля сразу в нескольких базах. По умолчанию курсы
+        берутся из кэша (rates.json) одним снимком на весь вызов.
+        """
+        bases_norm = [str(b).strip().upper() for b in bases]
+        if not all(bases_norm):
             raise ValidationError("base_currency не может быть пустым")
-
-        exchange_rates: dict[str, float] = {
-            "USD_USD": 1.0,
-            "EUR_USD": 1.08,
-            "BTC_USD": 59337.21,
-            "ETH_USD": 3720.00,
-            "RUB_USD": 0.01016,
+        provider = rates if rates is not None else SnapshotRateProvider()
+        codes, balances = self._balances()
+        return {
+            base: math.fsum(map(mul, balances, provider.rates_to(base, codes)))
+            for base in bases_norm
         }
 
-        def to_usd(code: str, amount: float) -> float:
-            pair = f"{code}_USD"
-            rate = exchange_rates.get(pair)
-            if rate is None:
-                raise ValidationError(f"курс недоступен для {code}->USD")
-            return amount * rate
-
-        total_usd = 0.0
-        for code, wallet in self._wallets.items():
-            if code == "USD":
-                total_usd += wallet.balance
-            else:
-                total_usd += to_usd(code, wallet.balance)
-
-        if base == "USD":
-            return total_usd
-
-        base_pair = f"{base}_USD"
-        base_rate = exchange_rates.get(base_pair)
-        if base_rate is None:
-            raise ValidationError(f"курс недоступен для USD->{base}")
-        return total_usd / base_rate
\ No newline at end of file
+    def get_total_value(self, base_currency: str = "USD", rates: RateProvider | None = None) -> float:
+        base = str(base_currency).strip().upper()
+        return self.get_total_values([base], rates)[base]
+
+    def freeze(self) -> FrozenPortfolio:
+        codes, balances = self._balances()
+        return FrozenPortfolio(self._user_id, tuple(map(FrozenWallet, codes, balances)))
+
+
+@dataclass(frozen=True, slots=True)
+class FrozenPortfolio:
+    """Неизменяемый снимок портфеля: user_id и кортеж FrozenWallet, без User."""
+
+    user_id: int
+    wallets: tuple[FrozenWallet, ...]
+
+    def balance_of(self, currency_code: str) -> float:
+        code = str(currency_code).strip().upper()
+        return next((w.balance for w in self.wallets if w.currency_code == code), 0.0)
+
+    def get_total_value(self, base_currency: str = "USD", rates: RateProvider | None = None) -> float:
+        base = str(base_currency).strip().upper()
+        provider = rates if rates is not None else SnapshotRateProvider()
+        codes = [w.currency_code for w in self.wallets]
+        return math.fsum(map(mul, (w.balance for w in self.wallets), provider.rates_to(base, codes)))
+
+
+class LazyPortfolio(Portfolio):
+    """
+    Портфель поверх строки portfolios.json: объекты Wallet создаются
+    только при обращении к конкретному кошельку. User не обязателен —
+    отчётам по всем портфелям достаточно user_id.
+    """
+
+    __slots__ = ("_raw",)
+
+    def __init__(self, user_id: int, raw_wallets: Mapping[str, Any], user: User | None = None) -> None:
+        if user is not None and not isinstance(user, User):
+            raise ValidationError("user должен быть зарегистрирован")
+        self._user = user  # type: ignore[assignment]
+        self._user_id = int(user_id)
+        self._wallets = {}
+        if not all(isinstance(k, str) and k == k.strip().upper() for k in raw_wallets):
+            # ключи нормализуются один раз; обычно они уже в верхнем регистре, и копии нет
+            raw_wallets = {str(k).strip().upper(): v for k, v in raw_wallets.items()}
+        self._raw = raw_wallets
+
+    @classmethod
+    def from_row(cls, row: Mapping[str, Any], user: User | None = None) -> LazyPortfolio:
+        wallets = row.get("wallets")
+        return cls(int(row["user_id"]), wallets if isinstance(wallets, Mapping) else {}, user)
+
+    def _hydrate(self, code: str) -> Wallet | None:
+        wallet = self._wallets.get(code)
+        if wallet is None:
+            payload = self._raw.get(code)
+            if payload is None:
+                return None
+            balance = payload.get("balance", 0.0) if isinstance(payload, Mapping) else payload
+            wallet = self._wallets[code] = Wallet(code, balance)
+        return wallet
+
+    def currency_codes(self) -> list[str]:
+        codes = list(self._raw)
+        codes.extend(c for c in self._wallets if c not in self._raw)
+        return codes
+
+    def balance_of(self, currency_code: str) -> float:
+        """Баланс без создания Wallet (для массовых расчётов)."""
+        code = str(currency_code).strip().upper()
+        wallet = self._wallets.get(code)
+        if wallet is not None:
+            return wallet.balance
+        payload = self._raw.get(code)
+        if payload is None:
+            return 0.0
+        return float(payload.get("balance", 0.0) if isinstance(payload, Mapping) else payload)
+
+    def _hydrate_all(self) -> None:
+        for code in self._raw:
+            self._hydrate(code)
+
+    @property
+    def wallets(self) -> dict[str, Wallet]:
+        self._hydrate_all()
+        return dict(self._wallets)
+
+    def add_currency(self, currency_code: str) -> Wallet:
+        if isinstance(currency_code, str) and currency_code.strip().upper() in self._raw:
+            raise ValidationError(f"кошелек '{currency_code.strip().upper()}' уже существует")
+        return super().add_currency(currency_code)
+
+    def get_wallet(self, currency_code: str) -> Wallet | None:
+        code = str(currency_code).strip().upper()
+        if not code:
+            return None
+        return self._hydrate(code)
+
+    def _balances(self) -> tuple[list[str], list[float]]:
+        codes = self.currency_codes()
+        return codes, [self.balance_of(code) for code in codes]
\ No newline at end of file
@@ -0,0 +1,367 @@
+"""
+Отложенные ордера: limit и stop, исполняемые при обновлении курсов.
+
+BUY limit и SELL stop срабатывают, когда курс опускается до цены ордера
+(rate <= price), SELL limit и BUY stop — когда поднимается (rate >= price).
+Для каждой пары это две книги, отсортированные так, что сработавшие ордера
+всегда лежат в хвосте списка: bisect находит границу, хвост отрезается.
+Поэтому стоимость сопоставления — O(log n + k) по числу сработавших k,
+а не по числу всех ордеров. Сработавшие ордера исполняются одним пакетом:
+одна запись portfolios.json и одна запись в журнал сделок на обновление.
+
+Сработавшие ордера снимаются с книги (и попадают в "executing" в
+orders.json) до записи portfolios.json, поэтому сбой посреди исполнения не
+приводит к повторному исполнению. Пакет, оставшийся в "executing" после
+сбоя, при следующем обновлении попадает в order_fills со статусом
+interrupted: исполнился ли он, показывает ledger-check.
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+import json
+import logging
+import math
+import os
+from pathlib import Path
+import threading
+from typing import Any, Iterable, Iterator
+
+from valutatrade_hub.core.exceptions import ApiRequestError, InsufficientFundsError
+from valutatrade_hub.core.ledger import Trade, get_ledger
+from valutatrade_hub.core.models import ValidationError, Wallet
+from valutatrade_hub.core.rates import SnapshotRateProvider
+from valutatrade_hub.core.utils import load_json, now_iso
+from valutatrade_hub.infra.database import DatabaseManager
+from valutatrade_hub.infra.settings import SettingsLoader
+from valutatrade_hub.infra.tracing import span
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore[assignment]
+
+logger = logging.getLogger("valutatrade")
+
+SIDES = ("BUY", "SELL")
+KINDS = ("limit", "stop")
+
+
+@dataclass(frozen=True, slots=True)
+class Order:
+    order_id: int
+    user_id: int
+    side: str  # BUY / SELL
+    kind: str  # limit / stop
+    currency: str
+    base: str
+    amount: float
+    price: float  # цена 1 currency в base
+    created_at: str
+
+    @property
+    def pair(self) -> str:
+        return f"{self.currency}_{self.base}"
+
+    @property
+    def fires_below(self) -> bool:
+        """True — срабатывает при rate <= price, False — при rate >= price."""
+        return (self.side == "BUY") == (self.kind == "limit")
+
+
+class _Book:
+    """
+    Одна сторона пары. keys — price (fires_below) или -price (иначе), по
+    возрастанию; сработавшие при курсе rate — хвост с key >= bound(rate).
+    Равные цены идут в порядке выставления.
+    """
+
+    __slots__ = ("sign", "keys", "ids")
+
+    def __init__(self, sign: float) -> None:
+        self.sign = sign
+        self.keys: list[float] = []
+        self.ids: list[int] = []
+
+    def add(self, price: float, order_id: int) -> None:
+        key = self.sign * price
+        i = bisect_right(self.keys, key)
+        self.keys.insert(i, key)
+        self.ids.insert(i, order_id)
+
+    def remove(self, price: float, order_id: int) -> None:
+        key = self.sign * price
+        i = bisect_left(self.keys, key)
+        while i < len(self.keys) and self.keys[i] == key:
+            if self.ids[i] == order_id:
+                del self.keys[i]
+                del self.ids[i]
+                return
+            i += 1
+
+    def pop_triggered(self, rate: float) -> list[int]:
+        i = bisect_left(self.keys, self.sign * rate)
+        if i == len(self.keys):
+            return []
+        ids = self.ids[i:]
+        del self.keys[i:]
+        del self.ids[i:]
+        return ids
+
+
+class _PairBooks:
+    __slots__ = ("below", "above")
+
+    def __init__(self) -> None:
+        self.below = _Book(1.0)
+        self.above = _Book(-1.0)
+
+    def side(self, order: Order) -> _Book:
+        return self.below if order.fires_below else self.above
+
+    def __bool__(self) -> bool:
+        return bool(self.below.keys or self.above.keys)
+
+
+class OrderBook:
+    def __init__(self, path: Path, fills_path: Path) -> None:
+        self.path = path
+        self.fills_path = fills_path
+        self._lock = threading.Lock()
+        self._stat: tuple[int, int, int] | None = None
+        self._orders: dict[int, Order] = {}
+        self._last_id = 0  # id не переиспользуются: по ним ссылаются записи order_fills
+        self._books: dict[str, _PairBooks] = {}
+        self._executing: list[dict[str, Any]] = []  # снятые с книги, но ещё не записанные в fills
+
+    # --- хранение ---
+    def _file_key(self) -> tuple[int, int, int] | None:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    @contextmanager
+    def _locked(self, exclusive: bool = False) -> Iterator[None]:
+        # ордера выставляют другие процессы (CLI), а исполняет процесс обновления
+        # курсов: чтение-изменение-запись orders.json — под flock на orders.json.lock
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        lock_path = self.path.with_name(self.path.name + ".lock")
+        with self._lock, open(lock_path, "a+b") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                self._refresh()
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _refresh(self) -> None:
+        key = self._file_key()
+        if key is not None and key == self._stat:
+            return
+        data = load_json(self.path, default={})
+        rows = data.get("orders") if isinstance(data, dict) else data  # список — формат без last_id
+        orders: dict[int, Order] = {}
+        for row in rows if isinstance(rows, list) else []:
+            try:
+                order = Order(**row)
+            except TypeError:
+                continue
+            orders[order.order_id] = order
+        books: dict[str, _PairBooks] = {}
+        # по id — порядок выставления сохраняется среди равных цен
+        for order in sorted(orders.values(), key=lambda o: o.order_id):
+            books.setdefault(order.pair, _PairBooks()).side(order).add(order.price, order.order_id)
+        self._last_id = max(int(data.get("last_id", 0)) if isinstance(data, dict) else 0, *orders, 0)
+        executing = data.get("executing") if isinstance(data, dict) else None
+        self._executing = [r for r in executing if isinstance(r, dict)] if isinstance(executing, list) else []
+        self._orders, self._books, self._stat = orders, books, key
+
+    def _save(self) -> None:
+        rows = [asdict(o) for o in sorted(self._orders.values(), key=lambda o: o.order_id)]
+        data: dict[str, Any] = {"last_id": self._last_id, "orders": rows}
+        if self._executing:
+            data["executing"] = self._executing
+        # через временный файл: читатели без блокировки не видят недописанный JSON
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        os.replace(tmp, self.path)
+        self._stat = self._file_key()
+
+    # --- управление ордерами ---
+    def place(
+        self, user_id: int, side: str, kind: str, currency: str, base: str, amount: float, price: float
+    ) -> Order:
+        if side not in SIDES:
+            raise ValueError(f"side должен быть одним из: {', '.join(SIDES)}")
+        if kind not in KINDS:
+            raise ValueError(f"type должен быть одним из: {', '.join(KINDS)}")
+        if currency == base:
+            raise ValueError("Валюта ордера и базовая валюта совпадают")
+        # nan/inf нарушили бы порядок книги: bisect вернул бы чужие ордера
+        if not (math.isfinite(amount) and math.isfinite(price)) or amount <= 0 or price <= 0:
+            raise ValueError("Количество и цена должны быть положительными числами")
+        with self._locked(exclusive=True):
+            order = Order(
+                order_id=self._last_id + 1,
+                user_id=int(user_id),
+                side=side,
+                kind=kind,
+                currency=currency,
+                base=base,
+                amount=float(amount),
+                price=float(price),
+                created_at=now_iso(),
+            )
+            self._orders[order.order_id] = order
+            self._last_id = order.order_id
+            self._books.setdefault(order.pair, _PairBooks()).side(order).add(order.price, order.order_id)
+            self._save()
+            return order
+
+    def cancel(self, user_id: int, order_id: int) -> bool:
+        with self._locked(exclusive=True):
+            order = self._orders.get(int(order_id))
+            if order is None or order.user_id != int(user_id):
+                return False
+            self._orders.pop(order.order_id)
+            self._books[order.pair].side(order).remove(order.price, order.order_id)
+            self._save()
+            return True
+
+    def list_for(self, user_id: int) -> list[Order]:
+        with self._locked():
+            return sorted(
+                (o for o in self._orders.values() if o.user_id == int(user_id)),
+                key=lambda o: o.order_id,
+            )
+
+    # --- исполнение ---
+    def on_rates(self, changes: dict[str, tuple[float, float]]) -> list[dict[str, Any]]:
+        """
+        Слушатель RatesUpdater: курсы берутся из только что записанного снимка
+        (прямая, обратная пара или кросс через USD). Возвращает записи исполнений.
+        """
+        with self._locked(exclusive=True), span("orders.match", pairs=len(self._books)):
+            rates = SnapshotRateProvider(DatabaseManager().read_rates())
+            # курс пары (в т.ч. обратный или кросс) мог измениться, только если
+            # изменилась пара с одной из её валют
+            touched = {code for pair in changes for code in pair.split("_", 1)}
+            fired: list[tuple[Order, float]] = []
+            for pair, books in self._books.items():
+                frm, to = pair.split("_", 1)
+                if not books or (frm not in touched and to not in touched):
+                    continue
+                try:
+                    rate = rates.rate(frm, to)
+                except ApiRequestError:
+                    continue
+                for side in (books.below, books.above):
+                    fired.extend((self._orders.pop(i), rate) for i in side.pop_triggered(rate))
+            fills = self._interrupted()
+            if fired:
+                fired.sort(key=lambda item: item[0].order_id)
+                # снять ордера с книги до записи portfolios.json: после сбоя
+                # посреди исполнения они не исполнятся второй раз
+                self._executing = [{**asdict(o), "rate": rate} for o, rate in fired]
+                self._save()
+                fills += self._execute(fired)
+            if not fills:
+                return []
+            self.fills_path.parent.mkdir(parents=True, exist_ok=True)
+            with self.fills_path.open("a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in fills))
+            self._executing = []
+            self._save()
+        logger.info(
+            "ORDERS исполнено: %s, отклонено: %s",
+            sum(r["status"] == "filled" for r in fills),
+            sum(r["status"] == "rejected" for r in fills),
+        )
+        return fills
+
+    def _interrupted(self) -> list[dict[str, Any]]:
+        """Записи fills для пакета, исполнение которого прервал сбой процесса."""
+        if not self._executing:
+            return []
+        logger.warning("ORDERS исполнение %s ордеров было прервано сбоем", len(self._executing))
+        now = now_iso()
+        return [
+            {
+                **rec,
+                "executed_at": now,
+                "status": "interrupted",
+                "reason": "исполнение прервано сбоем; проверьте баланс (ledger-check)",
+            }
+            for rec in self._executing
+        ]
+
+    def _execute(self, fired: Iterable[tuple[Order, float]]) -> list[dict[str, Any]]:
+        """Пакет исполнений: одна запись portfolios.json и одна — в журнал сделок."""
+        db = DatabaseManager()
+        executed_at = now_iso()
+        fills: list[dict[str, Any]] = []
+        trades: list[Trade] = []
+        with db.lock:
+            portfolios = list(db.read_portfolios())
+            positions = {int(p.get("user_id", -1)): i for i, p in enumerate(portfolios)}
+            for order, rate in fired:
+                i = positions.get(order.user_id)
+                if i is None:
+                    portfolios.append({"user_id": order.user_id, "wallets": {}})
+                    i = positions[order.user_id] = len(portfolios) - 1
+                row = portfolios[i]
+                wallets = dict(row.get("wallets") or {})
+                before = float(wallets.get(order.currency, {}).get("balance", 0.0))
+                wallet = Wallet(order.currency, before)
+                fill = {**asdict(order), "rate": rate, "executed_at": executed_at}
+                try:
+                    if order.side == "BUY":
+                        wallet.deposit(order.amount)
+                    else:
+                        wallet.withdraw(order.amount)
+                except (InsufficientFundsError, ValidationError) as e:
+                    fills.append({**fill, "status": "rejected", "reason": str(e)})
+                    continue
+                wallets[order.currency] = {"balance": wallet.balance}
+                portfolios[i] = {**row, "wallets": wallets}
+                trades.append(
+                    (order.side, order.user_id, order.currency, order.amount,
+                     before, wallet.balance, order.base, rate)
+                )
+                fills.append({**fill, "status": "filled", "before": before, "after": wallet.balance})
+            if trades:
+                db.write_portfolios(portfolios)
+        get_ledger().record_many(trades)
+        return fills
+
+    def fills_for(self, user_id: int, limit: int = 20) -> list[dict[str, Any]]:
+        if not self.fills_path.exists():
+            return []
+        out: list[dict[str, Any]] = []
+        with self.fills_path.open(encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    rec = json.loads(line)
+                    if rec.get("user_id") == int(user_id):
+                        out.append(rec)
+        return out[-limit:][::-1]
+
+
+_book: OrderBook | None = None
+_book_lock = threading.Lock()
+
+
+def get_order_book() -> OrderBook:
+    global _book
+    if _book is None:
+        with _book_lock:
+            if _book is None:
+                settings = SettingsLoader()
+                _book = OrderBook(settings.get("orders_file"), settings.get("order_fills_file"))
+    return _book
@@ -0,0 +1,124 @@
+"""
+Источники курсов для оценки портфелей.
+
+RateProvider отдаёт курс from→to и вектор курсов набора валют к базе.
+SnapshotRateProvider работает поверх кэша курсов (rates.json): снимок
+читается один раз, поэтому вся оценка идёт по согласованным курсам.
+"""
+
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Iterable, Mapping
+
+from valutatrade_hub.core.exceptions import ApiRequestError
+from valutatrade_hub.infra.database import DatabaseManager
+from valutatrade_hub.infra.settings import SettingsLoader
+
+PIVOT = "USD"
+
+
+class RateProvider(ABC):
+    @abstractmethod
+    def rate(self, from_code: str, to_code: str) -> float:
+        """Сколько единиц to_code стоит одна единица from_code."""
+        raise NotImplementedError
+
+    def rates_to(self, base: str, codes: Iterable[str]) -> list[float]:
+        """Курсы codes к base в том же порядке."""
+        base_c = base.strip().upper()
+        return [1.0 if code == base_c else self.rate(code, base_c) for code in codes]
+
+
+class MappingRateProvider(RateProvider):
+    """Курсы в единой валюте-опоре: {code: стоимость 1 code в pivot}."""
+
+    def __init__(self, rates: Mapping[str, float], pivot: str = PIVOT) -> None:
+        self._pivot = pivot.strip().upper()
+        self._rates = {str(k).strip().upper(): float(v) for k, v in rates.items()}
+        self._rates[self._pivot] = 1.0
+
+    def rate(self, from_code: str, to_code: str) -> float:
+        frm, to = from_code.strip().upper(), to_code.strip().upper()
+        if frm == to:
+            return 1.0
+        try:
+            return self._rates[frm] / self._rates[to]
+        except (KeyError, ZeroDivisionError):
+            raise ApiRequestError(f"Курс {frm}→{to} недоступен") from None
+
+
+class SnapshotRateProvider(RateProvider):
+    """
+    Курс ищется как прямая пара FROM_TO, обратная TO_FROM (1/rate) или
+    кросс-курс через USD. При strict=True устаревшие пары (старше
+    rates_ttl_seconds) не используются — как в get_rate.
+    """
+
+    def __init__(self, snapshot: Mapping[str, Any] | None = None, strict: bool = True) -> None:
+        if snapshot is None:
+            snapshot = DatabaseManager().read_rates()
+        pairs = snapshot.get("pairs") if isinstance(snapshot, Mapping) else None
+        self._pairs: Mapping[str, Any] = pairs if isinstance(pairs, Mapping) else {}
+        self._ttl = int(SettingsLoader().get("rates_ttl_seconds", 300)) if strict else None
+        self._now = datetime.now()
+        self._memo: dict[str, Mapping[str, Any] | None] = {}
+
+    def _pair(self, frm: str, to: str) -> Mapping[str, Any] | None:
+        key = f"{frm}_{to}"
+        if key in self._memo:
+            return self._memo[key]
+        item = self._pairs.get(key)
+        value: Mapping[str, Any] | None = None
+        if isinstance(item, Mapping) and isinstance(item.get("rate"), (int, float)) and item["rate"] > 0:
+            if self._ttl is None or self._fresh(item.get("updated_at")):
+                value = item
+        self._memo[key] = value
+        return value
+
+    @staticmethod
+    def _timestamp(updated_at: Any) -> datetime | None:
+        if not isinstance(updated_at, str):
+            return None
+        try:
+            return datetime.fromisoformat(updated_at.replace("Z", "+00:00")).replace(tzinfo=None)
+        except ValueError:
+            return None
+
+    def _fresh(self, updated_at: Any) -> bool:
+        ts = self._timestamp(updated_at)
+        return ts is not None and (self._now - ts).total_seconds() <= self._ttl
+
+    def _direct(self, frm: str, to: str) -> list[tuple[float, Mapping[str, Any]]] | None:
+        item = self._pair(frm, to)
+        if item is not None:
+            return [(float(item["rate"]), item)]
+        inverse = self._pair(to, frm)
+        return [(1.0 / float(inverse["rate"]), inverse)] if inverse is not None else None
+
+    def quote(self, from_code: str, to_code: str) -> dict[str, Any]:
+        """
+        Курс from→to с происхождением: updated_at — самой старой из
+        использованных пар, source — их источники через «+».
+        """
+        frm, to = from_code.strip().upper(), to_code.strip().upper()
+        if frm == to:
+            return {"rate": 1.0, "updated_at": None, "source": "Local"}
+        legs = self._direct(frm, to)
+        if legs is None and PIVOT not in (frm, to):
+            leg_in, leg_out = self._direct(frm, PIVOT), self._direct(PIVOT, to)
+            if leg_in is not None and leg_out is not None:
+                legs = leg_in + leg_out
+        if legs is None:
+            raise ApiRequestError(f"Курс {frm}→{to} недоступен в кэше. Выполните 'update-rates'.")
+        rate = 1.0
+        for leg_rate, _ in legs:
+            rate *= leg_rate
+        items = [item for _, item in legs]
+        oldest = min(items, key=lambda i: self._timestamp(i.get("updated_at")) or datetime.min)
+        sources = dict.fromkeys(str(i.get("source", "Unknown")) for i in items)
+        return {"rate": rate, "updated_at": oldest.get("updated_at"), "source": "+".join(sources)}
+
+    def rate(self, from_code: str, to_code: str) -> float:
+        return self.quote(from_code, to_code)["rate"]
@@ -0,0 +1,129 @@
+"""
+Временные ряды: стоимость портфеля на равномерной сетке времени.
+
+Балансы (из журнала сделок) и курсы (из истории exchange_rates.json) —
+отсортированные по времени массивы. Значение на каждом узле сетки берётся
+as-of: последнее известное на этот момент. Поиск — bisect по массиву
+отметок времени для всей сетки разом, без вызовов get_rate на каждую точку.
+"""
+
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+import math
+from typing import Any, Iterable, Sequence
+
+_NAN = float("nan")
+PIVOT = "USD"
+
+
+def _epoch(value: str) -> float:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def make_grid(start: float, end: float, step: float) -> array:
+    if step <= 0:
+        raise ValueError("Шаг должен быть положительным")
+    if end < start:
+        raise ValueError("Начало периода позже конца")
+    count = int((end - start) // step) + 1
+    grid = array("d", (start + i * step for i in range(count)))
+    if grid[-1] < end:
+        grid.append(end)  # последняя точка — конец периода (обычно «сейчас»)
+    return grid
+
+
+def asof(
+    grid: Sequence[float], ts: Sequence[float], values: Sequence[float], default: float = _NAN
+) -> list[float]:
+    """values[последний ts <= t] для каждого t из grid (ts отсортированы)."""
+    if not ts:
+        return [default] * len(grid)
+    idx = [bisect_right(ts, t) - 1 for t in grid]
+    return [values[i] if i >= 0 else default for i in idx]
+
+
+class RateHistory:
+    """История курсов по парам: pair -> (отметки времени, курсы), по возрастанию."""
+
+    def __init__(self, records: Iterable[dict[str, Any]]) -> None:
+        raw: dict[str, list[tuple[float, float]]] = {}
+        for r in records:
+            try:
+                pair = f"{str(r['from_currency']).upper()}_{str(r['to_currency']).upper()}"
+                raw.setdefault(pair, []).append((_epoch(r["timestamp"]), float(r["rate"])))
+            except (KeyError, TypeError, ValueError):
+                continue
+        self._series: dict[str, tuple[array, array]] = {}
+        for pair, points in raw.items():
+            points.sort()
+            self._series[pair] = (
+                array("d", (p[0] for p in points)),
+                array("d", (p[1] for p in points)),
+            )
+
+    def _direct(self, frm: str, to: str, grid: Sequence[float]) -> list[float] | None:
+        series = self._series.get(f"{frm}_{to}")
+        if series is not None:
+            return asof(grid, *series)
+        series = self._series.get(f"{to}_{frm}")
+        if series is not None:
+            return [1.0 / r if r else _NAN for r in asof(grid, *series)]
+        return None
+
+    def on_grid(self, frm: str, to: str, grid: Sequence[float]) -> list[float]:
+        """Курс frm→to в узлах сетки: прямая пара, обратная или кросс через USD."""
+        if frm == to:
+            return [1.0] * len(grid)
+        rates = self._direct(frm, to, grid)
+        if rates is None and PIVOT not in (frm, to):
+            leg_in, leg_out = self._direct(frm, PIVOT, grid), self._direct(PIVOT, to, grid)
+            if leg_in is not None and leg_out is not None:
+                rates = [a * b for a, b in zip(leg_in, leg_out)]
+        return rates if rates is not None else [_NAN] * len(grid)
+
+
+def balance_on_grid(
+    events: Sequence[dict[str, Any]], grid: Sequence[float], current: float
+) -> list[float]:
+    """
+    Баланс одной валюты в узлах сетки по её событиям журнала (по времени).
+    До первого события — его before; без событий — текущий баланс.
+    """
+    if not events:
+        return [current] * len(grid)
+    ts = array("d", (_epoch(e["ts"]) for e in events))
+    after = array("d", (float(e["after"]) for e in events))
+    return asof(grid, ts, after, default=float(events[0]["before"]))
+
+
+def portfolio_value_series(
+    events: Iterable[dict[str, Any]],
+    current_balances: dict[str, float],
+    history: RateHistory,
+    base: str,
+    grid: Sequence[float],
+) -> list[float]:
+    """Стоимость портфеля в base в узлах сетки; NaN — курс на момент неизвестен."""
+    by_currency: dict[str, list[dict[str, Any]]] = {}
+    for ev in events:
+        by_currency.setdefault(ev["currency"], []).append(ev)
+
+    totals = [0.0] * len(grid)
+    for code in by_currency.keys() | current_balances.keys():
+        balances = balance_on_grid(by_currency.get(code, []), grid, current_balances.get(code, 0.0))
+        if not any(balances):
+            continue
+        rates = history.on_grid(code, base, grid)
+        # нулевой баланс не требует курса: 0 * NaN не должен портить сумму
+        totals = [t + b * r if b else t for t, b, r in zip(totals, balances, rates)]
+    return totals
+
+
+def summarize(values: Sequence[float]) -> dict[str, float | None]:
+    known = [v for v in values if not math.isnan(v)]
+    if not known:
+        return {"first": None, "last": None, "min": None, "max": None}
+    return {"first": known[0], "last": known[-1], "min": min(known), "max": max(known)}
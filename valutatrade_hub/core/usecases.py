@@ -1,31 +1,36 @@
 from __future__ import annotations
 
-from datetime import datetime
+from contextlib import contextmanager
+from dataclasses import asdict
+from datetime import datetime, timedelta
+import math
 import secrets
-from typing import Any
+from typing import Any, Iterator
 
 from valutatrade_hub.core.models import User, ValidationError
 from valutatrade_hub.core.utils import (
     PORTFOLIOS_PATH,
-    USERS_PATH,
+    StorageError,
     ensure_data_files,
     load_json,
     save_json,
 )
 
 
+from valutatrade_hub.core.alerts import get_alert_engine
 from valutatrade_hub.core.currencies import get_currency
-from valutatrade_hub.core.exceptions import ApiRequestError, CurrencyNotFoundError
+from valutatrade_hub.core.exceptions import ApiRequestError, AuthError, CurrencyNotFoundError
+from valutatrade_hub.core.ledger import get_ledger
+from valutatrade_hub.core.orders import get_order_book
+from valutatrade_hub.core.rates import SnapshotRateProvider
+from valutatrade_hub.core.timeseries import RateHistory, make_grid, portfolio_value_series, summarize
 from valutatrade_hub.decorators import log_action
 from valutatrade_hub.infra.database import DatabaseManager
+from valutatrade_hub.infra.shared_rates import get_shared_rates
 from valutatrade_hub.infra.settings import SettingsLoader
 from valutatrade_hub.core.models import Wallet
 
 
-class AuthError(RuntimeError):
-    """Ошибка login/register."""
-
-
 def _next_user_id(users: list[dict[str, Any]]) -> int:
     if not users:
         return 1
@@ -40,46 +45,51 @@ def register(username: str, password: str) -> str:
     if not isinstance(password, str) or len(password) < 4:
         raise AuthError("Пароль должен быть не короче 4 символов")
 
-    users = load_json(USERS_PATH, default=[])
-    if not isinstance(users, list):
-        raise AuthError("users.json поврежден")
-
+    db = DatabaseManager()
     username_norm = username.strip()
 
-    if any(u.get("username") == username_norm for u in users):
-        raise AuthError(f"Имя пользователя '{username_norm}' уже занято")
+    # read-modify-write под общей блокировкой; списки не меняются на месте
+    # (copy-on-write), чтобы читатели кэша DatabaseManager их не видели
+    with db.lock:
+        users = db.read_users()
+        if not isinstance(users, list):
+            raise AuthError("users.json поврежден")
+
+        if any(u.get("username") == username_norm for u in users):
+            raise AuthError(f"Имя пользователя '{username_norm}' уже занято")
 
-    user_id = _next_user_id(users)
-    salt = secrets.token_hex(8)
-    registration_date = datetime.now()
+        user_id = _next_user_id(users)
+        salt = secrets.token_hex(8)
+        registration_date = datetime.now()
 
 # Временно
-    user = User(
-        user_id=user_id,
-        username=username_norm,
-        hashed_password="",
-        salt=salt,
-        registration_date=registration_date,
-    )
-    user.change_password(password)
-
-    users.append(
-        {
-            "user_id": user.user_id,
-            "username": user.username,
-            "hashed_password": user.hashed_password,
-            "salt": user.salt,
-            "registration_date": user.registration_date.isoformat(),
-        }
-    )
-    save_json(USERS_PATH, users)
+        user = User(
+            user_id=user_id,
+            username=username_norm,
+            hashed_password="",
+            salt=salt,
+            registration_date=registration_date,
+        )
+        user.change_password(password)
+
+        db.write_users(
+            [
+                *users,
+                {
+                    "user_id": user.user_id,
+                    "username": user.username,
+                    "hashed_password": user.hashed_password,
+                    "salt": user.salt,
+                    "registration_date": user.registration_date.isoformat(),
+                },
+            ]
+        )
 
-    portfolios = load_json(PORTFOLIOS_PATH, default=[])
-    if not isinstance(portfolios, list):
-        raise AuthError("portfolios.json поврежден")
+        portfolios = db.read_portfolios()
+        if not isinstance(portfolios, list):
+            raise AuthError("portfolios.json поврежден")
 
-    portfolios.append({"user_id": user.user_id, "wallets": {}})
-    save_json(PORTFOLIOS_PATH, portfolios)
+        db.write_portfolios([*portfolios, {"user_id": user.user_id, "wallets": {}}])
 
     return (
         f"Пользователь '{user.username}' зарегистрирован (id={user.user_id}). "
@@ -95,13 +105,13 @@ def login(username: str, password: str) -> User:
     if not isinstance(password, str) or not password:
         raise AuthError("Password обязателен")
 
-    users = load_json(USERS_PATH, default=[])
-    if not isinstance(users, list):
-        raise AuthError("users.json поврежден")
-
     username_norm = username.strip()
 
-    row = next((u for u in users if u.get("username") == username_norm), None)
+    # потоковый поиск: файл читается только до найденного пользователя
+    try:
+        row = DatabaseManager().find_user(lambda u: u.get("username") == username_norm)
+    except StorageError as e:
+        raise AuthError("users.json поврежден") from e
     if row is None:
         raise AuthError(f"Пользователь '{username_norm}' не найден")
 
@@ -176,17 +186,6 @@ def _save_portfolio_row(updated_row: dict[str, Any]) -> None:
     save_json(PORTFOLIOS_PATH, portfolios)
 
 
-def _default_exchange_rates_usd() -> dict[str, float]:
-    # 1 UNIT = X USD
-    return {
-        "USD_USD": 1.0,
-        "EUR_USD": 1.0786,
-        "BTC_USD": 59337.21,
-        "RUB_USD": 0.01016,
-        "ETH_USD": 3720.00,
-    }
-
-
 def get_rate(from_code: str, to_code: str) -> dict[str, Any]:
     settings = SettingsLoader()
     ttl: int = int(settings.get("rates_ttl_seconds", 300))
@@ -205,16 +204,19 @@ def get_rate(from_code: str, to_code: str) -> dict[str, Any]:
         }
 
     db = DatabaseManager()
-    snapshot = db.read_rates()
-    if not isinstance(snapshot, dict):
-        snapshot = {}
-
-    pairs = snapshot.get("pairs")
-    if not isinstance(pairs, dict):
-        pairs = {}
-
     key = f"{frm}_{to}"
-    cached = pairs.get(key)
+    # сначала снимок в разделяемой памяти (без разбора JSON), если он актуален
+    _fresh, cached = get_shared_rates(db.rates_path).lookup(key)
+    if cached is None:
+        # прямой пары нет (или снимок недоступен): rates.json, в том числе
+        # обратная пара и кросс-курс через USD — как при оценке портфеля
+        snapshot = db.read_rates()
+        for strict in (True, False):  # без strict — чтобы сообщить «устарел», а не «недоступен»
+            try:
+                cached = SnapshotRateProvider(snapshot, strict=strict).quote(frm, to)
+                break
+            except ApiRequestError:
+                continue
 
     if not isinstance(cached, dict):
         raise ApiRequestError(
@@ -278,7 +280,8 @@ def buy(user_id: int, currency_code: str, amount: float, base: str = "USD") -> d
     _save_portfolio_row(db, row)
 
     # оценка стоимости
-    rate_info = get_rate(cur, base_c)  # CurrencyNotFoundError/ApiRequestError
+    with _recorded_trade("BUY", uid, cur, amt, before, after, base_c) as rate_info:
+        rate_info.update(get_rate(cur, base_c))  # CurrencyNotFoundError/ApiRequestError
     estimated_value = amt * float(rate_info["rate"])
 
     return {
@@ -325,7 +328,8 @@ def sell(user_id: int, currency_code: str, amount: float, base: str = "USD") ->
     wallets[cur] = {"balance": after}
     _save_portfolio_row(db, row)
 
-    rate_info = get_rate(cur, base_c)  # CurrencyNotFoundError/ApiRequestError
+    with _recorded_trade("SELL", uid, cur, amt, before, after, base_c) as rate_info:
+        rate_info.update(get_rate(cur, base_c))  # CurrencyNotFoundError/ApiRequestError
     estimated_proceeds = amt * float(rate_info["rate"])
 
     return {
@@ -354,6 +358,7 @@ def show_portfolio(user_id: int, base: str = "USD") -> dict[str, Any]:
 
     items: list[dict[str, Any]] = []
     total = 0.0
+    rates = SnapshotRateProvider()  # один снимок на весь портфель
 
     for code, payload in wallets.items():
         # валидируем код через реестр
@@ -370,7 +375,7 @@ def show_portfolio(user_id: int, base: str = "USD") -> dict[str, Any]:
             value = bal
             updated_at = None
         else:
-            rate_info = get_rate(cur, base_c) 
+            rate_info = rates.quote(cur, base_c)
             rate = float(rate_info["rate"])
             updated_at = rate_info.get("updated_at")
             value = bal * rate
@@ -389,6 +394,147 @@ def show_portfolio(user_id: int, base: str = "USD") -> dict[str, Any]:
     return {"user_id": uid, "base": base_c, "items": items, "total": total}
 
 
+def trade_history(
+    user_id: int,
+    limit: int = 50,
+    before: int | None = None,
+    currency: str | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+) -> dict[str, Any]:
+    """Страница истории сделок пользователя (от новых к старым)."""
+    if not isinstance(limit, int) or not 1 <= limit <= 1000:
+        raise ValueError("limit должен быть от 1 до 1000")
+    cur = _normalize_currency_code(currency) if currency else None
+    items, next_cursor = get_ledger().history(
+        int(user_id), limit=limit, before=before, currency=cur, date_from=date_from, date_to=date_to
+    )
+    return {"user_id": int(user_id), "items": items, "next_cursor": next_cursor}
+
+
+def portfolio_history(
+    user_id: int,
+    base: str = "USD",
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    step_seconds: int = 3600,
+) -> dict[str, Any]:
+    """
+    Стоимость портфеля во времени: балансы из журнала сделок, курсы из
+    истории обновлений (exchange_rates.json), as-of на сетке с шагом step.
+    """
+    from valutatrade_hub.parser_service.config import ParserConfig
+    from valutatrade_hub.parser_service.storage import RatesStorage
+
+    base_c = _normalize_currency_code(base)
+    end = date_to or datetime.now().astimezone()
+    start = date_from or end - timedelta(days=7)
+    grid = make_grid(start.timestamp(), end.timestamp(), float(step_seconds))
+    if len(grid) > 100_000:
+        raise ValueError("Слишком много точек: увеличьте --step или сократите период")
+
+    row = _load_portfolio_row(DatabaseManager(), int(user_id))
+    current = {
+        str(code): float(w.get("balance", 0.0))
+        for code, w in row["wallets"].items()
+        if isinstance(w, dict)
+    }
+    # все события, включая более поздние: их before задаёт баланс в конце периода
+    events = get_ledger().user_events(int(user_id))
+
+    cfg = ParserConfig()
+    history = RateHistory(RatesStorage(cfg.rates_path, cfg.history_path).read_history())
+    values = portfolio_value_series(events, current, history, base_c, grid)
+    return {
+        "user_id": int(user_id),
+        "base": base_c,
+        "step_seconds": step_seconds,
+        "points": [
+            (datetime.fromtimestamp(t).astimezone(), None if math.isnan(v) else v)
+            for t, v in zip(grid, values)
+        ],
+        "summary": summarize(values),
+    }
+
+
+def _normalize_pair(pair: str) -> str:
+    if not isinstance(pair, str) or pair.count("_") != 1:
+        raise ValueError("Пара задаётся в виде FROM_TO, например BTC_USD")
+    frm, to = (_normalize_currency_code(c) for c in pair.split("_"))
+    get_currency(frm)
+    get_currency(to)
+    return f"{frm}_{to}"
+
+
+def add_alert(user_id: int, pair: str, threshold: float, direction: str = "any") -> dict[str, Any]:
+    """Подписка «сообщить, когда курс pair пересечёт threshold»."""
+    try:
+        value = float(threshold)
+    except (TypeError, ValueError) as e:
+        raise ValueError("'threshold' должно быть положительным числом") from e
+    alert = get_alert_engine().add(int(user_id), _normalize_pair(pair), value, direction.strip().lower())
+    return asdict(alert)
+
+
+def list_alerts(user_id: int) -> list[dict[str, Any]]:
+    return [asdict(a) for a in get_alert_engine().list_for(int(user_id))]
+
+
+def remove_alert(user_id: int, alert_id: int) -> None:
+    if not get_alert_engine().remove(int(user_id), int(alert_id)):
+        raise ValueError(f"Оповещение #{alert_id} не найдено")
+
+
+def triggered_alerts(user_id: int, limit: int = 20) -> list[dict[str, Any]]:
+    """Сработавшие оповещения пользователя из outbox, от новых к старым."""
+    if not isinstance(limit, int) or not 1 <= limit <= 1000:
+        raise ValueError("limit должен быть от 1 до 1000")
+    return get_alert_engine().outbox_for(int(user_id), limit=limit)
+
+
+def place_order(
+    user_id: int,
+    side: str,
+    kind: str,
+    currency_code: str,
+    amount: float,
+    price: float,
+    base: str = "USD",
+) -> dict[str, Any]:
+    """
+    Отложенный ордер: исполняется при обновлении курсов, когда курс
+    currency→base достигает price (limit — по цене не хуже, stop — при прорыве).
+    """
+    _find_user_row(DatabaseManager(), int(user_id))
+    cur = _normalize_currency_code(currency_code)
+    base_c = _normalize_currency_code(base)
+    amt = _parse_amount(amount)
+    try:
+        price_val = float(price)
+    except (TypeError, ValueError) as e:
+        raise ValueError("'price' должно быть положительным числом") from e
+    order = get_order_book().place(
+        int(user_id), side.strip().upper(), kind.strip().lower(), cur, base_c, amt, price_val
+    )
+    return asdict(order)
+
+
+def list_orders(user_id: int) -> list[dict[str, Any]]:
+    return [asdict(o) for o in get_order_book().list_for(int(user_id))]
+
+
+def cancel_order(user_id: int, order_id: int) -> None:
+    if not get_order_book().cancel(int(user_id), int(order_id)):
+        raise ValueError(f"Ордер #{order_id} не найден")
+
+
+def order_fills(user_id: int, limit: int = 20) -> list[dict[str, Any]]:
+    """Исполненные и отклонённые ордера пользователя, от новых к старым."""
+    if not isinstance(limit, int) or not 1 <= limit <= 1000:
+        raise ValueError("limit должен быть от 1 до 1000")
+    return get_order_book().fills_for(int(user_id), limit=limit)
+
+
 def _normalize_currency_code(code: str) -> str:
     # Валидация через реестр
     cur = get_currency(code)
@@ -405,10 +551,10 @@ def _parse_amount(amount: float) -> float:
 
 
 def _find_user_row(db: DatabaseManager, user_id: int) -> dict[str, Any]:
-    users = db.read_users()
-    if not isinstance(users, list):
-        raise ApiRequestError("users.json поврежден")
-    row = next((u for u in users if int(u.get("user_id", -1)) == int(user_id)), None)
+    try:
+        row = db.find_user(lambda u: int(u.get("user_id", -1)) == int(user_id))
+    except StorageError as e:
+        raise ApiRequestError("users.json поврежден") from e
     if row is None:
         raise ApiRequestError(f"Пользователь id={user_id} не найден")
     return row
@@ -422,36 +568,39 @@ def _load_portfolio_row(db: DatabaseManager, user_id: int) -> dict[str, Any]:
     row = next((p for p in portfolios if int(p.get("user_id", -1)) == int(user_id)), None)
     if row is None:
         row = {"user_id": int(user_id), "wallets": {}}
-        portfolios.append(row)
-        db.write_portfolios(portfolios)
-
-    if "wallets" not in row or not isinstance(row["wallets"], dict):
-        row["wallets"] = {}
+        with db.lock:
+            db.write_portfolios([*db.read_portfolios(), row])
 
-    return row
+    # копия строки: изменения попадут в кэш/файл только через _save_portfolio_row
+    wallets = row.get("wallets")
+    return {**row, "wallets": dict(wallets) if isinstance(wallets, dict) else {}}
 
 
 def _save_portfolio_row(db: DatabaseManager, updated_row: dict[str, Any]) -> None:
-    portfolios = db.read_portfolios()
-    if not isinstance(portfolios, list):
-        raise ApiRequestError("portfolios.json поврежден")
-
-    uid = int(updated_row["user_id"])
-    for i, p in enumerate(portfolios):
-        if int(p.get("user_id", -1)) == uid:
-            portfolios[i] = updated_row
-            db.write_portfolios(portfolios)
-            return
-
-    portfolios.append(updated_row)
-    db.write_portfolios(portfolios)
+    with db.lock:
+        portfolios = db.read_portfolios()
+        if not isinstance(portfolios, list):
+            raise ApiRequestError("portfolios.json поврежден")
+
+        portfolios = list(portfolios)
+        uid = int(updated_row["user_id"])
+        for i, p in enumerate(portfolios):
+            if int(p.get("user_id", -1)) == uid:
+                portfolios[i] = updated_row
+                db.write_portfolios(portfolios)
+                return
+
+        portfolios.append(updated_row)
+        db.write_portfolios(portfolios)
 
 
-def _stub_rates_usd() -> dict[str, float]:
-    return {
-        "USD_USD": 1.0,
-        "EUR_USD": 1.0786,
-        "BTC_USD": 59337.21,
-        "RUB_USD": 0.01016,
-        "ETH_USD": 3720.00,
-    }
\ No newline at end of file
+@contextmanager
+def _recorded_trade(
+    action: str, uid: int, cur: str, amount: float, before: float, after: float, base: str
+) -> Iterator[dict[str, Any]]:
+    # баланс уже сохранён: сделка попадает в журнал, даже если курс недоступен
+    rate_info: dict[str, Any] = {}
+    try:
+        yield rate_info
+    finally:
+        get_ledger().record(action, uid, cur, amount, before, after, base, rate_info.get("rate"))
\ No newline at end of file
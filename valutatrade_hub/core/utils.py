@@ -2,8 +2,12 @@ from __future__ import annotations
 
 from datetime import datetime, timezone
 import json
+import os
 from pathlib import Path
-from typing import Any
+import re
+from typing import Any, Callable, Iterable, Iterator
+
+from valutatrade_hub.infra.metrics import STORAGE_SECONDS
 
 
 class StorageError(RuntimeError):
@@ -29,22 +33,162 @@ def ensure_data_files() -> None:
 
 def load_json(path: Path, default: Any) -> Any:
     try:
-        if not path.exists():
-            return default
-        text = path.read_text(encoding="utf-8").strip()
-        if not text:
-            return default
-        return json.loads(text)
+        with STORAGE_SECONDS.time(op="read", file=path.name):
+            if not path.exists():
+                return default
+            text = path.read_text(encoding="utf-8").strip()
+            if not text:
+                return default
+            return json.loads(text)
     except (OSError, json.JSONDecodeError) as e:
         raise StorageError(f"Ошибка чтения JSON: {path}") from e
 
 
+_decoder = json.JSONDecoder()
+_WS = " \t\n\r"
+_NON_WS = re.compile(r"[^ \t\n\r]")
+
+
+def iter_json_array(path: Path, chunk_size: int = 64 * 1024) -> Iterator[Any]:
+    """
+    Элементы JSON-массива из файла по одному, без чтения файла целиком:
+    в памяти — текущий фрагмент и разбираемый элемент. Нет файла или он
+    пуст — пустая последовательность, как load_json(path, default=[]).
+    """
+    try:
+        if not path.exists():
+            return
+        with open(path, encoding="utf-8") as f:
+            buf = ""
+            while not buf:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                buf = chunk.lstrip(_WS)
+            eof = False
+            if buf[0] != "[":
+                raise StorageError(f"Ожидается JSON-массив: {path}")
+            pos, expect_item, first = 1, True, True
+            while True:
+                m = _NON_WS.search(buf, pos)
+                pos = m.start() if m else len(buf)
+                if pos == len(buf):
+                    if eof:
+                        raise StorageError(f"Неожиданный конец JSON: {path}")
+                    chunk = f.read(chunk_size)
+                    eof = not chunk
+                    buf, pos = buf[pos:] + chunk, 0
+                    continue
+                ch = buf[pos]
+                if ch == "]" and (not expect_item or first):
+                    return
+                if not expect_item:
+                    if ch != ",":
+                        raise StorageError(f"Ошибка чтения JSON: {path}")
+                    pos, expect_item = pos + 1, True
+                    continue
+                try:
+                    item, end = _decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    item, end = None, -1
+                m = _NON_WS.search(buf, end) if end >= 0 else None
+                nxt = m.start() if m else len(buf)
+                # разделитель не виден — элемент мог быть обрезан краем буфера
+                # (в том числе число: "2." из "2.5"); дочитываем и разбираем заново
+                if end < 0 or (not eof and (nxt == len(buf) or buf[nxt] not in ",]")):
+                    if eof:
+                        raise StorageError(f"Ошибка чтения JSON: {path}")
+                    chunk = f.read(chunk_size)
+                    eof = not chunk
+                    buf, pos = buf[pos:] + chunk, 0
+                    continue
+                yield item
+                pos, expect_item, first = end, False, False
+                if pos > chunk_size:
+                    buf, pos = buf[pos:], 0
+    except (OSError, UnicodeDecodeError) as e:
+        raise StorageError(f"Ошибка чтения JSON: {path}") from e
+
+
+def find_in_json_array(path: Path, predicate: Callable[[Any], bool]) -> Any | None:
+    """Первый элемент массива, для которого predicate истинен; чтение файла на нём прекращается."""
+    with STORAGE_SECONDS.time(op="find", file=path.name):
+        return next((item for item in iter_json_array(path) if predicate(item)), None)
+
+
 def save_json(path: Path, data: Any) -> None:
     try:
-        path.parent.mkdir(parents=True, exist_ok=True)
-        path.write_text(json.dumps(data, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        with STORAGE_SECONDS.time(op="write", file=path.name):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(
+                json.dumps(data, ensure_ascii=False, indent=2) + "\n", encoding="utf-8"
+            )
+    except OSError as e:
+        raise StorageError(f"Ошибка записи JSON: {path}") from e
+
+
+def _array_item(item: Any) -> str:
+    # элемент массива в том же виде, что и в save_json (indent=2)
+    return "  " + json.dumps(item, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+
+
+def write_json_array(path: Path, items: Iterable[Any]) -> int:
+    """
+    Атомарно записывает массив из итератора (файл как у save_json), не
+    собирая его в памяти: временный файл + os.replace. Возвращает число элементов.
+    """
+    tmp = path.with_name(path.name + ".tmp")
+    count = 0
+    try:
+        with STORAGE_SECONDS.time(op="write", file=path.name):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write("[")
+                for item in items:
+                    f.write(",\n" if count else "\n")
+                    f.write(_array_item(item))
+                    count += 1
+                f.write("\n]\n" if count else "]\n")
+            os.replace(tmp, path)
+    except OSError as e:
+        raise StorageError(f"Ошибка записи JSON: {path}") from e
+    return count
+
+
+def append_json_array(path: Path, items: list[Any]) -> None:
+    """
+    Дописывает элементы в конец JSON-массива на месте: перезаписывается
+    только закрывающая скобка, стоимость не зависит от размера файла.
+    Запись не атомарна (как и save_json): сбой посреди неё портит файл.
+    """
+    if not items:
+        return
+    try:
+        with STORAGE_SECONDS.time(op="append", file=path.name), open(path, "r+b") as f:
+            # читается только хвост (по 4 КиБ от конца), пока в нём не найдутся
+            # закрывающая скобка и конец последнего элемента
+            start = f.seek(0, os.SEEK_END)
+            tail = body = before = b""
+            while start > 0 and not before:
+                end, start = start, max(start - 4096, 0)
+                f.seek(start)
+                tail = f.read(end - start) + tail
+                body = tail.rstrip(b" \t\r\n")
+                before = body[:-1].rstrip(b" \t\r\n")
+            empty = not body
+            if not empty:
+                if not body.endswith(b"]") or not before:
+                    raise StorageError(f"Ожидается JSON-массив: {path}")
+                data = ",\n".join(_array_item(item) for item in items)
+                f.seek(start + len(before))  # сразу после последнего элемента (или "[")
+                f.write(("\n" if before.endswith(b"[") else ",\n").encode() + (data + "\n]\n").encode("utf-8"))
+                f.truncate()
+    except FileNotFoundError:
+        empty = True
     except OSError as e:
         raise StorageError(f"Ошибка записи JSON: {path}") from e
+    if empty:
+        save_json(path, items)  # файла нет или он пуст
 
 
 def now_iso() -> str:
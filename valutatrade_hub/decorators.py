@@ -4,41 +4,79 @@ import functools
 import logging
 from typing import Any, Callable, TypeVar
 
+from valutatrade_hub.infra.metrics import ACTIONS_TOTAL
+from valutatrade_hub.infra.tracing import span
+
 logger = logging.getLogger("valutatrade")
 
 F = TypeVar("F", bound=Callable[..., Any])
 
 
+class _LazyDetails:
+    # repr(result) строится только при фактическом форматировании записи
+    # (в режиме queue — в фоновом потоке, для отброшенных сэмплером — никогда)
+    __slots__ = ("_result",)
+
+    def __init__(self, result: Any) -> None:
+        self._result = result
+
+    def __str__(self) -> str:
+        return f" details={self._result}"
+
+
+def _action_fields(action: str, kwargs: dict[str, Any], result: str) -> dict[str, Any]:
+    return {
+        "action": action,
+        "user_id": kwargs.get("user_id"),
+        "username": kwargs.get("username"),
+        "currency": kwargs.get("currency_code") or kwargs.get("currency"),
+        "amount": kwargs.get("amount"),
+        "base": kwargs.get("base"),
+        "result": result,
+    }
+
+
 def log_action(action: str, verbose: bool = False) -> Callable[[F], F]:
     def decorator(func: F) -> F:
         @functools.wraps(func)
         def wrapper(*args: Any, **kwargs: Any) -> Any:
             # исходя из ТЗ: user_id / username / currency_code / amount / rate / base
             try:
-                result = func(*args, **kwargs)
+                with span(action.lower(), user_id=kwargs.get("user_id")):
+                    result = func(*args, **kwargs)
+                ACTIONS_TOTAL.inc(action=action, result="OK")
+                fields = _action_fields(action, kwargs, "OK")
+                if verbose:
+                    fields["details"] = result
                 logger.info(
                     "%s user_id=%s username=%s currency=%s amount=%s base=%s rate=%s result=OK%s",
                     action,
-                    kwargs.get("user_id"),
-                    kwargs.get("username"),
-                    kwargs.get("currency_code") or kwargs.get("currency"),
-                    kwargs.get("amount"),
-                    kwargs.get("base"),
+                    fields["user_id"],
+                    fields["username"],
+                    fields["currency"],
+                    fields["amount"],
+                    fields["base"],
                     kwargs.get("rate"),
-                    f" details={result}" if verbose else "",
+                    _LazyDetails(result) if verbose else "",
+                    extra={"result": "OK", "action_fields": fields},
                 )
                 return result
             except Exception as e:
+                ACTIONS_TOTAL.inc(action=action, result="ERROR")
+                fields = _action_fields(action, kwargs, "ERROR")
+                fields["error_type"] = type(e).__name__
+                fields["error"] = str(e)
                 logger.info(
                     "%s user_id=%s username=%s currency=%s amount=%s base=%s result=ERROR error_type=%s error=%s",
                     action,
-                    kwargs.get("user_id"),
-                    kwargs.get("username"),
-                    kwargs.get("currency_code") or kwargs.get("currency"),
-                    kwargs.get("amount"),
-                    kwargs.get("base"),
-                    type(e).__name__,
-                    str(e),
+                    fields["user_id"],
+                    fields["username"],
+                    fields["currency"],
+                    fields["amount"],
+                    fields["base"],
+                    fields["error_type"],
+                    fields["error"],
+                    extra={"result": "ERROR", "action_fields": fields},
                 )
                 raise
 
@@ -1,10 +1,22 @@
 from __future__ import annotations
 
+import os
 from pathlib import Path
-from typing import Any
+import threading
+from typing import Any, Callable, Iterable, Iterator
 
-from valutatrade_hub.core.utils import load_json, save_json
+from valutatrade_hub.core.utils import (
+    StorageError,
+    append_json_array,
+    find_in_json_array,
+    iter_json_array,
+    load_json,
+    save_json,
+    write_json_array,
+)
+from valutatrade_hub.infra import rates_binary
 from valutatrade_hub.infra.settings import SettingsLoader
+from valutatrade_hub.infra.tracing import span
 
 
 class DatabaseManager:
@@ -22,21 +34,125 @@ class DatabaseManager:
         self.users_path = data_dir / "users.json"
         self.portfolios_path = data_dir / "portfolios.json"
         self.rates_path = data_dir / "rates.json"
+        self._rates_binary = settings.get("rates_format") == "binary"
+        # блокировка для read-modify-write (register, сохранение портфеля)
+        self.lock = threading.RLock()
+        self._cache_enabled = bool(settings.get("db_cache_enabled", False))
+        # path -> ((st_ino, st_mtime_ns, st_size), разобранный JSON)
+        self._cache: dict[Path, tuple[tuple[int, int, int], Any]] = {}
+
+    def enable_cache(self, enabled: bool = True) -> None:
+        """
+        Тёплый кэш для долгоживущих процессов: файл разбирается заново только
+        если изменился (inode/mtime/size), иначе возвращается тот же объект.
+        Возвращаемые данные считаются неизменяемыми: use cases меняют копии.
+        """
+        self._cache_enabled = enabled
+        self._cache.clear()
+
+    @staticmethod
+    def _stat_key(path: Path) -> tuple[int, int, int] | None:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _read(self, path: Path, default: Any, loader: Callable[[], Any] | None = None) -> Any:
+        load = loader or (lambda: load_json(path, default=default))
+        if not self._cache_enabled:
+            return load()
+        key = self._stat_key(path)
+        cached = self._cache.get(path)
+        if key is not None and cached is not None and cached[0] == key:
+            return cached[1]
+        data = load()
+        if key is not None:
+            self._cache[path] = (key, data)
+        return data
+
+    def _write(self, path: Path, data: Any) -> None:
+        try:
+            save_json(path, data)
+        except Exception:
+            self._cache.pop(path, None)
+            raise
+        if self._cache_enabled:
+            key = self._stat_key(path)
+            if key is not None:
+                self._cache[path] = (key, data)
+
+    def _iter(self, path: Path) -> Iterator[Any]:
+        if not self._cache_enabled:
+            yield from iter_json_array(path)
+            return
+        # тёплый кэш уже разобран целиком: идём по нему
+        data = self._read(path, default=[])
+        if not isinstance(data, list):
+            raise StorageError(f"Ожидается JSON-массив: {path}")
+        yield from data
+
+    def _find(self, path: Path, predicate: Callable[[Any], bool]) -> Any | None:
+        if not self._cache_enabled:
+            return find_in_json_array(path, predicate)
+        return next((item for item in self._iter(path) if predicate(item)), None)
+
+    def iter_users(self) -> Iterator[dict[str, Any]]:
+        """Пользователи по одному, без загрузки users.json целиком (полные проходы, экспорт)."""
+        return self._iter(self.users_path)
+
+    def find_user(self, predicate: Callable[[dict[str, Any]], bool]) -> dict[str, Any] | None:
+        """Первый подходящий пользователь; чтение users.json на нём прекращается."""
+        with span("db.find_user"):
+            return self._find(self.users_path, lambda u: isinstance(u, dict) and predicate(u))
+
+    def iter_portfolios(self) -> Iterator[dict[str, Any]]:
+        return self._iter(self.portfolios_path)
 
     def read_users(self) -> list[dict[str, Any]]:
-        return load_json(self.users_path, default=[])
+        with span("db.read_users"):
+            return self._read(self.users_path, default=[])
 
     def write_users(self, users: list[dict[str, Any]]) -> None:
-        save_json(self.users_path, users)
+        with span("db.write_users"):
+            self._write(self.users_path, users)
 
     def read_portfolios(self) -> list[dict[str, Any]]:
-        return load_json(self.portfolios_path, default=[])
+        with span("db.read_portfolios"):
+            return self._read(self.portfolios_path, default=[])
 
     def write_portfolios(self, portfolios: list[dict[str, Any]]) -> None:
-        save_json(self.portfolios_path, portfolios)
+        with span("db.write_portfolios"):
+            self._write(self.portfolios_path, portfolios)
+
+    # --- пакетная запись (импорт): без чтения и разбора всего файла ---
+    def append_users(self, users: list[dict[str, Any]]) -> None:
+        with span("db.append_users", rows=len(users)):
+            self._cache.pop(self.users_path, None)
+            append_json_array(self.users_path, users)
+
+    def append_portfolios(self, portfolios: list[dict[str, Any]]) -> None:
+        with span("db.append_portfolios", rows=len(portfolios)):
+            self._cache.pop(self.portfolios_path, None)
+            append_json_array(self.portfolios_path, portfolios)
+
+    def rewrite_portfolios(self, portfolios: Iterable[dict[str, Any]]) -> int:
+        """Атомарная перезапись portfolios.json из итератора (обычно поверх iter_portfolios)."""
+        with span("db.rewrite_portfolios"):
+            self._cache.pop(self.portfolios_path, None)
+            return write_json_array(self.portfolios_path, portfolios)
 
     def read_rates(self) -> dict[str, Any]:
+        with span("db.read_rates"):
+            return self._read(self.rates_path, default={}, loader=self._load_rates)
+
+    def _load_rates(self) -> dict[str, Any]:
+        if self._rates_binary:
+            snapshot = rates_binary.load(rates_binary.bin_path_for(self.rates_path), self.rates_path)
+            if snapshot is not None:
+                return snapshot
         return load_json(self.rates_path, default={})
 
     def write_rates(self, rates: dict[str, Any]) -> None:
-        save_json(self.rates_path, rates)
\ No newline at end of file
+        with span("db.write_rates"):
+            self._write(self.rates_path, rates)
\ No newline at end of file
@@ -0,0 +1,330 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+import os
+from pathlib import Path
+import threading
+from time import perf_counter, time
+from typing import Any, Callable, Iterator
+
+# Бакеты по умолчанию (секунды): от 1 мс до 10 с
+_DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, Any]) -> tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help_text, label_names)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}"
+            for k, v in items
+        ]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help_text, label_names)
+        self._values: dict[tuple[str, ...], float] = {}
+        self._function: Callable[[], float | None] | None = None
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def get(self, **labels: Any) -> float | None:
+        with self._lock:
+            return self._values.get(self._key(labels))
+
+    def set_function(self, func: Callable[[], float | None]) -> None:
+        # значение вычисляется только в момент выгрузки (scrape)
+        self._function = func
+
+    def _samples(self) -> list[str]:
+        if self._function is not None:
+            value = self._function()
+            return [] if value is None else [f"{self.name} {_format_value(value)}"]
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}"
+            for k, v in items
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = _DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help_text, label_names)
+        self._buckets = tuple(sorted(buckets))
+        # key -> [counts по бакетам..., sum, count]
+        self._values: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = [0.0] * (len(self._buckets) + 2)
+                self._values[key] = row
+            for i, bound in enumerate(self._buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - started, **labels)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        out: list[str] = []
+        for key, row in items:
+            cumulative = 0.0
+            for bound, cnt in zip(self._buckets, row):
+                cumulative += cnt
+                le = f'le="{_format_value(bound)}"'
+                out.append(
+                    f"{self.name}_bucket{_format_labels(self.label_names, key, le)} "
+                    f"{_format_value(cumulative)}"
+                )
+            inf = 'le="+Inf"'
+            out.append(
+                f"{self.name}_bucket{_format_labels(self.label_names, key, inf)} "
+                f"{_format_value(row[-1])}"
+            )
+            labels = _format_labels(self.label_names, key)
+            out.append(f"{self.name}_sum{labels} {_format_value(row[-2])}")
+            out.append(f"{self.name}_count{labels} {_format_value(row[-1])}")
+        return out
+
+
+class MetricsRegistry:
+    _instance: "MetricsRegistry | None" = None
+
+    def __new__(cls) -> "MetricsRegistry":
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._init_once()
+        return cls._instance
+
+    def _init_once(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> Any:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, label_names: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help_text, label_names))
+
+    def gauge(self, name: str, help_text: str, label_names: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, label_names))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = _DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, help_text, label_names, buckets))
+
+    def render(self) -> str:
+        """Текст в формате Prometheus exposition (text/plain; version=0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+    def write_textfile(self, path: Path) -> None:
+        # атомарная запись для node_exporter textfile collector
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(self.render(), encoding="utf-8")
+        tmp.replace(path)
+
+
+REGISTRY = MetricsRegistry()
+
+FETCH_SECONDS = REGISTRY.histogram(
+    "valutatrade_parser_fetch_seconds",
+    "Длительность запроса к источнику курсов (meta request_ms).",
+    ("source",),
+)
+UPDATES_TOTAL = REGISTRY.counter(
+    "valutatrade_parser_updates_total",
+    "Результаты загрузки курсов по источникам.",
+    ("source", "result"),
+)
+PAIRS_UPDATED = REGISTRY.gauge(
+    "valutatrade_parser_pairs_updated",
+    "Количество пар, обновлённых последним запуском update-rates.",
+)
+LAST_REFRESH = REGISTRY.gauge(
+    "valutatrade_rates_last_refresh_timestamp_seconds",
+    "Unix-время последнего обновления снимка курсов.",
+)
+SOURCE_DEVIATION = REGISTRY.gauge(
+    "valutatrade_parser_source_deviation_ratio",
+    "Наибольшее относительное отклонение котировок источника от сводного курса (последнее обновление).",
+    ("source",),
+)
+QUOTES_REJECTED = REGISTRY.counter(
+    "valutatrade_parser_quotes_rejected_total",
+    "Котировки, отброшенные при сведении источников как выбросы.",
+    ("source",),
+)
+PAIRS_NO_QUORUM = REGISTRY.gauge(
+    "valutatrade_parser_pairs_no_quorum",
+    "Пары, не обновлённые последним запуском из-за отсутствия кворума источников.",
+)
+BREAKER_STATE = REGISTRY.gauge(
+    "valutatrade_parser_breaker_state",
+    "Состояние circuit breaker источника: 0 — closed, 1 — half-open, 2 — open.",
+    ("source",),
+)
+HEDGED_TOTAL = REGISTRY.counter(
+    "valutatrade_parser_hedged_requests_total",
+    "Повторные (hedged) запросы, отправленные после задержки p95.",
+    ("source",),
+)
+RATE_LIMIT_TOKENS = REGISTRY.gauge(
+    "valutatrade_parser_ratelimit_tokens",
+    "Остаток квоты запросов к источнику (токены общего ведра).",
+    ("source",),
+)
+RATE_LIMIT_THROTTLED = REGISTRY.counter(
+    "valutatrade_parser_ratelimit_throttled_total",
+    "Запросы к источнику, отклонённые из-за исчерпанной квоты.",
+    ("source", "priority"),
+)
+SNAPSHOT_AGE = REGISTRY.gauge(
+    "valutatrade_rates_snapshot_age_seconds",
+    "Возраст снимка курсов rates.json в секундах.",
+)
+ACTIONS_TOTAL = REGISTRY.counter(
+    "valutatrade_actions_total",
+    "Доменные операции (@log_action) по результату.",
+    ("action", "result"),
+)
+STORAGE_SECONDS = REGISTRY.histogram(
+    "valutatrade_storage_seconds",
+    "Время чтения/записи JSON-хранилища.",
+    ("op", "file"),
+)
+BULK_ROWS = REGISTRY.counter(
+    "valutatrade_bulk_rows_total",
+    "Строки пакетного импорта/экспорта по результату.",
+    ("op", "result"),
+)
+
+
+def _snapshot_age() -> float | None:
+    value = LAST_REFRESH.get()
+    if value is None:
+        return None
+    return max(time() - value, 0.0)
+
+
+SNAPSHOT_AGE.set_function(_snapshot_age)
+
+
+def serve_metrics(port: int, host: str = "127.0.0.1") -> Any:
+    """Поднимает локальный /metrics в фоновом daemon-потоке."""
+    # импорт здесь: http.server нужен только тем, кто реально отдаёт метрики
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:  # noqa: N802
+            if self.path.split("?", 1)[0] not in {"/", "/metrics"}:
+                self.send_error(404)
+                return
+            body = REGISTRY.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+            return
+
+    server = ThreadingHTTPServer((host, port), _Handler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,174 @@
+"""
+Компактный бинарный снимок курсов (data/rates.bin).
+
+При rates_format = "binary" RatesStorage пишет рядом с rates.json (он
+остаётся для людей и внешних инструментов) файл фиксированной раскладки,
+который загружается одним read (или mmap) без разбора JSON.
+
+Раскладка (little-endian):
+  заголовок   magic, версия раскладки, версия снимка, число пар, число
+              источников, длина таблицы имён, last_refresh, stat rates.json
+  имена       ключи пар, затем источники — utf-8 через "\\n" (id пары —
+              её номер в таблице), выравнивание до 8 байт
+  float64[n]  курсы
+  int64[n]    updated_at, секунды UTC
+  int32[n]    id источника
+
+Метки времени при загрузке отдаются в том же виде, что пишет RatesUpdater
+("...Z"); поля сверх rate/updated_at/source (deviations) есть только в JSON.
+Файл хранит stat (mtime_ns, size) rates.json, после которого записан:
+если JSON изменён в обход RatesStorage, load() возвращает None.
+"""
+
+from __future__ import annotations
+
+from calendar import timegm
+from datetime import datetime, timezone
+import mmap
+import os
+from pathlib import Path
+import struct
+from typing import Any, Mapping
+
+_MAGIC = b"VTRB"
+_LAYOUT = 1
+_HEADER = struct.Struct("<4sIQIIIqqq")  # magic, layout, version, n, sources, names, refresh, mtime, size
+_NO_TIME = -(2**63)
+
+
+def bin_path_for(rates_path: Path) -> Path:
+    return rates_path.with_suffix(".bin")
+
+
+def _to_seconds(value: Any) -> int:
+    if not isinstance(value, str):
+        return _NO_TIME
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return _NO_TIME
+    # как и get_rate, часовой пояс не учитываем: метка хранится «как написана»
+    return timegm(dt.replace(tzinfo=None).timetuple())
+
+
+def _to_iso(seconds: int) -> str | None:
+    if seconds == _NO_TIME:
+        return None
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _source(obj: Mapping[str, Any]) -> str:
+    return str(obj.get("source") or "").replace("\n", " ")
+
+
+def _pad8(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def _source_stat(path: Path) -> tuple[int, int]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return (-1, -1)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def dump(path: Path, snapshot: Mapping[str, Any], source_path: Path) -> None:
+    """Атомарно пишет снимок в path; source_path — уже записанный rates.json."""
+    pairs = snapshot.get("pairs")
+    items = sorted(
+        (key, obj)
+        for key, obj in (pairs.items() if isinstance(pairs, Mapping) else ())
+        if isinstance(obj, Mapping) and isinstance(obj.get("rate"), (int, float)) and "\n" not in key
+    )
+    source_ids: dict[str, int] = {}
+    for _, obj in items:
+        source_ids.setdefault(_source(obj), len(source_ids))
+    names = "\n".join([key for key, _ in items] + list(source_ids)).encode("utf-8")
+    n = len(items)
+    version = snapshot.get("version")
+    mtime_ns, size = _source_stat(source_path)
+
+    buf = bytearray(_HEADER.size + _pad8(len(names)) + n * 20)
+    _HEADER.pack_into(
+        buf,
+        0,
+        _MAGIC,
+        _LAYOUT,
+        version if isinstance(version, int) else 0,
+        n,
+        len(source_ids),
+        len(names),
+        _to_seconds(snapshot.get("last_refresh")),
+        mtime_ns,
+        size,
+    )
+    off = _HEADER.size
+    buf[off : off + len(names)] = names
+    off += _pad8(len(names))
+    struct.pack_into(f"<{n}d", buf, off, *(float(obj["rate"]) for _, obj in items))
+    off += 8 * n
+    struct.pack_into(f"<{n}q", buf, off, *(_to_seconds(obj.get("updated_at")) for _, obj in items))
+    off += 8 * n
+    struct.pack_into(
+        f"<{n}i",
+        buf,
+        off,
+        *(source_ids[_source(obj)] for _, obj in items),
+    )
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(buf)
+    os.replace(tmp, path)
+
+
+def _parse(data: bytes | mmap.mmap, source_path: Path | None) -> dict[str, Any] | None:
+    if len(data) < _HEADER.size:
+        return None
+    magic, layout, version, n, n_sources, names_len, refresh, mtime_ns, size = _HEADER.unpack_from(data, 0)
+    if magic != _MAGIC or layout != _LAYOUT:
+        return None
+    if source_path is not None and (mtime_ns, size) != _source_stat(source_path):
+        return None  # rates.json изменён в обход RatesStorage
+    off = _HEADER.size
+    if len(data) < off + _pad8(names_len) + n * 20:
+        return None
+    names = bytes(data[off : off + names_len]).decode("utf-8").split("\n") if names_len else []
+    if len(names) != n + n_sources:
+        return None
+    off += _pad8(names_len)
+    rates = struct.unpack_from(f"<{n}d", data, off)
+    off += 8 * n
+    times = struct.unpack_from(f"<{n}q", data, off)
+    off += 8 * n
+    sources = struct.unpack_from(f"<{n}i", data, off)
+    source_names = names[n:]
+    # одна строка времени на каждую различную метку (обычно их единицы)
+    iso = {t: _to_iso(t) for t in set(times)}
+    pairs = {
+        key: {"rate": rate, "updated_at": iso[t], "source": source_names[src]}
+        for key, rate, t, src in zip(names[:n], rates, times, sources)
+    }
+    if "" in source_names:
+        for entry in pairs.values():
+            if not entry["source"]:
+                del entry["source"]  # в JSON источник не был указан
+    return {
+        "pairs": pairs,
+        "last_refresh": _to_iso(refresh),
+        "version": version,
+    }
+
+
+def load(path: Path, source_path: Path | None = None, use_mmap: bool = False) -> dict[str, Any] | None:
+    """Снимок из path (одно чтение или mmap); None — файла нет, он повреждён или устарел."""
+    try:
+        with open(path, "rb") as f:
+            if not use_mmap:
+                return _parse(f.read(), source_path)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return _parse(mm, source_path)
+    except (OSError, ValueError, struct.error, UnicodeDecodeError):
+        return None
@@ -18,9 +18,37 @@ class SettingsLoader:
         base_dir = Path(__file__).resolve().parents[2]  # корень проекта
         self._data_dir = base_dir / "data"
         self._rates_ttl_seconds = 300  # 5 минут по ТЗ
+        self._currencies_file = self._data_dir / "currencies.json"
+        # коды, добавленные во время работы (из пар курсов); не в git
+        self._currencies_local_file = self._data_dir / "currencies.local.json"
+        self._ledger_file = self._data_dir / "ledger.jsonl"
+        self._ledger_snapshot_file = self._data_dir / "ledger_snapshot.json"
+        self._ledger_snapshot_every = 1000
+        self._alerts_file = self._data_dir / "alerts.json"
+        self._alerts_outbox_file = self._data_dir / "alerts_outbox.jsonl"
+        self._alerts_journal_file = self._data_dir / "alerts_journal.jsonl"
+        self._orders_file = self._data_dir / "orders.json"
+        self._order_fills_file = self._data_dir / "order_fills.jsonl"
         self._default_base_currency = "USD"
         self._logs_dir = base_dir / "logs"
         self._actions_log = self._logs_dir / "actions.log"
+        self._metrics_port = 9108
+        self._metrics_textfile = self._logs_dir / "metrics.prom"
+        # queue — запись логов фоновым потоком (QueueListener), sync — прямо в вызывающем
+        self._log_mode = "queue"
+        self._log_json = False
+        self._log_success_sample_rate = 1.0
+        self._profiles_dir = self._logs_dir / "profiles"
+        self._tracing_enabled = False
+        self._traces_file = self._logs_dir / "traces.jsonl"
+        self._db_cache_enabled = False
+        # json — только rates.json; binary — ещё и rates.bin (чтение без разбора JSON)
+        self._rates_format = "json"
+        self._service_host = "127.0.0.1"
+        self._service_port = 8765
+        self._service_workers = 8
+        self._session_ttl_seconds = 8 * 3600
+        self._aio_max_workers = 8
 
     def get(self, key: str, default: Any = None) -> Any:
         return getattr(self, f"_{key}", default)
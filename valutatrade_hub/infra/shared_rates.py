@@ -0,0 +1,240 @@
+"""
+Снимок курсов в разделяемой памяти (mmap-файл data/rates.shm).
+
+Процесс, записавший rates.json, публикует те же пары в файл фиксированной
+структуры; остальные процессы отображают его в память и ищут пару бинарным
+поиском прямо по отображению — без чтения и разбора JSON.
+
+Раскладка (little-endian):
+  заголовок  magic, версия раскладки, seq, активный буфер, ёмкость, moved
+  буфер x2   число пар, stat исходного rates.json, last_refresh,
+             записи по возрастанию ключа: pair, source, rate, updated_at
+
+Двойная буферизация + seqlock: писатель заполняет неактивный буфер и
+переключает active, увеличивая seq (нечётный — идёт переключение).
+Читатель запоминает seq, читает запись активного буфера и сверяет seq:
+если он изменился, чтение повторяется. Писатели разных процессов
+сериализуются fcntl.flock. Если пар больше ёмкости, файл пересоздаётся
+крупнее, а в старом выставляется moved — читатели открывают новый.
+
+Буфер хранит stat (mtime_ns, size) rates.json, из которого он построен;
+читатель использует снимок, только если rates.json с тех пор не менялся,
+иначе вызывающий код читает JSON как раньше.
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_left
+import mmap
+import os
+from pathlib import Path
+import struct
+import threading
+from typing import Any, Mapping
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore[assignment]
+
+_MAGIC = b"VTRS"
+_LAYOUT = 1
+_HEADER = struct.Struct("<4sIQIII4x")  # magic, layout, seq, active, capacity, moved
+_SEQ_OFF = 8
+_ACTIVE_OFF = 16
+_MOVED_OFF = 24
+_BUF_HEADER = struct.Struct("<I4xqq24s")  # count, rates.json mtime_ns, size, last_refresh
+_ENTRY = struct.Struct("<16s32sd24s")  # pair, source, rate, updated_at
+_KEY = struct.Struct("<16s")
+_U32 = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+
+_DEFAULT_CAPACITY = 1024
+_READ_RETRIES = 64
+
+
+def _buffer_offset(capacity: int, index: int) -> int:
+    return _HEADER.size + index * (_BUF_HEADER.size + capacity * _ENTRY.size)
+
+
+def _file_size(capacity: int) -> int:
+    return _buffer_offset(capacity, 2)
+
+
+def _text(raw: bytes) -> str:
+    return raw.rstrip(b"\0").decode("utf-8", "replace")
+
+
+def _fit(value: Any, size: int) -> bytes:
+    return str(value or "").encode("utf-8")[:size]
+
+
+def _source_stat(path: Path) -> tuple[int, int]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return (-1, -1)
+    return (st.st_mtime_ns, st.st_size)
+
+
+# --- запись ---
+def publish(path: Path, snapshot: Mapping[str, Any], source_path: Path) -> None:
+    """Публикует пары снимка в mmap-файл path (source_path — записанный rates.json)."""
+    pairs = snapshot.get("pairs")
+    items = sorted(
+        (key.encode("ascii"), obj)
+        for key, obj in (pairs.items() if isinstance(pairs, Mapping) else ())
+        if isinstance(obj, Mapping) and isinstance(obj.get("rate"), (int, float)) and len(key) <= 16
+    )
+    mtime_ns, size = _source_stat(source_path)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lock_path = path.with_name(path.name + ".lock")
+    with open(lock_path, "a+b") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            capacity = _current_capacity(path)
+            if capacity is None or capacity < len(items):
+                capacity = max(_DEFAULT_CAPACITY, 1 << max(len(items) - 1, 0).bit_length())
+                _create(path, capacity)
+            with open(path, "r+b") as f, mmap.mmap(f.fileno(), _file_size(capacity)) as mm:
+                active = _U32.unpack_from(mm, _ACTIVE_OFF)[0]
+                target = 1 - active
+                off = _buffer_offset(capacity, target)
+                _BUF_HEADER.pack_into(
+                    mm, off, len(items), mtime_ns, size, _fit(snapshot.get("last_refresh"), 24)
+                )
+                off += _BUF_HEADER.size
+                for key, obj in items:
+                    _ENTRY.pack_into(
+                        mm,
+                        off,
+                        key,
+                        _fit(obj.get("source"), 32),
+                        float(obj["rate"]),
+                        _fit(obj.get("updated_at"), 24),
+                    )
+                    off += _ENTRY.size
+                seq = _U64.unpack_from(mm, _SEQ_OFF)[0]
+                _U64.pack_into(mm, _SEQ_OFF, seq + 1)  # нечётный: переключение
+                _U32.pack_into(mm, _ACTIVE_OFF, target)
+                _U64.pack_into(mm, _SEQ_OFF, seq + 2)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _current_capacity(path: Path) -> int | None:
+    try:
+        with open(path, "rb") as f:
+            raw = f.read(_HEADER.size)
+    except OSError:
+        return None
+    if len(raw) < _HEADER.size:
+        return None
+    magic, layout, _seq, _active, capacity, _moved = _HEADER.unpack(raw)
+    if magic != _MAGIC or layout != _LAYOUT:
+        return None
+    return capacity
+
+
+def _create(path: Path, capacity: int) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.truncate(_file_size(capacity))
+        f.write(_HEADER.pack(_MAGIC, _LAYOUT, 0, 0, capacity, 0))
+    old = path.exists()
+    if old:
+        # читатели старого файла увидят moved и откроют новый
+        with open(path, "r+b") as f:
+            f.seek(_MOVED_OFF)
+            f.write(_U32.pack(1))
+    os.replace(tmp, path)
+
+
+# --- чтение ---
+class SharedRates:
+    """Читатель снимка: отображение открывается один раз и переиспользуется."""
+
+    def __init__(self, path: Path, source_path: Path) -> None:
+        self.path = path
+        self.source_path = source_path
+        self._mm: mmap.mmap | None = None
+        self._capacity = 0
+        self._lock = threading.Lock()
+
+    def _open(self) -> mmap.mmap | None:
+        if self._mm is not None and _U32.unpack_from(self._mm, _MOVED_OFF)[0] == 0:
+            return self._mm
+        with self._lock:
+            if self._mm is not None:
+                self._mm.close()
+                self._mm = None
+            try:
+                with open(self.path, "rb") as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                return None
+            magic, layout, _seq, _active, capacity, _moved = _HEADER.unpack_from(mm, 0)
+            if magic != _MAGIC or layout != _LAYOUT or len(mm) < _file_size(capacity):
+                mm.close()
+                return None
+            self._mm, self._capacity = mm, capacity
+            return mm
+
+    def lookup(self, pair: str) -> tuple[bool, dict[str, Any] | None]:
+        """
+        (True, запись | None) — снимок актуален, пара найдена или её нет;
+        (False, None) — снимок недоступен или устарел, читать rates.json.
+        """
+        mm = self._open()
+        if mm is None:
+            return False, None
+        key = _KEY.pack(pair.encode("ascii", "replace"))
+        source_stat = _source_stat(self.source_path)
+        for _ in range(_READ_RETRIES):
+            seq = _U64.unpack_from(mm, _SEQ_OFF)[0]
+            if seq & 1:
+                continue
+            off = _buffer_offset(self._capacity, _U32.unpack_from(mm, _ACTIVE_OFF)[0])
+            count, mtime_ns, size, _refresh = _BUF_HEADER.unpack_from(mm, off)
+            base = off + _BUF_HEADER.size
+            count = min(count, self._capacity)
+            # бинарный поиск по ключам прямо в отображении
+            i = bisect_left(
+                range(count), key, key=lambda j: _KEY.unpack_from(mm, base + j * _ENTRY.size)[0]
+            ) if count else 0
+            entry = None
+            if i < count:
+                k, source, rate, updated_at = _ENTRY.unpack_from(mm, base + i * _ENTRY.size)
+                if k == key:
+                    entry = {"rate": rate, "updated_at": _text(updated_at), "source": _text(source)}
+            if _U64.unpack_from(mm, _SEQ_OFF)[0] != seq:
+                continue  # писатель переключил буфер во время чтения
+            if (mtime_ns, size) != source_stat:
+                return False, None  # rates.json изменён в обход публикации
+            return True, entry
+        return False, None
+
+    def version(self) -> int:
+        """Число публикаций (seq / 2); 0 — снимок недоступен."""
+        mm = self._open()
+        return _U64.unpack_from(mm, _SEQ_OFF)[0] // 2 if mm is not None else 0
+
+
+_reader: SharedRates | None = None
+_reader_lock = threading.Lock()
+
+
+def shm_path_for(rates_path: Path) -> Path:
+    return rates_path.with_suffix(".shm")
+
+
+def get_shared_rates(rates_path: Path) -> SharedRates:
+    global _reader
+    if _reader is None or _reader.source_path != rates_path:
+        with _reader_lock:
+            if _reader is None or _reader.source_path != rates_path:
+                _reader = SharedRates(shm_path_for(rates_path), rates_path)
+    return _reader
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+import json
+import os
+from pathlib import Path
+import sys
+import threading
+from time import perf_counter, time
+from typing import Any, Iterator
+
+from valutatrade_hub.infra.settings import SettingsLoader
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "_t0", "attrs")
+
+    def __init__(self, name: str, parent: "Span | None", attrs: dict[str, Any]) -> None:
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(8).hex()
+        self.span_id = os.urandom(4).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.start = time()
+        self._t0 = perf_counter()
+        self.attrs = attrs
+
+    def set(self, key: str, value: Any) -> None:
+        self.attrs[key] = value
+
+
+_current: ContextVar[Span | None] = ContextVar("valutatrade_span", default=None)
+
+
+class Tracer:
+    _instance: "Tracer | None" = None
+
+    def __new__(cls) -> "Tracer":
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._init_once()
+        return cls._instance
+
+    def _init_once(self) -> None:
+        settings = SettingsLoader()
+        self.enabled: bool = bool(settings.get("tracing_enabled", False))
+        self.path: Path = settings.get("traces_file")
+        self._lock = threading.Lock()
+
+    def enable(self, path: Path | None = None) -> None:
+        if path is not None:
+            self.path = path
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def _write(self, record: dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(line)
+
+
+_TRACER = Tracer()
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Span | None]:
+    """
+    Участок трассы. Родитель берётся из contextvars, поэтому вложенные
+    with span(...) образуют дерево. При выключенной трассировке — no-op.
+    """
+    if not _TRACER.enabled:
+        yield None
+        return
+
+    sp = Span(name, _current.get(), attrs)
+    token = _current.set(sp)
+    status = "ok"
+    try:
+        yield sp
+    except BaseException as e:
+        status = "error"
+        sp.attrs["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        _TRACER._write(
+            {
+                "trace_id": sp.trace_id,
+                "span_id": sp.span_id,
+                "parent_id": sp.parent_id,
+                "name": sp.name,
+                "start": sp.start,
+                "duration_ms": round((perf_counter() - sp._t0) * 1000, 3),
+                "status": status,
+                "attrs": sp.attrs,
+            }
+        )
+
+
+def enable_tracing(path: Path | None = None) -> None:
+    _TRACER.enable(path)
+
+
+def disable_tracing() -> None:
+    _TRACER.disable()
+
+
+def tracing_enabled() -> bool:
+    return _TRACER.enabled
+
+
+def load_spans(path: Path) -> list[dict[str, Any]]:
+    if not path.exists():
+        return []
+    spans: list[dict[str, Any]] = []
+    with path.open(encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                spans.append(json.loads(line))
+    return spans
+
+
+def render_waterfall(path: Path, trace_id: str | None = None, width: int = 40) -> str:
+    """Текстовый waterfall одной трассы (по умолчанию — последней записанной)."""
+    spans = load_spans(path)
+    if not spans:
+        return f"Трассы не найдены: {path}"
+    if trace_id is None:
+        trace_id = max(spans, key=lambda s: s["start"])["trace_id"]
+    spans = [s for s in spans if s["trace_id"] == trace_id]
+    if not spans:
+        return f"Трасса {trace_id} не найдена"
+
+    children: dict[str | None, list[dict[str, Any]]] = {}
+    ids = {s["span_id"] for s in spans}
+    for s in spans:
+        parent = s["parent_id"] if s["parent_id"] in ids else None
+        children.setdefault(parent, []).append(s)
+    for lst in children.values():
+        lst.sort(key=lambda s: s["start"])
+
+    t0 = min(s["start"] for s in spans)
+    t_end = max(s["start"] + s["duration_ms"] / 1000 for s in spans)
+    total = max(t_end - t0, 1e-9)
+
+    lines = [f"Трасса {trace_id}: {total * 1000:.1f} мс"]
+
+    def walk(s: dict[str, Any], depth: int) -> None:
+        left = int((s["start"] - t0) / total * width)
+        size = max(int(s["duration_ms"] / 1000 / total * width), 1)
+        bar = " " * left + "█" * min(size, width - left)
+        label = ("  " * depth + s["name"])[:36]
+        mark = " !" if s.get("status") == "error" else ""
+        lines.append(f"{label:<36} |{bar:<{width}}| {s['duration_ms']:>9.1f} мс{mark}")
+        for child in children.get(s["span_id"], []):
+            walk(child, depth + 1)
+
+    for root in children.get(None, []):
+        walk(root, 0)
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # python -m valutatrade_hub.infra.tracing [traces.jsonl] [trace_id]
+    file_arg = Path(sys.argv[1]) if len(sys.argv) > 1 else _TRACER.path
+    print(render_waterfall(file_arg, sys.argv[2] if len(sys.argv) > 2 else None))
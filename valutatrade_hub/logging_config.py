@@ -1,17 +1,120 @@
 from __future__ import annotations
 
+import atexit
+from datetime import datetime, timezone
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import random
+import threading
+from typing import TYPE_CHECKING, Any
 
 from valutatrade_hub.infra.settings import SettingsLoader
 
+if TYPE_CHECKING:
+    from logging.handlers import QueueListener
+
+# logging.handlers (~10 мс на импорт) подгружается только в setup_logging
+_listener: "QueueListener | None" = None
+_bootstrap_lock = threading.Lock()
+
+
+class JsonLineFormatter(logging.Formatter):
+    """Одна запись лога = одна JSON-строка (поля @log_action выносятся на верхний уровень)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        fields = getattr(record, "action_fields", None)
+        if isinstance(fields, dict):
+            payload.update(fields)
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class SuccessSampler(logging.Filter):
+    """Пропускает долю rate успешных операций; ошибки и прочие записи — всегда."""
+
+    def __init__(self, rate: float) -> None:
+        super().__init__()
+        self._rate = min(max(float(rate), 0.0), 1.0)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "result", None) != "OK" or self._rate >= 1.0:
+            return True
+        return random.random() < self._rate
+
+
+def _deferred_prepare(record: logging.LogRecord) -> logging.LogRecord:
+    # Стандартный QueueHandler.prepare форматирует сообщение в вызывающем потоке.
+    # Здесь запись уходит в очередь как есть: msg % args (в т.ч. verbose details)
+    # вычисляет поток QueueListener.
+    return record
+
+
+class _LazyBootstrapHandler(logging.Handler):
+    """Настраивает логирование при первой записи и передаёт её настоящим обработчикам."""
+
+    def __init__(self, **options: Any) -> None:
+        super().__init__(level=logging.INFO)
+        self._options = options
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        logger = logging.getLogger("valutatrade")
+        with _bootstrap_lock:
+            if self in logger.handlers:
+                setup_logging(**self._options)
+        logger.handle(record)
+        return True
+
+    def emit(self, record: logging.LogRecord) -> None:
+        return
+
+
+def install_lazy_logging(**options: Any) -> None:
+    """
+    Откладывает setup_logging (каталог logs/, файл, поток QueueListener)
+    до первой записи в логгер valutatrade: команды без логов его не платят.
+    """
+    logger = logging.getLogger("valutatrade")
+    logger.setLevel(logging.INFO)
+    logger.handlers.clear()
+    logger.addHandler(_LazyBootstrapHandler(**options))
+
+
+def stop_logging() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def setup_logging(
+    mode: str | None = None,
+    json_lines: bool | None = None,
+    success_sample_rate: float | None = None,
+) -> None:
+    from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+    import queue
 
-def setup_logging() -> None:
     settings = SettingsLoader()
+    mode = mode or settings.get("log_mode", "sync")
+    if json_lines is None:
+        json_lines = bool(settings.get("log_json", False))
+    if success_sample_rate is None:
+        success_sample_rate = float(settings.get("log_success_sample_rate", 1.0))
+    if mode not in {"sync", "queue"}:
+        raise ValueError(f"Неизвестный режим логирования: {mode}")
+
     logs_dir = settings.get("logs_dir")
     logs_dir.mkdir(parents=True, exist_ok=True)
     log_path = settings.get("actions_log")
 
+    stop_logging()
     logger = logging.getLogger("valutatrade")
     logger.setLevel(logging.INFO)
     logger.handlers.clear()
@@ -22,6 +125,29 @@ def setup_logging() -> None:
         backupCount=3,
         encoding="utf-8",
     )
-    formatter = logging.Formatter("%(levelname)s %(asctime)s %(message)s")
+    if json_lines:
+        formatter: logging.Formatter = JsonLineFormatter()
+    else:
+        formatter = logging.Formatter("%(levelname)s %(asctime)s %(message)s")
     handler.setFormatter(formatter)
-    logger.addHandler(handler)
\ No newline at end of file
+
+    sampler = SuccessSampler(success_sample_rate)
+
+    if mode == "sync":
+        handler.addFilter(sampler)
+        logger.addHandler(handler)
+        return
+
+    global _listener
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    front = QueueHandler(log_queue)
+    front.prepare = _deferred_prepare  # type: ignore[method-assign]
+    # сэмплирование до постановки в очередь: отброшенная запись ничего не стоит
+    front.addFilter(sampler)
+    logger.addHandler(front)
+
+    _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+
+
+atexit.register(stop_logging)
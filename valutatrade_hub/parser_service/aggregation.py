@@ -0,0 +1,105 @@
+"""
+Сведение котировок нескольких источников в один курс пары.
+
+Когда одну пару сообщают несколько клиентов, курс — медиана (или усечённое
+среднее) котировок. Котировки, отклоняющиеся от медианы больше чем на
+max_deviation, отбрасываются; если осталось меньше quorum источников, пара
+в этом обновлении не меняется. Для каждого источника сохраняется
+относительное отклонение от итогового курса.
+"""
+
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Sequence
+
+# (источник, курс)
+Quote = tuple[str, float]
+
+
+@dataclass(slots=True)
+class Aggregate:
+    rate: float
+    sources: list[str]
+    # источник -> (курс источника / итоговый курс - 1), включая отброшенные
+    deviations: dict[str, float] = field(default_factory=dict)
+    rejected: list[str] = field(default_factory=list)
+
+
+def _median(values: Sequence[float]) -> float:
+    ordered = sorted(values)
+    n = len(ordered)
+    mid = n // 2
+    return ordered[mid] if n % 2 else (ordered[mid - 1] + ordered[mid]) / 2
+
+
+class Aggregator(ABC):
+    def __init__(self, quorum: int = 1, max_deviation: float = 0.05) -> None:
+        if quorum < 1:
+            raise ValueError("quorum должен быть не меньше 1")
+        self.quorum = quorum
+        self.max_deviation = max_deviation
+
+    @abstractmethod
+    def _center(self, values: list[float]) -> float:
+        raise NotImplementedError
+
+    def aggregate(self, quotes: Sequence[Quote]) -> Aggregate | None:
+        """Итоговый курс пары или None, если кворум не набран."""
+        if len(quotes) == 1:
+            # частый случай (пару знает один источник): без сортировок и отбраковки
+            source, rate = quotes[0]
+            if self.quorum > 1:
+                return None
+            return Aggregate(rate=rate, sources=[source], deviations={source: 0.0})
+
+        median = _median([rate for _, rate in quotes])
+        accepted = [
+            (s, r) for s, r in quotes if median > 0 and abs(r / median - 1.0) <= self.max_deviation
+        ]
+        if len(accepted) < self.quorum:
+            return None
+        rate = self._center([r for _, r in accepted])
+        accepted_sources = {s for s, _ in accepted}
+        return Aggregate(
+            rate=rate,
+            sources=[s for s, _ in accepted],
+            deviations={s: r / rate - 1.0 for s, r in quotes},
+            rejected=[s for s, _ in quotes if s not in accepted_sources],
+        )
+
+
+class MedianAggregator(Aggregator):
+    def _center(self, values: list[float]) -> float:
+        return _median(values)
+
+
+class TrimmedMeanAggregator(Aggregator):
+    """Среднее после отбрасывания доли trim с каждого края."""
+
+    def __init__(self, quorum: int = 1, max_deviation: float = 0.05, trim: float = 0.2) -> None:
+        super().__init__(quorum, max_deviation)
+        if not 0 <= trim < 0.5:
+            raise ValueError("trim должен быть в диапазоне [0, 0.5)")
+        self.trim = trim
+
+    def _center(self, values: list[float]) -> float:
+        ordered = sorted(values)
+        k = int(len(ordered) * self.trim)
+        kept = ordered[k : len(ordered) - k] or ordered
+        return sum(kept) / len(kept)
+
+
+AGGREGATORS: dict[str, type[Aggregator]] = {
+    "median": MedianAggregator,
+    "trimmed_mean": TrimmedMeanAggregator,
+}
+
+
+def make_aggregator(name: str, quorum: int = 1, max_deviation: float = 0.05) -> Aggregator:
+    try:
+        cls = AGGREGATORS[name]
+    except KeyError:
+        raise ValueError(f"Неизвестный способ сведения курсов '{name}'") from None
+    return cls(quorum=quorum, max_deviation=max_deviation)
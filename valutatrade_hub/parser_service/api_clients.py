@@ -7,9 +7,22 @@ from typing import Any
 import requests
 
 from valutatrade_hub.core.exceptions import ApiRequestError
+from valutatrade_hub.infra.tracing import span
+from valutatrade_hub.parser_service.ratelimit import TokenBucket
 
 
 class BaseApiClient(ABC):
+    name: str = "Unknown"
+    _limiter: TokenBucket | None = None
+
+    def set_rate_limiter(self, limiter: TokenBucket | None) -> None:
+        self._limiter = limiter
+
+    def _throttle(self) -> None:
+        """Вызывается перед каждым HTTP-запросом: списывает токен общей квоты."""
+        if self._limiter is not None:
+            self._limiter.acquire()
+
     @abstractmethod
     def fetch_rates(self) -> tuple[dict[str, float], dict[str, Any]]:
         """
@@ -21,6 +34,8 @@ class BaseApiClient(ABC):
 
 
 class CoinGeckoClient(BaseApiClient):
+    name = "CoinGecko"
+
     def __init__(self, crypto_id_map: dict[str, str], vs_currency: str, timeout: int = 10) -> None:
         self._crypto_id_map = crypto_id_map
         self._vs = vs_currency.lower()
@@ -31,9 +46,14 @@ class CoinGeckoClient(BaseApiClient):
         url = "https://api.coingecko.com/api/v3/simple/price"
         params = {"ids": ids, "vs_currencies": self._vs}
 
+        self._throttle()
         started = perf_counter()
         try:
-            resp = requests.get(url, params=params, timeout=self._timeout)
+            with span("http.get", url=url) as sp:
+                resp = requests.get(url, params=params, timeout=self._timeout)
+                if sp is not None:
+                    sp.set("status_code", resp.status_code)
+                    sp.set("server_ms", int(resp.elapsed.total_seconds() * 1000))
         except requests.exceptions.RequestException as e:
             raise ApiRequestError(f"CoinGecko: ошибка сети: {e}") from e
         ms = int((perf_counter() - started) * 1000)
@@ -42,7 +62,8 @@ class CoinGeckoClient(BaseApiClient):
             raise ApiRequestError(f"CoinGecko: HTTP {resp.status_code}")
 
         try:
-            payload = resp.json()
+            with span("json.parse", bytes=len(resp.content)):
+                payload = resp.json()
         except ValueError as e:
             raise ApiRequestError("CoinGecko: некорректный JSON") from e
 
@@ -67,6 +88,8 @@ class CoinGeckoClient(BaseApiClient):
 
 
 class ExchangeRateApiClient(BaseApiClient):
+    name = "ExchangeRate-API"
+
     def __init__(self, api_key: str | None, base_currency: str, timeout: int = 10) -> None:
         self._api_key = api_key
         self._base = base_currency.upper()
@@ -78,9 +101,16 @@ class ExchangeRateApiClient(BaseApiClient):
 
         url = f"https://v6.exchangerate-api.com/v6/{self._api_key}/latest/{self._base}"
 
+        self._throttle()
         started = perf_counter()
         try:
-            resp = requests.get(url, timeout=self._timeout)
+            # ключ API — часть пути, поэтому в трассу пишем url без него
+            safe_url = url.replace(self._api_key, "***")
+            with span("http.get", url=safe_url) as sp:
+                resp = requests.get(url, timeout=self._timeout)
+                if sp is not None:
+                    sp.set("status_code", resp.status_code)
+                    sp.set("server_ms", int(resp.elapsed.total_seconds() * 1000))
         except requests.exceptions.RequestException as e:
             raise ApiRequestError(f"ExchangeRate-API: ошибка сети: {e}") from e
         ms = int((perf_counter() - started) * 1000)
@@ -89,7 +119,8 @@ class ExchangeRateApiClient(BaseApiClient):
             raise ApiRequestError(f"ExchangeRate-API: HTTP {resp.status_code}")
 
         try:
-            payload = resp.json()
+            with span("json.parse", bytes=len(resp.content)):
+                payload = resp.json()
         except ValueError as e:
             raise ApiRequestError("ExchangeRate-API: некорректный JSON") from e
 
@@ -20,15 +20,39 @@ class ParserConfig:
 
     RATES_FILE_PATH: str = "data/rates.json"
     HISTORY_FILE_PATH: str = "data/exchange_rates.json"
+    BREAKER_STATE_FILE_PATH: str = "data/circuit_breakers.json"
+    RATE_LIMIT_FILE_PATH: str = "data/ratelimit.json"
 
     REQUEST_TIMEOUT: int = 10
 
+    # circuit breaker: размыкается после BREAKER_FAILURES ошибок подряд,
+    # пробный запрос — через BREAKER_RESET_SECONDS
+    BREAKER_FAILURES: int = 3
+    BREAKER_RESET_SECONDS: int = 60
+    HEDGE_REQUESTS: bool = False  # второй запрос, если ответа нет дольше p95
+
+    # квоты источников: имя клиента -> (ёмкость ведра, запросов в минуту)
+    RATE_LIMITS: dict[str, tuple[float, float]] = None  # set in __post_init__
+    RATE_LIMIT_RESERVE: float = 0.2  # доля квоты только для плановых обновлений
+    RATE_LIMIT_MAX_WAIT: float = 5.0  # дольше ждать токен не имеет смысла — ошибка
+
+    # сведение котировок нескольких источников: median / trimmed_mean
+    AGGREGATION: str = "median"
+    QUORUM: int = 1  # минимум согласных источников для обновления пары
+    MAX_DEVIATION: float = 0.05  # допустимое отклонение котировки от медианы
+
     def __post_init__(self) -> None:
         object.__setattr__(
             self,
             "CRYPTO_ID_MAP",
             {"BTC": "bitcoin", "ETH": "ethereum", "SOL": "solana"},
         )
+        object.__setattr__(
+            self,
+            "RATE_LIMITS",
+            # CoinGecko (free): 30 запросов/мин; ExchangeRate-API (free): 1500 в месяц
+            {"CoinGecko": (10.0, 30.0), "ExchangeRate-API": (5.0, 1500 / (30 * 24 * 60))},
+        )
 
     @property
     def rates_path(self) -> Path:
@@ -36,4 +60,12 @@ class ParserConfig:
 
     @property
     def history_path(self) -> Path:
-        return Path(self.HISTORY_FILE_PATH)
\ No newline at end of file
+        return Path(self.HISTORY_FILE_PATH)
+
+    @property
+    def breaker_state_path(self) -> Path:
+        return Path(self.BREAKER_STATE_FILE_PATH)
+
+    @property
+    def rate_limit_path(self) -> Path:
+        return Path(self.RATE_LIMIT_FILE_PATH)
\ No newline at end of file
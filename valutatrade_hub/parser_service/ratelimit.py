@@ -0,0 +1,153 @@
+"""
+Общий для всех процессов лимит запросов к источникам курсов (token bucket).
+
+Состояние ведра каждого источника (токены и время последнего пополнения)
+хранится в файле под data/; чтение-изменение-запись идёт под fcntl.flock,
+поэтому планировщик, CLI `update-rates` и сервис расходуют одну квоту.
+Без fcntl (Windows) блокировка действует только внутри процесса.
+
+Приоритет задаётся контекстом: плановые обновления (`scheduled`) могут
+тратить всё ведро, остальные запросы — только сверх резерва reserve.
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+import contextvars
+import json
+import os
+from pathlib import Path
+import threading
+from time import sleep, time
+from typing import Iterator
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore[assignment]
+
+from valutatrade_hub.core.exceptions import RateLimitExceededError
+from valutatrade_hub.infra.metrics import RATE_LIMIT_THROTTLED, RATE_LIMIT_TOKENS
+from valutatrade_hub.parser_service.config import ParserConfig
+
+SCHEDULED, INTERACTIVE = "scheduled", "interactive"
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("ratelimit_priority", default=INTERACTIVE)
+
+_thread_lock = threading.Lock()
+
+
+@contextmanager
+def priority(value: str) -> Iterator[None]:
+    """with priority(SCHEDULED): запросы внутри блока идут с приоритетом value."""
+    token = _priority.set(value)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    def __init__(
+        self,
+        name: str,
+        state_path: Path,
+        capacity: float,
+        refill_per_second: float,
+        reserve: float = 0.2,
+        max_wait: float = 5.0,
+    ) -> None:
+        self.name = name
+        self.state_path = state_path
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.reserve = float(reserve)  # доля ведра только для плановых обновлений
+        self.max_wait = float(max_wait)
+
+    @contextmanager
+    def _locked(self) -> Iterator[dict[str, dict[str, float]]]:
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        lock_path = self.state_path.with_name(self.state_path.name + ".lock")
+        with _thread_lock, open(lock_path, "a+b") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                try:
+                    data = json.loads(self.state_path.read_text(encoding="utf-8"))
+                except (OSError, ValueError):
+                    data = {}
+                if not isinstance(data, dict):
+                    data = {}
+                yield data
+                tmp = self.state_path.with_name(self.state_path.name + ".tmp")
+                tmp.write_text(json.dumps(data, indent=2) + "\n", encoding="utf-8")
+                os.replace(tmp, self.state_path)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _take(self, cost: float, floor: float) -> tuple[float, float]:
+        """Списать cost токенов, не опускаясь ниже floor: (ожидание, остаток)."""
+        with self._locked() as data:
+            now = time()
+            entry = data.get(self.name)
+            if not isinstance(entry, dict):
+                entry = {"tokens": self.capacity, "updated": now}
+            elapsed = max(now - float(entry["updated"]), 0.0)
+            tokens = min(self.capacity, float(entry["tokens"]) + elapsed * self.refill_per_second)
+            wait = 0.0
+            if tokens - cost >= floor:
+                tokens -= cost
+            else:
+                deficit = floor + cost - tokens
+                wait = deficit / self.refill_per_second if self.refill_per_second else float("inf")
+            data[self.name] = {"tokens": tokens, "updated": now}
+        return wait, tokens
+
+    def acquire(self, cost: float = 1.0) -> float:
+        """
+        Ждёт токен (не дольше max_wait) и списывает его; возвращает остаток.
+        RateLimitExceededError — если квоты не хватит и за max_wait.
+        """
+        floor = 0.0 if _priority.get() == SCHEDULED else self.capacity * self.reserve
+        deadline = time() + self.max_wait
+        while True:
+            wait, tokens = self._take(cost, floor)
+            RATE_LIMIT_TOKENS.set(tokens, source=self.name)
+            if wait == 0.0:
+                return tokens
+            if time() + wait > deadline:
+                RATE_LIMIT_THROTTLED.inc(source=self.name, priority=_priority.get())
+                raise RateLimitExceededError(
+                    f"{self.name}: исчерпан лимит запросов, следующий возможен через {wait:.0f} с",
+                    retry_after=wait,
+                )
+            sleep(wait)
+
+    def remaining(self) -> float:
+        """Текущий остаток квоты (без списания); обновляет метрику."""
+        try:
+            entry = json.loads(self.state_path.read_text(encoding="utf-8")).get(self.name)
+        except (OSError, ValueError, AttributeError):
+            entry = None
+        tokens = self.capacity
+        if isinstance(entry, dict):
+            elapsed = max(time() - float(entry["updated"]), 0.0)
+            tokens = min(self.capacity, float(entry["tokens"]) + elapsed * self.refill_per_second)
+        RATE_LIMIT_TOKENS.set(tokens, source=self.name)
+        return tokens
+
+def bucket_for(name: str, cfg: ParserConfig) -> TokenBucket | None:
+    """Ведро источника по RATE_LIMITS; None — лимит для источника не задан."""
+    limits = cfg.RATE_LIMITS.get(name)
+    if limits is None:
+        return None
+    capacity, per_minute = limits
+    return TokenBucket(
+        name,
+        cfg.rate_limit_path,
+        capacity=capacity,
+        refill_per_second=per_minute / 60,
+        reserve=cfg.RATE_LIMIT_RESERVE,
+        max_wait=cfg.RATE_LIMIT_MAX_WAIT,
+    )
@@ -0,0 +1,231 @@
+"""
+Устойчивость к сбоям источников курсов: circuit breaker и hedged-запросы.
+
+CircuitBreaker после failure_threshold ошибок подряд размыкает цепь: запросы
+к источнику сразу завершаются ошибкой, не дожидаясь таймаута. Через
+reset_timeout секунд пропускается один пробный запрос (half-open): успех
+замыкает цепь, ошибка снова размыкает. Состояние хранится в файле, поэтому
+переживает перезапуск планировщика и общее для CLI и планировщика.
+
+Hedged-запрос: если ответ не пришёл за p95 последних запросов, параллельно
+отправляется второй, используется первый успешный ответ.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+import contextvars
+import os
+from pathlib import Path
+import threading
+from time import perf_counter, time
+from typing import Any, Callable, Iterator
+
+from valutatrade_hub.core.exceptions import ApiRequestError, RateLimitExceededError
+from valutatrade_hub.core.utils import StorageError, load_json, save_json
+from valutatrade_hub.infra.metrics import BREAKER_STATE, HEDGED_TOTAL
+from valutatrade_hub.parser_service.api_clients import BaseApiClient
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore[assignment]
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+_STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# сколько последних длительностей запросов хранить для p95
+_LATENCY_WINDOW = 50
+
+# состояние всех источников — один файл; read-modify-write под этой блокировкой
+# и flock на <файл>.lock (планировщик и CLI — разные процессы)
+_file_lock = threading.Lock()
+
+FetchResult = tuple[dict[str, float], dict[str, Any]]
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        state_path: Path,
+        failure_threshold: int = 3,
+        reset_timeout: float = 60.0,
+    ) -> None:
+        self.name = name
+        self.state_path = state_path
+        self.failure_threshold = max(int(failure_threshold), 1)
+        self.reset_timeout = float(reset_timeout)
+
+    # --- хранение ---
+    def _load_all(self) -> dict[str, Any]:
+        try:
+            data = load_json(self.state_path, default={})
+        except StorageError:
+            data = {}  # испорченный файл не должен останавливать обновление курсов
+        return data if isinstance(data, dict) else {}
+
+    def _entry(self, data: dict[str, Any]) -> dict[str, Any]:
+        entry = data.get(self.name)
+        state = {"state": CLOSED, "failures": 0, "opened_at": 0.0, "latencies_ms": []}
+        if isinstance(entry, dict):
+            state.update(entry)
+        return state
+
+    def _load(self) -> dict[str, Any]:
+        return self._entry(self._load_all())
+
+    @contextmanager
+    def _locked(self) -> Iterator[dict[str, Any]]:
+        """
+        Состояние источника для перехода: чтение, изменение и запись идут под
+        одним flock, поэтому переходы разных процессов не теряются.
+        """
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        lock_path = self.state_path.with_name(self.state_path.name + ".lock")
+        with _file_lock, open(lock_path, "a+b") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                data = self._load_all()
+                state = self._entry(data)
+                before = dict(state)
+                yield state
+                if state != before:
+                    data[self.name] = state
+                    tmp = self.state_path.with_name(self.state_path.name + ".tmp")
+                    save_json(tmp, data)
+                    os.replace(tmp, self.state_path)
+                    BREAKER_STATE.set(_STATE_CODES[state["state"]], source=self.name)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    # --- переходы ---
+    def allow(self) -> bool:
+        """Можно ли отправить запрос; open -> half_open по истечении reset_timeout."""
+        with self._locked() as state:
+            if state["state"] == CLOSED:
+                return True
+            if time() - float(state["opened_at"]) >= self.reset_timeout:
+                # open -> half_open: один пробный запрос; повисшая проба (процесс
+                # упал) не блокирует источник дольше ещё одного reset_timeout
+                state.update(state=HALF_OPEN, opened_at=time())
+                return True
+            return False
+
+    def retry_in(self) -> float:
+        state = self._load()
+        return max(self.reset_timeout - (time() - float(state["opened_at"])), 0.0)
+
+    def record_success(self, latency_ms: float) -> None:
+        with self._locked() as state:
+            state["latencies_ms"] = [*state["latencies_ms"], round(latency_ms, 1)][-_LATENCY_WINDOW:]
+            state.update(state=CLOSED, failures=0, opened_at=0.0)
+
+    def record_failure(self) -> None:
+        with self._locked() as state:
+            state["failures"] = int(state["failures"]) + 1
+            if state["state"] == HALF_OPEN or state["failures"] >= self.failure_threshold:
+                state.update(state=OPEN, opened_at=time())
+
+    def state(self) -> str:
+        return str(self._load()["state"])
+
+    def p95_ms(self, min_samples: int = 10) -> float | None:
+        samples = sorted(self._load()["latencies_ms"])
+        if len(samples) < min_samples:
+            return None
+        return float(samples[min(int(len(samples) * 0.95), len(samples) - 1)])
+
+
+def hedged_call(fn: Callable[[], FetchResult], delay: float) -> tuple[FetchResult, bool]:
+    """
+    fn(); если за delay секунд ответа нет — второй вызов параллельно.
+    Возвращает (первый успешный результат, был ли отправлен второй запрос).
+    Если оба вызова неудачны, поднимается ошибка первого.
+    """
+    pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hedge")
+
+    def submit() -> Future[FetchResult]:
+        # contextvars (приоритет квоты, текущий span) переносятся в поток
+        return pool.submit(contextvars.copy_context().run, fn)
+
+    try:
+        first = submit()
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result(), False
+        pending: set[Future[FetchResult]] = {first, submit()}
+        error: BaseException | None = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                exc = fut.exception()
+                if exc is None:
+                    return fut.result(), True
+                if error is None or fut is first:
+                    error = exc
+        assert error is not None
+        raise error
+    finally:
+        # не ждём отставший запрос: его ограничивает таймаут HTTP-клиента
+        pool.shutdown(wait=False)
+
+
+class ResilientClient(BaseApiClient):
+    """Обёртка клиента источника: circuit breaker и (опционально) hedged-запросы."""
+
+    def __init__(
+        self,
+        client: BaseApiClient,
+        breaker: CircuitBreaker,
+        hedge: bool = False,
+        hedge_min_samples: int = 10,
+    ) -> None:
+        self.name = client.name
+        self._client = client
+        self._breaker = breaker
+        self._hedge = hedge
+        self._hedge_min_samples = hedge_min_samples
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        return self._breaker
+
+    def fetch_rates(self) -> FetchResult:
+        if not self._breaker.allow():
+            raise ApiRequestError(
+                f"{self.name}: источник временно отключён после серии ошибок "
+                f"(повтор через {self._breaker.retry_in():.0f} с)"
+            )
+        delay_ms = self._breaker.p95_ms(self._hedge_min_samples) if self._hedge else None
+        started = perf_counter()
+        try:
+            if delay_ms is None:
+                result = self._client.fetch_rates()
+            else:
+                result, hedged = hedged_call(self._client.fetch_rates, delay_ms / 1000)
+                if hedged:
+                    HEDGED_TOTAL.inc(source=self.name)
+        except RateLimitExceededError:
+            raise  # запрос не отправлялся: это не сбой источника
+        except Exception:
+            self._breaker.record_failure()
+            raise
+        self._breaker.record_success((perf_counter() - started) * 1000)
+        return result
+
+
+def make_resilient(
+    clients: list[BaseApiClient],
+    state_path: Path,
+    failure_threshold: int = 3,
+    reset_timeout: float = 60.0,
+    hedge: bool = False,
+) -> list[BaseApiClient]:
+    return [
+        ResilientClient(c, CircuitBreaker(c.name, state_path, failure_threshold, reset_timeout), hedge=hedge)
+        for c in clients
+    ]
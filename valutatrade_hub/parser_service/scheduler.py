@@ -1,15 +1,26 @@
 from __future__ import annotations
 
 import logging
+from pathlib import Path
 import time
 
+from valutatrade_hub.infra.metrics import REGISTRY
+from valutatrade_hub.parser_service.ratelimit import SCHEDULED, priority
 from valutatrade_hub.parser_service.updater import RatesUpdater
 
 logger = logging.getLogger("valutatrade")
 
 
-def run_forever(updater: RatesUpdater, interval_seconds: int) -> None:
+def run_forever(
+    updater: RatesUpdater,
+    interval_seconds: int,
+    metrics_textfile: Path | None = None,
+) -> None:
     while True:
-        updater.run_update()
+        # плановое обновление может расходовать резерв квоты источников
+        with priority(SCHEDULED):
+            updater.run_update()
+        if metrics_textfile is not None:
+            REGISTRY.write_textfile(metrics_textfile)
         logger.info("PARSER ОЖИДАЕТ %s секунд...", interval_seconds)
         time.sleep(interval_seconds)
\ No newline at end of file
@@ -1,8 +1,26 @@
 from __future__ import annotations
 
+from contextlib import contextmanager
 import json
+import logging
 from pathlib import Path
-from typing import Any
+import threading
+from typing import Any, Callable, Iterator
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore[assignment]
+
+from valutatrade_hub.infra import rates_binary
+from valutatrade_hub.infra.metrics import STORAGE_SECONDS
+from valutatrade_hub.infra.settings import SettingsLoader
+from valutatrade_hub.infra.shared_rates import publish, shm_path_for
+from valutatrade_hub.infra.tracing import span
+
+logger = logging.getLogger("valutatrade")
+
+_write_lock = threading.Lock()
 
 
 def _atomic_write_json(path: Path, data: Any) -> None:
@@ -12,12 +30,35 @@ def _atomic_write_json(path: Path, data: Any) -> None:
     tmp.replace(path)
 
 
+def _version_of(snapshot: Any) -> int:
+    version = snapshot.get("version") if isinstance(snapshot, dict) else None
+    return version if isinstance(version, int) else 0
+
+
 class RatesStorage:
-    def __init__(self, rates_path: Path, history_path: Path) -> None:
+    def __init__(self, rates_path: Path, history_path: Path, binary: bool | None = None) -> None:
         self._rates_path = rates_path
         self._history_path = history_path
+        if binary is None:
+            binary = SettingsLoader().get("rates_format") == "binary"
+        self._binary = binary
+
+    @property
+    def rates_path(self) -> Path:
+        return self._rates_path
 
-    def read_rates_snapshot(self) -> dict[str, Any]:
+    def read_rates_snapshot(self, complete: bool = False) -> dict[str, Any]:
+        """complete=True — всегда из rates.json, со всеми полями (rates.bin хранит не все)."""
+        with span("storage.read_snapshot"), STORAGE_SECONDS.time(
+            op="read", file=self._rates_path.name
+        ):
+            return self._read_rates_snapshot(complete)
+
+    def _read_rates_snapshot(self, complete: bool = False) -> dict[str, Any]:
+        if self._binary and not complete:
+            snapshot = rates_binary.load(rates_binary.bin_path_for(self._rates_path), self._rates_path)
+            if snapshot is not None:
+                return snapshot
         if not self._rates_path.exists():
             return {"pairs": {}, "last_refresh": None}
         raw = self._rates_path.read_text(encoding="utf-8").strip()
@@ -25,10 +66,74 @@ class RatesStorage:
             return {"pairs": {}, "last_refresh": None}
         return json.loads(raw)
 
+    def snapshot_version(self) -> int:
+        """Версия снимка: растёт на 1 при каждой записи; 0 — снимка ещё не было."""
+        return _version_of(self.read_rates_snapshot())
+
+    @contextmanager
+    def _writer(self) -> Iterator[None]:
+        # писатели разных процессов (планировщик, CLI) не должны выдать одну версию дважды
+        self._rates_path.parent.mkdir(parents=True, exist_ok=True)
+        lock_path = self._rates_path.with_name(self._rates_path.name + ".lock")
+        with _write_lock, open(lock_path, "a+b") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
     def write_rates_snapshot(self, snapshot: dict[str, Any]) -> None:
-        _atomic_write_json(self._rates_path, snapshot)
+        """Записывает снимок; snapshot["version"] выставляется в следующую версию."""
+        with self._writer():
+            try:
+                current = _version_of(self._read_rates_snapshot())
+            except ValueError:
+                current = 0  # испорченный снимок будет перезаписан
+            self._write_locked(snapshot, current)
+
+    def update_snapshot(self, update: Callable[[dict[str, Any]], None]) -> dict[str, Any]:
+        """
+        Чтение-изменение-запись под одним flock: update(snapshot) меняет на
+        месте полный снимок из rates.json, и запись другого процесса между
+        чтением и записью не теряется. Возвращает записанный снимок.
+        """
+        with self._writer():
+            try:
+                snapshot = self._read_rates_snapshot(complete=True)
+            except ValueError:
+                snapshot = None  # испорченный снимок будет перезаписан
+            if not isinstance(snapshot, dict):
+                snapshot = {"pairs": {}, "last_refresh": None}
+            current = _version_of(snapshot)
+            update(snapshot)
+            self._write_locked(snapshot, current)
+        return snapshot
+
+    def _write_locked(self, snapshot: dict[str, Any], current: int) -> None:
+        snapshot["version"] = current + 1
+        with span("storage.write_snapshot", version=snapshot["version"]), STORAGE_SECONDS.time(
+            op="write", file=self._rates_path.name
+        ):
+            _atomic_write_json(self._rates_path, snapshot)
+        if self._binary:
+            with span("storage.write_binary"), STORAGE_SECONDS.time(op="write", file="rates.bin"):
+                rates_binary.dump(rates_binary.bin_path_for(self._rates_path), snapshot, self._rates_path)
+        try:
+            with span("storage.publish_shm"):
+                publish(shm_path_for(self._rates_path), snapshot, self._rates_path)
+        except (OSError, ValueError) as e:
+            # читатели без снимка в памяти просто читают rates.json
+            logger.warning("Не удалось опубликовать снимок курсов в rates.shm: %s", e)
 
     def read_history(self) -> list[dict[str, Any]]:
+        with span("storage.read_history"), STORAGE_SECONDS.time(
+            op="read", file=self._history_path.name
+        ):
+            return self._read_history()
+
+    def _read_history(self) -> list[dict[str, Any]]:
         if not self._history_path.exists():
             return []
         raw = self._history_path.read_text(encoding="utf-8").strip()
@@ -37,10 +142,17 @@ class RatesStorage:
         return json.loads(raw)
 
     def append_history_records(self, records: list[dict[str, Any]]) -> None:
+        with span("storage.append_history", records=len(records)):
+            self._append_history_records(records)
+
+    def _append_history_records(self, records: list[dict[str, Any]]) -> None:
         history = self.read_history()
         # защита от дублей по id
         existing = {r.get("id") for r in history if isinstance(r, dict)}
         for r in records:
             if r.get("id") not in existing:
                 history.append(r)
-        _atomic_write_json(self._history_path, history)
\ No newline at end of file
+        with span("storage.write_history", size=len(history)), STORAGE_SECONDS.time(
+            op="write", file=self._history_path.name
+        ):
+            _atomic_write_json(self._history_path, history)
\ No newline at end of file
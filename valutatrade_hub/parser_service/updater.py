@@ -2,98 +2,215 @@ from __future__ import annotations
 
 from datetime import datetime, timezone
 import logging
-from typing import Any
+from typing import Any, Callable
 
+from valutatrade_hub.core.currencies import get_registry
 from valutatrade_hub.core.exceptions import ApiRequestError
+from valutatrade_hub.infra.metrics import (
+    FETCH_SECONDS,
+    LAST_REFRESH,
+    PAIRS_NO_QUORUM,
+    PAIRS_UPDATED,
+    QUOTES_REJECTED,
+    SOURCE_DEVIATION,
+    UPDATES_TOTAL,
+)
+from valutatrade_hub.infra.tracing import span
+from valutatrade_hub.parser_service.aggregation import Aggregator, Quote, make_aggregator
 from valutatrade_hub.parser_service.api_clients import BaseApiClient
+from valutatrade_hub.parser_service.config import ParserConfig
 from valutatrade_hub.parser_service.storage import RatesStorage
 
 logger = logging.getLogger("valutatrade")
 
+# (rates, meta, текст ошибки или None)
+FetchResult = tuple[dict[str, float], dict[str, Any], str | None]
+# слушатель обновления: {pair: (старый курс, новый)} для изменившихся пар
+RatesListener = Callable[[dict[str, tuple[float, float]]], Any]
+
 
 def _utc_iso_z(dt: datetime) -> str:
     return dt.astimezone(timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")
 
 
 class RatesUpdater:
-    def __init__(self, storage: RatesStorage, clients: list[BaseApiClient]) -> None:
+    def __init__(
+        self,
+        storage: RatesStorage,
+        clients: list[BaseApiClient],
+        listeners: list[RatesListener] | None = None,
+        aggregator: Aggregator | None = None,
+    ) -> None:
         self._storage = storage
         self._clients = clients
+        if aggregator is None:
+            cfg = ParserConfig()
+            aggregator = make_aggregator(cfg.AGGREGATION, cfg.QUORUM, cfg.MAX_DEVIATION)
+        self._aggregator = aggregator
+        self._listeners = list(listeners or [])
+
+    def add_listener(self, listener: RatesListener) -> None:
+        self._listeners.append(listener)
 
     def run_update(self) -> dict[str, Any]:
+        with span("update_rates", clients=len(self._clients)) as sp:
+            result = self._run_update()
+            if sp is not None:
+                sp.set("updated", result["updated"])
+                sp.set("errors", len(result["errors"]))
+            return result
+
+    def _run_update(self) -> dict[str, Any]:
         started = datetime.now(timezone.utc)
-        ts = _utc_iso_z(started)
-
         logger.info("PARSER ОБНОВЛЯЕТ КУРСЫ...")
+        fetched = [self.fetch_one(client) for client in self._clients]
+        return self.commit(fetched, started)
 
-        merged: dict[str, dict[str, Any]] = {} 
-        history_records: list[dict[str, Any]] = []
-        errors: list[str] = []
+    @property
+    def clients(self) -> list[BaseApiClient]:
+        return list(self._clients)
 
-        for client in self._clients:
-            try:
+    def fetch_one(self, client: BaseApiClient) -> FetchResult:
+        """Загрузка одного источника; ошибка возвращается текстом, а не исключением."""
+        try:
+            with span("fetch_rates", source=client.name):
                 rates, meta = client.fetch_rates()
-                source = str(meta.get("source", "Unknown"))
-                logger.info("PARSER ЗАГРУЖАЕТ %s... OK (%s rates)", source, len(rates))
-
-                for pair, rate in rates.items():
-                    if not isinstance(rate, (int, float)):
-                        continue
-
-                    if "_" not in pair:
-                        continue
-                    frm, to = pair.split("_", 1)
-                    frm = frm.upper()
-                    to = to.upper()
-
-                    rec_id = f"{frm}_{to}_{ts}"
-
-                    history_records.append(
-                        {
-                            "id": rec_id,
-                            "from_currency": frm,
-                            "to_currency": to,
-                            "rate": float(rate),
-                            "timestamp": ts,
-                            "source": source,
-                            "meta": meta,
-                        }
-                    )
-
-                    merged[pair] = {"rate": float(rate), "updated_at": ts, "source": source}
-
-            except ApiRequestError as e:
-                msg = str(e)
-                errors.append(msg)
-                logger.error("PARSER НЕ СМОГ ОБНОВИТЬ: %s", msg)
-            except Exception as e:
-                msg = f"Неожиданная ошибка клиента: {type(e).__name__}: {e}"
-                errors.append(msg)
-                logger.error("PARSER %s", msg)
+            source = str(meta.get("source", "Unknown"))
+            if isinstance(meta.get("request_ms"), (int, float)):
+                FETCH_SECONDS.observe(meta["request_ms"] / 1000, source=client.name)
+            UPDATES_TOTAL.inc(source=client.name, result="ok")
+            logger.info("PARSER ЗАГРУЖАЕТ %s... OK (%s rates)", source, len(rates))
+            return rates, meta, None
+
+        except ApiRequestError as e:
+            msg = str(e)
+            UPDATES_TOTAL.inc(source=client.name, result="error")
+            logger.error("PARSER НЕ СМОГ ОБНОВИТЬ: %s", msg)
+        except Exception as e:
+            msg = f"Неожиданная ошибка клиента: {type(e).__name__}: {e}"
+            UPDATES_TOTAL.inc(source=client.name, result="error")
+            logger.error("PARSER %s", msg)
+        return {}, {"source": client.name}, msg
+
+    def commit(self, fetched: list[FetchResult], started: datetime) -> dict[str, Any]:
+        """Сводит результаты источников в историю и снимок rates.json."""
+        ts = _utc_iso_z(started)
 
-        if history_records:
-            self._storage.append_history_records(history_records)
+        quotes: dict[str, list[Quote]] = {}
+        history_records: list[dict[str, Any]] = []
+        errors: list[str] = []
 
-        snapshot = self._storage.read_rates_snapshot()
-        pairs = snapshot.get("pairs")
-        if not isinstance(pairs, dict):
-            pairs = {}
+        for rates, meta, error in fetched:
+            if error is not None:
+                errors.append(error)
+                continue
+            source = str(meta.get("source", "Unknown"))
+
+            for pair, rate in rates.items():
+                if not isinstance(rate, (int, float)):
+                    continue
 
-        for pair, obj in merged.items():
-            current = pairs.get(pair)
-            if isinstance(current, dict) and isinstance(current.get("updated_at"), str):
-                if current["updated_at"] >= obj["updated_at"]:
+                if "_" not in pair:
                     continue
-            pairs[pair] = obj
+                frm, to = pair.split("_", 1)
+                frm = frm.upper()
+                to = to.upper()
+
+                rec_id = f"{frm}_{to}_{ts}"
+
+                history_records.append(
+                    {
+                        "id": rec_id,
+                        "from_currency": frm,
+                        "to_currency": to,
+                        "rate": float(rate),
+                        "timestamp": ts,
+                        "source": source,
+                        "meta": meta,
+                    }
+                )
+
+                quotes.setdefault(f"{frm}_{to}", []).append((source, float(rate)))
 
-        snapshot["pairs"] = pairs
-        snapshot["last_refresh"] = ts
-        self._storage.write_rates_snapshot(snapshot)
+        if history_records:
+            self._storage.append_history_records(history_records)
+
+        with span("aggregate_quotes", pairs=len(quotes)):
+            merged = self._aggregate(quotes, ts)
+
+        changes: dict[str, tuple[float, float]] = {}
+
+        def merge(snapshot: dict[str, Any]) -> None:
+            # из JSON: пары, не обновлённые сейчас, сохраняют deviations
+            pairs = snapshot.get("pairs")
+            if not isinstance(pairs, dict):
+                pairs = {}
+            with span("merge_snapshot", pairs=len(merged)):
+                for pair, obj in merged.items():
+                    current = pairs.get(pair)
+                    if isinstance(current, dict) and isinstance(current.get("updated_at"), str):
+                        if current["updated_at"] >= obj["updated_at"]:
+                            continue
+                    if isinstance(current, dict) and isinstance(current.get("rate"), (int, float)):
+                        if current["rate"] != obj["rate"]:
+                            changes[pair] = (float(current["rate"]), obj["rate"])
+                    pairs[pair] = obj
+            snapshot["pairs"] = pairs
+            snapshot["last_refresh"] = ts
+
+        # чтение и запись под одним flock: параллельное обновление из другого
+        # процесса не затрётся снимком, прочитанным до него
+        self._storage.update_snapshot(merge)
+        # новые коды из ответов провайдеров сразу принимаются get_currency
+        get_registry().extend_from_pairs(merged, ParserConfig.CRYPTO_CURRENCIES)
+        PAIRS_UPDATED.set(len(merged))
+        LAST_REFRESH.set(started.timestamp())
 
         logger.info("PARSER записывает %s курсы в rates.json... ГОТОВО", len(merged))
+        self._notify(changes)
 
         return {
             "updated": len(merged),
             "last_refresh": ts,
             "errors": errors,
-        }
\ No newline at end of file
+        }
+
+    def _aggregate(self, quotes: dict[str, list[Quote]], ts: str) -> dict[str, dict[str, Any]]:
+        """Котировки источников -> записи снимка; пары без кворума пропускаются."""
+        merged: dict[str, dict[str, Any]] = {}
+        worst: dict[str, float] = {}
+        no_quorum: list[str] = []
+        for pair, pair_quotes in quotes.items():
+            agg = self._aggregator.aggregate(pair_quotes)
+            if agg is None:
+                no_quorum.append(pair)
+                continue
+            obj: dict[str, Any] = {"rate": agg.rate, "updated_at": ts, "source": "+".join(agg.sources)}
+            if len(pair_quotes) > 1:
+                obj["deviations"] = {s: round(d, 6) for s, d in agg.deviations.items()}
+                for s in agg.rejected:
+                    QUOTES_REJECTED.inc(source=s)
+            for s, d in agg.deviations.items():
+                worst[s] = max(worst.get(s, 0.0), abs(d))
+            merged[pair] = obj
+
+        for s, d in worst.items():
+            SOURCE_DEVIATION.set(d, source=s)
+        PAIRS_NO_QUORUM.set(len(no_quorum))
+        if no_quorum:
+            logger.warning(
+                "PARSER нет кворума источников (%s) для пар: %s",
+                self._aggregator.quorum,
+                ", ".join(sorted(no_quorum)),
+            )
+        return merged
+
+    def _notify(self, changes: dict[str, tuple[float, float]]) -> None:
+        # снимок уже записан: ошибка слушателя не должна отменять обновление
+        if not changes:
+            return
+        for listener in self._listeners:
+            try:
+                listener(changes)
+            except Exception as e:
+                logger.error("PARSER ошибка слушателя обновления: %s: %s", type(e).__name__, e)
\ No newline at end of file
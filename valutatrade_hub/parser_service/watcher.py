@@ -0,0 +1,147 @@
+"""
+Ожидание обновления снимка курсов для долгоживущих процессов.
+
+RatesWatcher.wait() блокируется, пока rates.json не будет перезаписан с
+новой версией (RatesStorage.write_rates_snapshot), и возвращает новый снимок.
+На Linux ожидание — inotify (через ctypes, без зависимостей) на каталоге
+снимка; в остальных случаях — опрос stat раз в poll_interval секунд.
+Снимок разбирается только когда сменился файл (inode/mtime/size), а
+отдаётся потребителю только если выросла версия: одна перезагрузка на одно
+обновление, даже если событий файловой системы было несколько.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import os
+from pathlib import Path
+import select
+import struct
+import sys
+from time import monotonic, sleep
+from typing import Any, Iterator
+
+from valutatrade_hub.parser_service.storage import RatesStorage
+
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class _Inotify:
+    """Минимальная обёртка inotify: события по именам файлов в одном каталоге."""
+
+    def __init__(self, directory: Path) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        mask = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+        if libc.inotify_add_watch(self._fd, os.fsencode(directory), mask) < 0:
+            err = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(err, "inotify_add_watch")
+
+    def wait(self, timeout: float) -> set[str]:
+        """Имена файлов, по которым пришли события; пусто — истёк timeout."""
+        ready, _, _ = select.select([self._fd], [], [], max(timeout, 0.0))
+        if not ready:
+            return set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        names: set[str] = set()
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            _wd, _mask, _cookie, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            names.add(os.fsdecode(data[offset : offset + length].rstrip(b"\0")))
+            offset += length
+        return names
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class RatesWatcher:
+    def __init__(
+        self,
+        storage: RatesStorage,
+        poll_interval: float = 1.0,
+        use_inotify: bool = True,
+    ) -> None:
+        self._storage = storage
+        self._path = storage.rates_path
+        self._poll_interval = poll_interval
+        self._inotify: _Inotify | None = None
+        if use_inotify and sys.platform.startswith("linux"):
+            try:
+                self._path.parent.mkdir(parents=True, exist_ok=True)
+                self._inotify = _Inotify(self._path.parent)
+            except (OSError, AttributeError):
+                self._inotify = None  # нет inotify (лимит watch, не Linux libc): опрос stat
+        self._stat = self._file_key()
+        self.snapshot: dict[str, Any] = storage.read_rates_snapshot()
+        self.version = self._version(self.snapshot)
+
+    @property
+    def mode(self) -> str:
+        return "inotify" if self._inotify is not None else "poll"
+
+    def _file_key(self) -> tuple[int, int, int] | None:
+        try:
+            st = os.stat(self._path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    @staticmethod
+    def _version(snapshot: dict[str, Any]) -> int:
+        version = snapshot.get("version")
+        return version if isinstance(version, int) else 0
+
+    def _check(self) -> dict[str, Any] | None:
+        key = self._file_key()
+        if key is None or key == self._stat:
+            return None
+        self._stat = key
+        try:
+            snapshot = self._storage.read_rates_snapshot()
+        except ValueError:
+            return None  # файл пишется не атомарно (вручную): дождёмся следующего изменения
+        version = self._version(snapshot)
+        # снимки без версии (записанные в обход RatesStorage) — по смене файла
+        if version > self.version or (version == 0 and self.version == 0):
+            self.snapshot, self.version = snapshot, version
+            return snapshot
+        return None
+
+    def wait(self, timeout: float | None = None) -> dict[str, Any] | None:
+        """Новый снимок или None, если за timeout секунд обновления не было."""
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            snapshot = self._check()
+            if snapshot is not None:
+                return snapshot
+            left = self._poll_interval if deadline is None else deadline - monotonic()
+            if left <= 0:
+                return None
+            if self._inotify is not None:
+                # ждём событие по rates.json; таймаут ограничен на случай пропуска события
+                self._inotify.wait(min(left, 60.0))
+            else:
+                sleep(min(left, self._poll_interval))
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        while True:
+            snapshot = self.wait()
+            if snapshot is not None:
+                yield snapshot
+
+    def close(self) -> None:
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
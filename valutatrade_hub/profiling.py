@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+from collections import Counter
+import cProfile
+from datetime import datetime
+import marshal
+from pathlib import Path
+import sys
+import threading
+from time import perf_counter
+from types import FrameType
+from typing import Any, Callable
+
+# pstats-ключ функции: (filename, lineno, funcname)
+FuncKey = tuple[str, int, str]
+
+_MAX_DEPTH = 64
+
+
+def _label(key: FuncKey) -> str:
+    filename, lineno, func = key
+    if filename == "~":
+        # встроенные функции: ('~', 0, "<built-in method ...>")
+        return func.replace(";", ":")
+    return f"{func} ({Path(filename).name}:{lineno})".replace(";", ":")
+
+
+class SamplingProfiler:
+    """
+    Семплирующий профайлер для долгих команд: фоновый поток раз в interval
+    снимает стек целевого потока. Накладные расходы не зависят от числа вызовов.
+    """
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self._interval = interval
+        self._stacks: Counter[tuple[FuncKey, ...]] = Counter()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._target_ident = 0
+        self._anchor: FrameType | None = None
+
+    def start(self, anchor: FrameType | None = None) -> None:
+        self._target_ident = threading.get_ident()
+        self._anchor = anchor
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self._interval):
+            frame = sys._current_frames().get(self._target_ident)
+            stack: list[FuncKey] = []
+            while frame is not None and frame is not self._anchor:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            if stack:
+                stack.reverse()
+                self._stacks[tuple(stack[-_MAX_DEPTH:])] += 1
+
+    @property
+    def samples(self) -> int:
+        return sum(self._stacks.values())
+
+    def collapsed(self) -> list[str]:
+        return [f"{';'.join(_label(k) for k in stack)} {n}" for stack, n in self._stacks.items()]
+
+    def to_pstats_dict(self) -> dict[FuncKey, tuple[int, int, float, float, dict[FuncKey, Any]]]:
+        """Синтезирует данные в формате marshal-файла pstats (вызовы = число семплов)."""
+        own: Counter[FuncKey] = Counter()
+        total: Counter[FuncKey] = Counter()
+        edges: Counter[tuple[FuncKey, FuncKey]] = Counter()
+        for stack, n in self._stacks.items():
+            own[stack[-1]] += n
+            for key in set(stack):
+                total[key] += n
+            for caller, callee in zip(stack, stack[1:]):
+                edges[(caller, callee)] += n
+
+        callers: dict[FuncKey, dict[FuncKey, tuple[int, int, float, float]]] = {}
+        for (caller, callee), n in edges.items():
+            t = n * self._interval
+            callers.setdefault(callee, {})[caller] = (n, n, t, t)
+
+        return {
+            key: (
+                total[key],
+                total[key],
+                own[key] * self._interval,
+                total[key] * self._interval,
+                callers.get(key, {}),
+            )
+            for key in total
+        }
+
+
+def _collapsed_from_cprofile(stats: dict[FuncKey, Any]) -> list[str]:
+    # cProfile хранит только рёбра caller->callee, поэтому полные стеки
+    # восстанавливаются приближённо: время узла делится по доле cumtime ребра.
+    callees: dict[FuncKey, list[tuple[FuncKey, float]]] = {}
+    for func, (_cc, _nc, _tt, _ct, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+
+    out: Counter[str] = Counter()
+
+    def walk(func: FuncKey, path: list[str], visited: set[FuncKey], share: float) -> None:
+        _cc, _nc, tt, ct, _callers = stats[func]
+        path.append(_label(func))
+        own_us = int(tt * share * 1_000_000)
+        if own_us > 0:
+            out[";".join(path)] += own_us
+        if len(path) < _MAX_DEPTH:
+            for child, edge_ct in callees.get(func, []):
+                child_ct = stats[child][3]
+                if child in visited or child_ct <= 0:
+                    continue
+                visited.add(child)
+                walk(child, path, visited, share * min(edge_ct / child_ct, 1.0))
+                visited.discard(child)
+        path.pop()
+
+    roots = [f for f, v in stats.items() if not v[4]]
+    for root in roots:
+        walk(root, [], {root}, 1.0)
+    return [f"{stack} {n}" for stack, n in out.items()]
+
+
+def _format_top(stats: dict[FuncKey, Any], top: int, total_s: float) -> str:
+    if not stats:
+        return (
+            f"Время выполнения: {total_s * 1000:.1f} мс. "
+            "Семплы не собраны: команда короче интервала, используйте --mode cprofile."
+        )
+    rows = sorted(stats.items(), key=lambda kv: kv[1][2], reverse=True)[:top]
+    lines = [
+        f"Время выполнения: {total_s * 1000:.1f} мс. Топ-{top} по собственному времени:",
+        f"{'вызовы':>10} {'собств., мс':>12} {'кумул., мс':>12}  функция",
+    ]
+    for key, (_cc, nc, tt, ct, _callers) in rows:
+        lines.append(f"{nc:>10} {tt * 1000:>12.2f} {ct * 1000:>12.2f}  {_label(key)}")
+    return "\n".join(lines)
+
+
+def profile_call(
+    func: Callable[[], Any],
+    *,
+    mode: str = "cprofile",
+    out_dir: Path,
+    name: str = "command",
+    top: int = 15,
+    interval: float = 0.005,
+) -> str:
+    """
+    Выполняет func под профайлером, пишет <name>-<время>.pstats (открывается
+    pstats/snakeviz) и .collapsed (flamegraph.pl / speedscope) в out_dir и
+    возвращает текст с топ-N функций.
+    """
+    if mode not in {"cprofile", "sampling"}:
+        raise ValueError(f"Неизвестный режим профилирования: {mode}")
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stem = f"{name}-{datetime.now().strftime('%Y%m%dT%H%M%S')}"
+    pstats_path = out_dir / f"{stem}.pstats"
+    collapsed_path = out_dir / f"{stem}.collapsed"
+
+    started = perf_counter()
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        try:
+            profiler.runcall(func)
+        finally:
+            elapsed = perf_counter() - started
+            profiler.create_stats()
+            raw = profiler.stats  # type: ignore[attr-defined]
+            profiler.dump_stats(pstats_path)
+            collapsed = _collapsed_from_cprofile(raw)
+    else:
+        sampler = SamplingProfiler(interval=interval)
+        sampler.start(anchor=sys._getframe())
+        try:
+            func()
+        finally:
+            sampler.stop()
+            elapsed = perf_counter() - started
+            raw = sampler.to_pstats_dict()
+            if raw:
+                # pstats не умеет загружать пустой профиль
+                pstats_path.write_bytes(marshal.dumps(raw))
+            collapsed = sampler.collapsed()
+
+    collapsed_path.write_text("\n".join(collapsed) + "\n", encoding="utf-8")
+
+    lines = [_format_top(raw, top, elapsed)]
+    if pstats_path.exists():
+        lines.append(f"Профиль: {pstats_path}")
+    lines.append(f"Flamegraph (collapsed): {collapsed_path}")
+    return "\n".join(lines)
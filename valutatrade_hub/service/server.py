@@ -0,0 +1,321 @@
+from __future__ import annotations
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import logging
+import secrets
+import threading
+from time import monotonic
+from typing import Any, Callable
+from urllib.parse import parse_qs, urlsplit
+
+from valutatrade_hub.core import usecases
+from valutatrade_hub.core.currencies import get_registry
+from valutatrade_hub.core.exceptions import (
+    ApiRequestError,
+    AuthError,
+    CurrencyNotFoundError,
+    InsufficientFundsError,
+)
+from valutatrade_hub.infra.database import DatabaseManager
+from valutatrade_hub.infra.settings import SettingsLoader
+from valutatrade_hub.logging_config import setup_logging
+from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.storage import RatesStorage
+from valutatrade_hub.parser_service.watcher import RatesWatcher
+
+logger = logging.getLogger("valutatrade")
+
+
+class ServiceError(Exception):
+    def __init__(self, status: int, message: str) -> None:
+        self.status = status
+        super().__init__(message)
+
+
+class SessionStore:
+    """Токены сессий вместо current_user интерактивного CLI."""
+
+    def __init__(self, ttl_seconds: int) -> None:
+        self._ttl = ttl_seconds
+        self._sessions: dict[str, tuple[dict[str, Any], float]] = {}
+        self._lock = threading.Lock()
+
+    def create(self, user: dict[str, Any]) -> str:
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            self._sessions[token] = (user, monotonic() + self._ttl)
+        return token
+
+    def get(self, token: str) -> dict[str, Any]:
+        with self._lock:
+            item = self._sessions.get(token)
+            if item is None or item[1] < monotonic():
+                self._sessions.pop(token, None)
+                raise ServiceError(401, "Сессия не найдена или истекла, выполните /login")
+            return item[0]
+
+    def drop(self, token: str) -> None:
+        with self._lock:
+            self._sessions.pop(token, None)
+
+
+class UserLocks:
+    """Изменения портфеля одного пользователя выполняются строго по очереди."""
+
+    def __init__(self) -> None:
+        self._locks: dict[int, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def get(self, user_id: int) -> threading.Lock:
+        with self._guard:
+            lock = self._locks.get(user_id)
+            if lock is None:
+                lock = self._locks[user_id] = threading.Lock()
+            return lock
+
+
+class TradingService:
+    def __init__(self, session_ttl: int) -> None:
+        self.sessions = SessionStore(session_ttl)
+        self.user_locks = UserLocks()
+        # тёплое состояние: JSON разбирается только после реального изменения файла
+        DatabaseManager().enable_cache()
+        self.rates_version = 0
+
+    def watch_rates(self) -> None:
+        """Фоновый поток: одна перезагрузка справочника валют на каждую новую версию курсов."""
+        cfg = ParserConfig()
+        watcher = RatesWatcher(RatesStorage(cfg.rates_path, cfg.history_path))
+        self.rates_version = watcher.version
+        logger.info("Слежение за курсами: %s, версия %s", watcher.mode, watcher.version)
+
+        def loop() -> None:
+            for snapshot in watcher:
+                pairs = snapshot.get("pairs")
+                added = 0
+                if isinstance(pairs, dict):
+                    added = get_registry().extend_from_pairs(pairs, cfg.CRYPTO_CURRENCIES)
+                self.rates_version = watcher.version
+                logger.info("Курсы обновлены: версия %s, новых валют %s", watcher.version, added)
+
+        threading.Thread(target=loop, name="rates-watcher", daemon=True).start()
+
+    def _user(self, token: str | None) -> dict[str, Any]:
+        if not token:
+            raise ServiceError(401, "Нужен заголовок Authorization: Bearer <token>")
+        return self.sessions.get(token)
+
+    @staticmethod
+    def _require(body: dict[str, Any], *keys: str) -> list[Any]:
+        missing = [k for k in keys if body.get(k) in (None, "")]
+        if missing:
+            raise ServiceError(400, "Не заданы поля: " + ", ".join(missing))
+        return [body[k] for k in keys]
+
+    @staticmethod
+    def _amount(value: Any) -> float:
+        try:
+            return float(value)
+        except (TypeError, ValueError) as e:
+            raise ServiceError(400, "Сумма должна быть положительным числом") from e
+
+    def register(self, body: dict[str, Any], token: str | None) -> dict[str, Any]:
+        username, password = self._require(body, "username", "password")
+        return {"message": usecases.register(username=username, password=password)}
+
+    def login(self, body: dict[str, Any], token: str | None) -> dict[str, Any]:
+        username, password = self._require(body, "username", "password")
+        user = usecases.login(username=username, password=password)
+        info = {"user_id": user.user_id, "username": user.username}
+        return {**info, "token": self.sessions.create(info)}
+
+    def logout(self, body: dict[str, Any], token: str | None) -> dict[str, Any]:
+        self._user(token)
+        self.sessions.drop(token or "")
+        return {"message": "Сессия завершена"}
+
+    def buy(self, body: dict[str, Any], token: str | None) -> dict[str, Any]:
+        user = self._user(token)
+        currency, amount = self._require(body, "currency", "amount")
+        with self.user_locks.get(user["user_id"]):
+            return usecases.buy(
+                user_id=user["user_id"],
+                currency_code=currency,
+                amount=self._amount(amount),
+                base=body.get("base", "USD"),
+            )
+
+    def sell(self, body: dict[str, Any], token: str | None) -> dict[str, Any]:
+        user = self._user(token)
+        currency, amount = self._require(body, "currency", "amount")
+        with self.user_locks.get(user["user_id"]):
+            return usecases.sell(
+                user_id=user["user_id"],
+                currency_code=currency,
+                amount=self._amount(amount),
+                base=body.get("base", "USD"),
+            )
+
+    def portfolio(self, body: dict[str, Any], token: str | None) -> dict[str, Any]:
+        user = self._user(token)
+        return usecases.show_portfolio(user_id=user["user_id"], base=body.get("base", "USD"))
+
+    def rate(self, body: dict[str, Any], token: str | None) -> dict[str, Any]:
+        frm, to = self._require(body, "from", "to")
+        return usecases.get_rate(frm, to)
+
+    def rates_version_info(self, body: dict[str, Any], token: str | None) -> dict[str, Any]:
+        return {"version": self.rates_version}
+
+    def routes(self) -> dict[tuple[str, str], Callable[[dict[str, Any], str | None], Any]]:
+        return {
+            ("POST", "/register"): self.register,
+            ("POST", "/login"): self.login,
+            ("POST", "/logout"): self.logout,
+            ("POST", "/buy"): self.buy,
+            ("POST", "/sell"): self.sell,
+            ("GET", "/portfolio"): self.portfolio,
+            ("GET", "/rate"): self.rate,
+            ("GET", "/rates/version"): self.rates_version_info,
+        }
+
+
+# доменные ошибки -> HTTP-статус
+_ERROR_STATUS: tuple[tuple[type[Exception], int], ...] = (
+    (AuthError, 401),
+    (CurrencyNotFoundError, 404),
+    (InsufficientFundsError, 409),
+    (ApiRequestError, 503),
+    (ValueError, 400),
+)
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTPServer, обрабатывающий соединения фиксированным пулом потоков."""
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], handler: type, workers: int) -> None:
+        super().__init__(address, handler)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="svc")
+
+    def process_request(self, request: Any, client_address: Any) -> None:
+        self._pool.submit(self._process, request, client_address)
+
+    def _process(self, request: Any, client_address: Any) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self._pool.shutdown(wait=True)
+
+
+def make_handler(service: TradingService) -> type[BaseHTTPRequestHandler]:
+    routes = service.routes()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # keep-alive соединение занимает воркер пула: простаивающие закрываем
+        timeout = 15
+
+        def _reply(self, status: int, payload: Any, close: bool = False) -> None:
+            body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            if close:
+                self.send_header("Connection", "close")
+                self.close_connection = True
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _handle(self, method: str) -> None:
+            # тело читаем до любого ответа: иначе на keep-alive соединении
+            # его остаток будет разобран как следующий запрос
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                if length < 0:
+                    raise ValueError(length)
+            except ValueError:
+                # границы тела неизвестны — соединение дальше не используем
+                message = "Некорректный Content-Length"
+                self._reply(400, {"error": {"type": "BadRequest", "message": message}}, close=True)
+                return
+            raw = self.rfile.read(length) if length else b""
+
+            parts = urlsplit(self.path)
+            route = routes.get((method, parts.path))
+            if route is None:
+                self._reply(404, {"error": {"type": "NotFound", "message": parts.path}})
+                return
+
+            body: dict[str, Any] = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+            if raw:
+                try:
+                    payload = json.loads(raw)
+                except ValueError:
+                    self._reply(400, {"error": {"type": "BadRequest", "message": "Некорректный JSON"}})
+                    return
+                if isinstance(payload, dict):
+                    body.update(payload)
+
+            auth = self.headers.get("Authorization", "")
+            token = auth[7:].strip() if auth.lower().startswith("bearer ") else None
+
+            try:
+                self._reply(200, route(body, token))
+            except ServiceError as e:
+                self._reply(e.status, {"error": {"type": "ServiceError", "message": str(e)}})
+            except Exception as e:
+                status = next((s for t, s in _ERROR_STATUS if isinstance(e, t)), 500)
+                if status == 500:
+                    logger.exception("SERVICE внутренняя ошибка %s %s", method, parts.path)
+                self._reply(status, {"error": {"type": type(e).__name__, "message": str(e)}})
+
+        def do_GET(self) -> None:  # noqa: N802
+            self._handle("GET")
+
+        def do_POST(self) -> None:  # noqa: N802
+            self._handle("POST")
+
+        def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+            return
+
+    return Handler
+
+
+def create_server(host: str, port: int, workers: int, session_ttl: int) -> PooledHTTPServer:
+    service = TradingService(session_ttl)
+    service.watch_rates()
+    return PooledHTTPServer((host, port), make_handler(service), workers)
+
+
+def main(argv: list[str] | None = None) -> None:
+    settings = SettingsLoader()
+    parser = argparse.ArgumentParser(prog="serve", description="ValutaTrade Hub: HTTP/JSON API")
+    parser.add_argument("--host", default=settings.get("service_host"))
+    parser.add_argument("--port", type=int, default=settings.get("service_port"))
+    parser.add_argument("--workers", type=int, default=settings.get("service_workers"))
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    server = create_server(args.host, args.port, args.workers, settings.get("session_ttl_seconds"))
+    print(f"ValutaTrade Hub API: http://{args.host}:{args.port} (воркеров: {args.workers})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nОстановка.")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()